@@ -0,0 +1,490 @@
+"""
+Lego benchmarks measure the hot paths of Lego on a local, hermetic lab.
+The lab is made of a LegoManager and several RPyC classic servers, all of them started as
+subprocesses on the loopback interface, so no docker-compose lab is needed.
+
+The results are written as JSON, in order to compare them across commits and catch regressions.
+
+Usage example:
+    python -m Octavius.benchmarks.lego_benchmarks --output new.json
+    python -m Octavius.benchmarks.lego_benchmarks --output new.json --compare baseline.json
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from types import TracebackType
+import argparse
+import itertools
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import rpyc
+
+from Octavius.lego.components import RPyCComponent
+from Octavius.lego.connections import RPyCConnection
+
+HOST = '127.0.0.1'
+STARTUP_TIMEOUT = 10.0
+
+# Equivalent to running 'rpyc_classic.py --mode threaded', without depending on its location.
+_CLASSIC_SERVER_CODE = (
+    'import sys;'
+    'from rpyc.core import SlaveService;'
+    'from rpyc.utils.server import ThreadedServer;'
+    'ThreadedServer(SlaveService, hostname=sys.argv[1], port=int(sys.argv[2]), '
+    'reuse_addr=True).start()'
+)
+
+BenchmarkResult = Dict[str, Any]
+
+
+def _free_port() -> int:
+    """Finds a free TCP port on the loopback interface."""
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, process: subprocess.Popen, timeout: float = STARTUP_TIMEOUT) -> None:
+    """Waits until a server process listens on the given port.
+
+    Args:
+        port: The port the server should listen on.
+        process: The server process.
+        timeout (optional): Seconds to wait for the server. Defaults to STARTUP_TIMEOUT.
+
+    Raises:
+        RuntimeError: If the server died or didn't start listening in time.
+    """
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server process {process.args!r} exited with {process.returncode}')
+        try:
+            socket.create_connection((HOST, port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+    raise RuntimeError(f'Server process {process.args!r} is not listening on port {port}')
+
+
+def _summarize(samples: List[float], elapsed: Optional[float] = None) -> BenchmarkResult:
+    """Summarizes latency samples.
+
+    Args:
+        samples: Latencies in seconds.
+        elapsed (optional): Wall time of the whole run, used for throughput. Defaults to the
+                            sum of the samples.
+
+    Returns:
+        Latency statistics (in seconds) and throughput (in operations per second).
+    """
+
+    ordered = sorted(samples)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    elapsed = sum(samples) if elapsed is None else elapsed
+    return {
+        'samples': len(samples),
+        'mean': statistics.mean(ordered),
+        'stdev': statistics.pstdev(ordered),
+        'min': ordered[0],
+        'p50': percentile(0.50),
+        'p90': percentile(0.90),
+        'p99': percentile(0.99),
+        'max': ordered[-1],
+        'ops_per_sec': len(samples) / elapsed if elapsed else 0.0,
+    }
+
+
+def _timed(operation: Callable[[], Any], iterations: int) -> List[float]:
+    """Runs an operation several times and measures each run.
+
+    Args:
+        operation: The operation to measure.
+        iterations: Number of runs.
+
+    Returns:
+        The latency of each run in seconds.
+    """
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - start)
+
+    return samples
+
+
+class LocalLab:
+    """A hermetic Lego lab running on the loopback interface.
+
+    Attributes:
+        manager_port: The port of the LegoManager.
+        component_ports: RPyC classic servers ports, by component name.
+    """
+
+    manager_port: int
+    component_ports: Dict[str, int]
+
+    def __init__(self, components_count: int, journal_directory: Optional[str] = None) -> None:
+        """Initiates the lab description, the processes start at the entry to the context.
+
+        Args:
+            components_count: Number of RPyC classic servers to start.
+            journal_directory (optional): Directory of the manager's allocations journal.
+                                          Defaults to None, for a manager without a journal.
+        """
+
+        self.manager_port = _free_port()
+        self._journal_arguments = [] if journal_directory is None else [
+            '--journal', journal_directory]
+        self.component_ports = {f'zebra.bench{index}': _free_port()
+                                for index in range(components_count)}
+        self._processes: List[subprocess.Popen] = []
+
+    def _start(self, *args: str, port: int) -> None:
+        """Starts a python server subprocess and waits for it to listen.
+
+        Args:
+            args: Arguments of the python interpreter.
+            port: The port the server should listen on.
+        """
+
+        # The servers should import the same packages as we do.
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        process = subprocess.Popen(
+            [sys.executable, *args], env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._processes.append(process)
+        _wait_for_port(port, process)
+
+    def __enter__(self) -> LocalLab:
+        """Starts the lab processes.
+
+        Returns:
+            Created class instance.
+        """
+
+        try:
+            self._start('-m', 'Octavius.lego_manager.lego_manager',
+                        '--host', HOST, '--port', str(self.manager_port),
+                        *self._journal_arguments, port=self.manager_port)
+            for port in self.component_ports.values():
+                self._start('-c', _CLASSIC_SERVER_CODE, HOST, str(port), port=port)
+        except BaseException:
+            self.close()
+            raise
+
+        return self
+
+    def __exit__(
+            self,
+            exc_type: Optional[type],
+            exc_value: Optional[BaseException],
+            traceback: Optional[TracebackType]) -> None:
+        """Stops the lab processes at the exit from the context manager.
+
+        Args:
+            exc_type: Exception type.
+            exc_value: Exception value.
+            traceback: Exception traceback.
+        """
+        self.close()
+
+    def close(self) -> None:
+        """Kills all of the lab processes."""
+
+        for process in self._processes:
+            process.kill()
+            process.wait()
+        self._processes.clear()
+
+    def connect_manager(self) -> rpyc.Connection:
+        """Connects to the LegoManager, the same way the lego plugin does."""
+
+        return rpyc.connect(HOST, self.manager_port)
+
+
+def bench_acquire_release(lab: LocalLab, clients: int, iterations: int) -> BenchmarkResult:
+    """Measures acquire and release of a setup under concurrent clients.
+
+    Every client has its own manager connection, and the clients are spread across the lab
+    components. With at least as many components as clients, every client acquires its own
+    component, so the clients measure the manager overhead and not the contention on the setup.
+
+    Args:
+        lab: The running lab.
+        clients: Number of concurrent clients.
+        iterations: Number of acquisitions of every client.
+
+    Returns:
+        Latency of a full acquire and release cycle, and total throughput.
+    """
+
+    connections = [lab.connect_manager() for _ in range(clients)]
+    components = list(lab.component_ports)
+    samples: List[float] = []
+    samples_lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def client(index: int) -> None:
+        acquire_setup = connections[index].root.acquire_setup
+        query = components[index % len(components)]
+
+        def acquire_and_release() -> None:
+            with acquire_setup(query, True):
+                pass
+
+        barrier.wait()
+        client_samples = _timed(acquire_and_release, iterations)
+        with samples_lock:
+            samples.extend(client_samples)
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    for connection in connections:
+        connection.close()
+
+    return _summarize(samples, elapsed)
+
+
+def bench_connect(lab: LocalLab, iterations: int) -> BenchmarkResult:
+    """Measures creation and closing of a component, over the classic servers in turn.
+
+    Args:
+        lab: The running lab.
+        iterations: Number of connections.
+
+    Returns:
+        Connection latency.
+    """
+
+    ports = itertools.cycle(lab.component_ports.values())
+
+    def connect() -> None:
+        with RPyCComponent(HOST, port=next(ports)):
+            pass
+
+    return _summarize(_timed(connect, iterations))
+
+
+def bench_zero_deploy(hostname: str, username: str, password: str,
+                      iterations: int) -> BenchmarkResult:
+    """Measures connection which deploys RPyC SlaveService over SSH.
+
+    Args:
+        hostname: SSH server to deploy on.
+        username: Username for SSH login.
+        password: Password for SSH login.
+        iterations: Number of deployments.
+
+    Returns:
+        Deployment latency.
+    """
+
+    def deploy() -> None:
+        # Nothing listens on the free port, so the connection falls back to zero deploy.
+        with RPyCConnection(hostname, username, password, port=_free_port()):
+            pass
+
+    return _summarize(_timed(deploy, iterations))
+
+
+def bench_run_command(component: RPyCComponent, iterations: int) -> BenchmarkResult:
+    """Measures the round trip of running a shell command on the component.
+
+    Args:
+        component: RPyC component to run the command on.
+        iterations: Number of commands.
+
+    Returns:
+        Command latency.
+    """
+
+    return _summarize(_timed(lambda: component.run_command('true'), iterations))
+
+
+def bench_remote_loop(component: RPyCComponent, iterations: int) -> BenchmarkResult:
+    """Measures a remote UDP echo loop, driven packet by packet through netrefs.
+
+    This is the access pattern of Zebra.send_and_receive: every socket operation is a round
+    trip to the component.
+
+    Args:
+        component: RPyC component to run the loop on.
+        iterations: Number of echoed packets.
+
+    Returns:
+        Latency of a single echoed packet.
+    """
+
+    payload = b'Octavius is great'
+    r_echo = component.get_remote_socket(socket.AF_INET, socket.SOCK_DGRAM)
+    r_sender = component.get_remote_socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        r_echo.bind((HOST, 0))
+        echo_address = r_echo.getsockname()
+
+        def echo() -> None:
+            r_sender.sendto(payload, echo_address)
+            data, address = r_echo.recvfrom(len(payload))
+            r_echo.sendto(data, address)
+            assert r_sender.recv(len(payload)) == payload
+
+        return _summarize(_timed(echo, iterations))
+    finally:
+        r_echo.close()
+        r_sender.close()
+
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, BenchmarkResult]:
+    """Starts a local lab and runs all of the benchmarks on it.
+
+    Args:
+        args: Parsed command line arguments.
+
+    Returns:
+        The results of every benchmark by its name.
+    """
+
+    results = {}
+    # By default every client has its own component.
+    components = max(args.clients) if args.components is None else args.components
+    with LocalLab(components, args.journal) as lab:
+        for clients in args.clients:
+            results[f'acquire_release[clients={clients}]'] = bench_acquire_release(
+                lab, clients, args.iterations)
+
+        results['connect'] = bench_connect(lab, args.iterations)
+
+        with RPyCComponent(HOST, port=next(iter(lab.component_ports.values()))) as component:
+            results['run_command'] = bench_run_command(component, args.iterations)
+            results['remote_loop'] = bench_remote_loop(component, args.iterations)
+
+    if args.ssh_host is not None:
+        results['zero_deploy'] = bench_zero_deploy(
+            args.ssh_host, args.ssh_username, args.ssh_password, args.deploy_iterations)
+
+    return results
+
+
+def _metadata() -> Dict[str, Any]:
+    """Describes the environment the benchmarks ran in."""
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+            universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'rpyc': rpyc.__version__,
+        'platform': platform.platform(),
+    }
+
+
+def compare(
+        results: Dict[str, BenchmarkResult],
+        baseline: Dict[str, BenchmarkResult],
+        threshold: float
+) -> List[str]:
+    """Finds benchmarks that regressed relatively to a baseline.
+
+    Args:
+        results: The new results.
+        baseline: The results to compare with.
+        threshold: Allowed relative growth of the median latency, e.g. 0.2 for 20%.
+
+    Returns:
+        Description of every regression.
+    """
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['p50'], result['p50']
+        if old and (new - old) / old > threshold:
+            regressions.append(f'{name}: p50 {old * 1e3:.3f}ms -> {new * 1e3:.3f}ms')
+
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Runs the benchmarks.
+
+    Args:
+        argv (optional): Command line arguments. Defaults to sys.argv.
+
+    Returns:
+        Exit code, non zero if regressions were found.
+    """
+
+    parser = argparse.ArgumentParser(description='Lego hot paths benchmarks.')
+    parser.add_argument('--output', help='Path of the JSON results. Defaults to stdout.')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='Path of previous JSON results to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed relative regression of the median latency.')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--components', type=int, default=None,
+                        help='Number of components (RPyC classic servers) in the lab, the clients '
+                             'are spread across them. Defaults to the maximal number of clients.')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16],
+                        help='Numbers of concurrent clients of the manager.')
+    parser.add_argument('--journal', metavar='DIRECTORY',
+                        help="Directory of the manager's allocations journal.")
+    parser.add_argument('--ssh-host', help='SSH host for the zero deploy benchmark.')
+    parser.add_argument('--ssh-username', default='root')
+    parser.add_argument('--ssh-password', default='password')
+    parser.add_argument('--deploy-iterations', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    report = {'meta': _metadata(), 'benchmarks': run_benchmarks(args)}
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+
+    if args.compare is None:
+        return 0
+
+    with open(args.compare, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)['benchmarks']
+    regressions = compare(report['benchmarks'], baseline, args.threshold)
+    for regression in regressions:
+        print(f'Regression: {regression}', file=sys.stderr)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,6 +10,10 @@ from Octavius.lego.components import RPyCComponent
 class Giraffe(RPyCComponent):
     """An extended interface for Giraffe component."""
 
+    SIGNATURE_COMMANDS = ('ncat --version', 'pip show watchdog')
+    ARTIFACT_FILES = ('log.txt',)
+    ARTIFACT_COMMANDS = ('ps aux',)
+
     @contextlib.contextmanager
     def monitor_logs(
             self,
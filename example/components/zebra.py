@@ -10,6 +10,9 @@ from Octavius.lego.components import RPyCComponent
 class Zebra(RPyCComponent):
     """An extended interface for Zebra component."""
 
+    SIGNATURE_COMMANDS = ('pip show scapy',)
+    ARTIFACT_COMMANDS = ('ip addr', 'ip route')
+
     async def send_and_receive(
             self,
             dst_ip: ipaddress.IPv4Address,
@@ -2,10 +2,13 @@
 Tetanus is a top secret echo server. It listens for UDP packets in a given port and
 then it sends them back.
 This module is a library for Tetanus functionality.
+The echo server is installed through the install cache of the giraffe, so tests which use the
+same version on the same port reuse the running server.
 """
-import subprocess
+import signal
 
 from Octavius.example.components.giraffe import Giraffe
+from Octavius.lego.supervisor import ProcessHandle
 
 # Final version of Tetanus.
 TOOL = 'ncat -l {} --keep-open --udp --exec "/bin/cat"'
@@ -19,13 +22,19 @@ VERSION_TO_TOOL = {
     2: BUGGY_LOGS_TOOL,
     3: TOOL
 }
+# The name of the tool in the install cache of the giraffe.
+INSTALL_NAME = 'tetanus'
 
 
 class Tetanus:
     """Library for Tetanus functionality."""
 
-    def __init__(self) -> None:
-        self._tool_process: subprocess.Popen
+    @staticmethod
+    def _stop(tool_process: ProcessHandle) -> None:
+        """Stops the echo server."""
+
+        tool_process.kill(signal.SIGINT)
+        tool_process.wait()
 
     def install(
             self,
@@ -33,7 +42,7 @@ class Tetanus:
             version: int,
             port: int
     ) -> None:
-        """Installs an echo server.
+        """Installs an echo server, unless the same version already echoes on the same port.
 
         Args:
             giraffe: Component API to install on.
@@ -41,12 +50,11 @@ class Tetanus:
             port: Port to echo on.
         """
 
-        r_popen = giraffe.connection.modules['subprocess'].Popen
         tool = VERSION_TO_TOOL[version]
-        self._tool_process = r_popen(
-            tool.format(port),
-            shell=True,
-            preexec_fn=giraffe.connection.modules.os.setsid)
+        giraffe.installs.ensure(
+            INSTALL_NAME, version, lambda: giraffe.supervisor.start(tool.format(port)),
+            uninstall=self._stop, verify=lambda tool_process: tool_process.status() is None,
+            parameters={'port': port})
 
     def uninstall(self, giraffe: Giraffe) -> None:
         """Uninstall the echo server.
@@ -54,6 +62,4 @@ class Tetanus:
         Args:
             giraffe: Component API to uninstall tool.
         """
-        pgrp = giraffe.connection.modules.os.getpgid(self._tool_process.pid)
-        giraffe.connection.modules.os.killpg(
-            pgrp, giraffe.connection.modules.signal.SIGINT)
+        giraffe.installs.remove(INSTALL_NAME)
@@ -43,24 +43,24 @@ class TestsSpecTetanus(TestsSpecGiraffe):
     _echo_port: int
 
     @pytest.fixture(scope='class', autouse=True)
-    def init_tetanus_lib(self) -> None:
-        """Initializes tetanus lib, only once, in the start of the test suite."""
+    def init_tetanus_lib(self):  # type: ignore
+        """Initializes tetanus lib, only once, in the start of the test suite, and uninstalls
+        Tetanus at its end."""
 
         # Can't set instance attributes in fixture with scope='class', only class attributes.
         cls = type(self)
         cls._tetanus_lib = Tetanus()  # pylint: disable=protected-access
         cls._echo_port = 1337  # pylint: disable=protected-access
+        yield
+        cls._tetanus_lib.uninstall(cls._giraffe)  # pylint: disable=protected-access
 
     @pytest.fixture(scope='function', autouse=True, params=[TEST_VERSION])
-    def tetanus(self, request):  # type: ignore
-        """Install Tetanus before every test function, and uninstall after test end."""
+    def tetanus(self, request) -> None:  # type: ignore
+        """Install Tetanus before every test function, it is reinstalled only when the version
+        changes or the running one broke."""
 
         tetanus_version = request.param
-        # Install Tetanus at the start of each test.
         self._tetanus_lib.install(self._giraffe, tetanus_version, self._echo_port)
-        yield
-        # Uninstall Tetanus at the end of each test.
-        self._tetanus_lib.uninstall(self._giraffe)
 
     @pytest.mark.lego('zebra.alice')
     async def test_send_and_recv(self, components):  # type: ignore
@@ -2,6 +2,20 @@
 Lego 3 is a new distributed testing infrastructure used to test and monitor our products
 in the network.
 """
-# Example of usage of acquire_components in a fixture can be found at:
-# Octavius/lego/pytest_lego/plugin.components
-from Octavius.lego.pytest_lego.component_factory import acquire_components
+from typing import Any
+
+
+def __getattr__(name: str) -> Any:
+    """Imports the public API lazily, so importing lego doesn't import RPyC and plumbum."""
+
+    if name == 'acquire_components':
+        # Example of usage of acquire_components in a fixture can be found at:
+        # Octavius/lego/pytest_lego/plugin.components
+        from Octavius.lego.pytest_lego.component_factory import acquire_components
+        return acquire_components
+
+    if name == 'acquire_components_async':
+        from Octavius.lego.pytest_lego.component_factory import acquire_components_async
+        return acquire_components_async
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
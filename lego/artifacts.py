@@ -0,0 +1,299 @@
+"""
+Collection of artifacts (logs, files and commands outputs) from components, e.g. when a test
+fails.
+The artifacts are archived and compressed on the component, and the archive is streamed in large
+chunks into a local file while it is still being written, so compression and transfer overlap.
+Every component is collected in its own thread, so collecting a large setup takes about as long
+as collecting its slowest component.
+
+The archive is capped in size and in time: files are read from their ends (where the latest logs
+are) up to the remaining size, and once a cap is reached the rest of the artifacts are skipped.
+The size cap counts the archived bytes before compression, since the compressor buffers its
+output, so it bounds the compressed archive as well (up to the archive headers).
+
+Like the supervisor, this module is executed on the remote side as is, so it must use only the
+standard library.
+
+Usage example:
+    summary = collect({'zebra.alice': zebra, 'giraffe.bob': giraffe}, 'artifacts/test_send',
+                      files=('/var/log/syslog',), commands=('ip addr',))
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, TYPE_CHECKING
+import concurrent.futures
+import glob
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+
+if TYPE_CHECKING:
+    import rpyc
+    from .components import BaseComponent
+
+# Bytes archived from every component, the compressed archive is smaller.
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Seconds the collection of all of the components may take.
+DEFAULT_TIMEOUT = 30.0
+# Bytes pulled from the component in every round trip.
+CHUNK_SIZE = 1024 * 1024
+# Compressed bytes the component buffers before the archiving waits for the transfer.
+BUFFER_SIZE = 4 * CHUNK_SIZE
+# Seconds every read waits for the archive to grow.
+POLL_INTERVAL = 0.1
+# Seconds the local side waits beyond the timeout for the archives to end.
+GRACE_PERIOD = 2.0
+
+
+class RemoteArchive:
+    """Archives artifacts on the component into a bounded buffer, from which they are read."""
+
+    def __init__(
+            self,
+            files: Sequence[str],
+            commands: Sequence[str],
+            max_bytes: int,
+            timeout: float
+    ) -> None:
+        self._deadline = time.monotonic() + timeout
+        self._max_bytes = max_bytes
+        self._buffer = bytearray()
+        self._archived = 0
+        self._done = False
+        self._abandoned = False
+        self._skipped: List[str] = []
+        self._condition = threading.Condition()
+        threading.Thread(
+            target=self._archive, args=(files, commands), name='LegoArtifacts',
+            daemon=True).start()
+
+    def write(self, data: bytes) -> int:
+        """Buffers compressed data for the reader, called by the archive."""
+
+        with self._condition:
+            while len(self._buffer) >= BUFFER_SIZE and not self._abandoned:
+                self._condition.wait()
+            if not self._abandoned:
+                self._buffer += data
+            self._condition.notify_all()
+
+        return len(data)
+
+    def _budget(self, artifact: str) -> int:
+        """Gets the bytes left for an artifact, 0 if it is skipped."""
+
+        remaining = self._max_bytes - self._archived
+        if self._abandoned or time.monotonic() >= self._deadline:
+            self._skipped.append(f'{artifact}: time cap')
+            return 0
+        if remaining <= 0:
+            self._skipped.append(f'{artifact}: size cap')
+            return 0
+
+        return remaining
+
+    def _archive(self, files: Sequence[str], commands: Sequence[str]) -> None:
+        """Writes the artifacts into a compressed tar stream."""
+
+        try:
+            with tarfile.open(fileobj=self, mode='w|gz') as archive:  # type: ignore
+                for command in commands:
+                    self._add_command(archive, command)
+                for pattern in files:
+                    paths = sorted(glob.glob(os.path.expanduser(pattern)))
+                    if not paths:
+                        self._skipped.append(f'{pattern}: not found')
+                    for path in paths:
+                        self._add_file(archive, path)
+        except Exception as error:  # pylint: disable=broad-except
+            self._skipped.append(f'archive: {error!r}')
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def _add_command(self, archive: tarfile.TarFile, command: str) -> None:
+        """Adds the output of a command, its name is made of the command."""
+
+        budget = self._budget(command)
+        if not budget:
+            return
+
+        try:
+            output = subprocess.run(
+                command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                timeout=max(self._deadline - time.monotonic(), 0), check=False).stdout
+        except subprocess.TimeoutExpired as error:
+            output = (error.output or b'') + b'\n[timed out]\n'
+        info = tarfile.TarInfo('commands/' + re.sub(r'[^\w.-]+', '_', command) + '.txt')
+        info.size = min(len(output), budget)
+        info.mtime = int(time.time())
+        archive.addfile(info, io.BytesIO(output[-info.size:] if info.size else b''))
+        self._archived += tarfile.BLOCKSIZE + info.size
+
+    def _add_file(self, archive: tarfile.TarFile, path: str) -> None:
+        """Adds the end of a file, which fits the remaining bytes."""
+
+        budget = self._budget(path)
+        if not budget:
+            return
+
+        try:
+            with open(path, 'rb') as artifact:
+                info = archive.gettarinfo(path, path.lstrip(os.sep), artifact)
+                if not info.isreg():
+                    self._skipped.append(f'{path}: not a regular file')
+                    return
+                if info.size > budget:
+                    artifact.seek(info.size - budget)
+                    info.size = budget
+                    self._skipped.append(f'{path}: truncated to its last {budget} bytes')
+                archive.addfile(info, artifact)
+                self._archived += tarfile.BLOCKSIZE + info.size
+        except OSError as error:
+            self._skipped.append(f'{path}: {error.strerror}')
+
+    def read(self, max_bytes: int, timeout: float) -> Optional[bytes]:
+        """Gets the buffered compressed data, waiting for some if there is none yet.
+
+        Returns:
+            The data, empty if none was written meanwhile, or None once the archive ended.
+        """
+
+        with self._condition:
+            if not self._buffer and not self._done:
+                self._condition.wait(timeout)
+            if not self._buffer and self._done:
+                return None
+            chunk = bytes(self._buffer[:max_bytes])
+            del self._buffer[:max_bytes]
+            self._condition.notify_all()
+
+        return chunk
+
+    def abandon(self) -> None:
+        """Stops archiving, once the reader gave up."""
+
+        with self._condition:
+            self._abandoned = True
+            self._condition.notify_all()
+
+    def skipped(self) -> Tuple[str, ...]:
+        """Gets the artifacts which were skipped or truncated, with the reasons."""
+
+        return tuple(self._skipped)
+
+
+def stream_archive(
+        connection: rpyc.Connection,
+        path: str,
+        files: Sequence[str],
+        commands: Sequence[str],
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        timeout: float = DEFAULT_TIMEOUT
+) -> Dict[str, Any]:
+    """Archives artifacts on a component, and streams the archive into a local file.
+
+    Args:
+        connection: Classic RPyC connection to the component.
+        path: The local archive, a compressed tar file.
+        files: Paths of files on the component, may be glob patterns.
+        commands: Shell commands to run on the component, their outputs are archived.
+        max_bytes (optional): Bytes to archive. Defaults to DEFAULT_MAX_BYTES.
+        timeout (optional): Seconds the collection may take. Defaults to DEFAULT_TIMEOUT.
+
+    Returns:
+        The bytes collected, whether the archive was cut by the timeout, and the artifacts
+        which were skipped or truncated.
+    """
+
+    from .supervisor import upload_module  # pylint: disable=import-outside-toplevel
+
+    deadline = time.monotonic() + timeout
+    r_archive = upload_module(connection, sys.modules[__name__]).RemoteArchive(
+        tuple(files), tuple(commands), max_bytes, timeout)
+    # Every attribute access of a netref is a round trip, so the method is fetched once.
+    r_read = r_archive.read
+
+    collected = 0
+    cut = False
+    with open(path, 'wb') as archive:
+        while True:
+            if time.monotonic() >= deadline + GRACE_PERIOD:
+                r_archive.abandon()
+                cut = True
+                break
+            chunk = r_read(CHUNK_SIZE, POLL_INTERVAL)
+            if chunk is None:
+                break
+            archive.write(chunk)
+            collected += len(chunk)
+
+    return {'bytes': collected, 'cut': cut, 'skipped': list(r_archive.skipped())}
+
+
+def collect(
+        components: Dict[str, BaseComponent],
+        directory: str,
+        files: Iterable[str] = (),
+        commands: Iterable[str] = (),
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        timeout: float = DEFAULT_TIMEOUT
+) -> Dict[str, Dict[str, Any]]:
+    """Collects the artifacts of components in parallel, into an archive per component.
+
+    Every component collects the given artifacts and the ones its class declares (see
+    RPyCComponent.collect_artifacts). Components which can't run commands are skipped.
+    A summary of the collection is written to collection.json in the directory.
+
+    Args:
+        components: The components by their names.
+        directory: The local directory of the archives, e.g. of the test.
+        files (optional): Paths of files on every component, may be glob patterns.
+                          Defaults to none.
+        commands (optional): Shell commands to run on every component. Defaults to none.
+        max_bytes (optional): Bytes to archive from every component.
+                              Defaults to DEFAULT_MAX_BYTES.
+        timeout (optional): Seconds the collection may take. Defaults to DEFAULT_TIMEOUT.
+
+    Returns:
+        The summary of every component, by its name.
+    """
+
+    files, commands = tuple(files), tuple(commands)
+    collectable = {name: component for name, component in components.items()
+                   if hasattr(component, 'collect_artifacts')}
+    summary: Dict[str, Dict[str, Any]] = {
+        name: {'error': 'The component can not collect artifacts'}
+        for name in components if name not in collectable}
+    if not collectable:
+        return summary
+
+    os.makedirs(directory, exist_ok=True)
+    executor = concurrent.futures.ThreadPoolExecutor(
+        len(collectable), thread_name_prefix='LegoArtifacts')
+    futures = {executor.submit(
+        component.collect_artifacts,
+        os.path.join(directory, f'{name}.tar.gz'), files, commands, max_bytes, timeout): name
+        for name, component in collectable.items()}
+    concurrent.futures.wait(futures, timeout + 2 * GRACE_PERIOD)
+    # A component which doesn't respond doesn't hold the teardown.
+    executor.shutdown(wait=False)
+
+    for future, name in futures.items():
+        if not future.done():
+            summary[name] = {'error': 'The component did not respond in time'}
+        elif future.exception() is not None:
+            summary[name] = {'error': repr(future.exception())}
+        else:
+            summary[name] = future.result()
+
+    with open(os.path.join(directory, 'collection.json'), 'w', encoding='utf-8') as summary_file:
+        json.dump(summary, summary_file, indent=1)
+
+    return summary
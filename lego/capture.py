@@ -0,0 +1,305 @@
+"""
+Streaming packet capture on a remote component.
+tcpdump runs on the component with the BPF filter, so only the matching packets leave it. Its
+pcap output is pulled in large chunks by a local thread and appended to a local file, which can
+be memory-mapped while the capture is still running. Neither side buffers the whole capture, and
+when the local side falls behind, tcpdump blocks and the kernel drops packets (which tcpdump
+reports when it stops).
+
+The component counts the packets as they pass through it, so the counters are available in a
+single call without moving any packets.
+
+Like the supervisor, this module is executed on the remote side as is, so it must use only the
+standard library.
+
+Usage example:
+    capture = zebra.start_capture('udp and port 1337', snaplen=128)
+    ...
+    zebra.stop_capture()
+    with capture.mmap() as pcap:
+        ...
+"""
+from __future__ import annotations
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union, TYPE_CHECKING
+import contextlib
+import mmap
+import os
+import re
+import select
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+
+if TYPE_CHECKING:
+    import rpyc
+
+# Bytes of a packet which are captured by default, the same default as tcpdump.
+DEFAULT_SNAPLEN = 262144
+# Maximal bytes pulled from the component in a single call.
+CHUNK_SIZE = 1024 * 1024
+# Seconds a pull waits on the component for packets.
+POLL_INTERVAL = 0.1
+# The capture program on the component.
+TCPDUMP = 'tcpdump'
+
+_GLOBAL_HEADER_SIZE = 24
+_RECORD_HEADER_SIZE = 16
+_LITTLE_ENDIAN_MAGICS = (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1')
+_STDERR_LIMIT = 64 * 1024
+
+
+class CaptureCounters(NamedTuple):
+    """Live counters of a capture.
+
+    Attributes:
+        packets: Captured packets.
+        captured_bytes: Bytes of the captured packets, up to the snaplen of every packet.
+        wire_bytes: Original length of the captured packets.
+        streamed_bytes: Bytes of pcap data streamed so far.
+    """
+
+    packets: int
+    captured_bytes: int
+    wire_bytes: int
+    streamed_bytes: int
+
+
+class _PcapCounter:
+    """Counts the packets of a pcap stream, which arrives in chunks of any size."""
+
+    def __init__(self) -> None:
+        self.packets = 0
+        self.captured_bytes = 0
+        self.wire_bytes = 0
+        self.streamed_bytes = 0
+        self._byte_order: Optional[str] = None
+        self._header = bytearray()
+        # Bytes of the current packet data which are still expected.
+        self._skip = 0
+
+    def feed(self, data: bytes) -> None:
+        self.streamed_bytes += len(data)
+        position = min(self._skip, len(data))
+        self._skip -= position
+
+        while position < len(data):
+            header_size = _GLOBAL_HEADER_SIZE if self._byte_order is None else _RECORD_HEADER_SIZE
+            missing = header_size - len(self._header)
+            self._header += data[position:position + missing]
+            position += missing
+            if len(self._header) < header_size:
+                return
+
+            if self._byte_order is None:
+                self._byte_order = '<' if bytes(self._header[:4]) in _LITTLE_ENDIAN_MAGICS else '>'
+            else:
+                _, _, captured, wire = struct.unpack(self._byte_order + 'IIII', self._header)
+                self.packets += 1
+                self.captured_bytes += captured
+                self.wire_bytes += wire
+                skipped = min(captured, len(data) - position)
+                position += skipped
+                self._skip = captured - skipped
+            self._header.clear()
+
+
+class RemoteCapture:
+    """The capture process on the component, it is used only through Capture."""
+
+    def __init__(self, command: Sequence[str]) -> None:
+        self._process = subprocess.Popen(
+            command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True)
+        self._counter = _PcapCounter()
+        self._stderr = bytearray()
+        self._stderr_reader = threading.Thread(target=self._read_stderr, daemon=True)
+        self._stderr_reader.start()
+
+    def _read_stderr(self) -> None:
+        with self._process.stderr:  # type: ignore
+            for line in self._process.stderr:  # type: ignore
+                if len(self._stderr) < _STDERR_LIMIT:
+                    self._stderr += line
+
+    def read(self, max_bytes: int, timeout: float) -> Optional[bytes]:
+        """Reads the available pcap data, None once the capture ended."""
+
+        stdout = self._process.stdout.fileno()  # type: ignore
+        if not select.select([stdout], [], [], timeout)[0]:
+            return b''
+
+        chunks: List[bytes] = []
+        size = 0
+        # Fills the chunk with whatever is already available, without waiting for more.
+        while size < max_bytes and select.select([stdout], [], [], 0)[0]:
+            chunk = os.read(stdout, max_bytes - size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+
+        if not chunks:
+            return None
+
+        data = b''.join(chunks)
+        self._counter.feed(data)
+        return data
+
+    def counters(self) -> Tuple[int, int, int, int]:
+        """Gets the counters of the capture."""
+
+        return (self._counter.packets, self._counter.captured_bytes, self._counter.wire_bytes,
+                self._counter.streamed_bytes)
+
+    def stop(self) -> None:
+        """Interrupts the capture, which flushes its output and exits."""
+
+        if self._process.poll() is None:
+            os.killpg(self._process.pid, signal.SIGINT)
+
+    def finish(self, timeout: Optional[float]) -> Tuple[Optional[int], bytes]:
+        """Waits for the capture to exit, and returns its return code and stderr."""
+
+        try:
+            self._process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(self._process.pid, signal.SIGKILL)
+            self._process.wait()
+        self._stderr_reader.join(timeout)
+        return self._process.returncode, bytes(self._stderr)
+
+
+class Capture:
+    """A packet capture which streams from a component into a local pcap file.
+
+    Attributes:
+        path: The local pcap file.
+        returncode: The return code of the capture program, once it was stopped.
+        stderr: The errors and statistics of the capture program, once it was stopped.
+        dropped: Packets dropped by the kernel of the component, once it was stopped.
+    """
+
+    path: str
+    returncode: Optional[int]
+    stderr: str
+    dropped: Optional[int]
+
+    def __init__(
+            self,
+            connection: rpyc.Connection,
+            bpf_filter: str = '',
+            snaplen: int = DEFAULT_SNAPLEN,
+            interface: str = 'any',
+            path: Optional[str] = None
+    ) -> None:
+        """Starts capturing on the component.
+
+        Args:
+            connection: Classic RPyC connection to the component.
+            bpf_filter (optional): Filter of the captured packets, applied on the component.
+                                   Defaults to every packet.
+            snaplen (optional): Bytes captured of every packet. Defaults to DEFAULT_SNAPLEN.
+            interface (optional): The interface to capture on. Defaults to all interfaces.
+            path (optional): The local pcap file. Defaults to a new temporary file.
+        """
+
+        from .supervisor import upload_module  # pylint: disable=import-outside-toplevel
+
+        if path is None:
+            file_descriptor, path = tempfile.mkstemp(prefix='lego_capture_', suffix='.pcap')
+            os.close(file_descriptor)
+        self.path = path
+        self.returncode = None
+        self.stderr = ''
+        self.dropped = None
+
+        # Packet buffered output is flushed for every packet, so the capture is streamed.
+        command: Tuple[str, ...] = (
+            TCPDUMP, '-i', interface, '-s', str(snaplen), '-U', '-w', '-')
+        if bpf_filter:
+            command += (bpf_filter,)
+        r_capture = upload_module(connection, sys.modules[__name__]).RemoteCapture(command)
+        # Every attribute access of a netref is a round trip, so the methods are fetched once.
+        self._r_read = r_capture.read
+        self._r_counters = r_capture.counters
+        self._r_stop = r_capture.stop
+        self._r_finish = r_capture.finish
+
+        # The file is created right away, so it can be mapped before any data arrives.
+        with open(self.path, 'wb'):
+            pass
+        self._stopped = False
+        self._error: Optional[BaseException] = None
+        self._streamer = threading.Thread(target=self._stream, name='LegoCapture', daemon=True)
+        self._streamer.start()
+
+    def _stream(self) -> None:
+        """Appends the pcap data of the component to the local file, until the capture ends."""
+
+        try:
+            with open(self.path, 'ab') as pcap_file:
+                while True:
+                    chunk = self._r_read(CHUNK_SIZE, POLL_INTERVAL)
+                    if chunk is None:
+                        return
+                    if chunk:
+                        pcap_file.write(chunk)
+                        # Makes the data visible to readers of the file.
+                        pcap_file.flush()
+        except BaseException as error:  # pylint: disable=broad-except
+            self._error = error
+
+    def counters(self) -> CaptureCounters:
+        """Gets the live counters of the capture, in a single call."""
+
+        return CaptureCounters(*self._r_counters())
+
+    @property
+    def running(self) -> bool:
+        """Whether the capture is still streaming."""
+
+        return self._streamer.is_alive()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stops the capture, and waits until all of its data is streamed.
+
+        Args:
+            timeout (optional): Seconds to wait for the capture to flush and exit, before it
+                                is killed. Defaults to 10.
+        """
+
+        if self._stopped:
+            return
+        self._stopped = True
+
+        self._r_stop()
+        self._streamer.join(timeout)
+        returncode, stderr = self._r_finish(timeout)
+        # The streamer closes the file once it read the end of the capture.
+        self._streamer.join(timeout)
+
+        self.returncode = returncode
+        self.stderr = stderr.decode(errors='replace')
+        dropped = re.search(r'(\d+) packets? dropped by kernel', self.stderr)
+        self.dropped = int(dropped.group(1)) if dropped else None
+        if self._error is not None:
+            raise self._error
+
+    @contextlib.contextmanager
+    def mmap(self) -> Iterator[Union[mmap.mmap, bytes]]:
+        """Maps the pcap data which was streamed so far into memory, read only.
+
+        Yields:
+            The mapped data, or empty bytes if nothing was streamed yet, since an empty file
+            can't be mapped.
+        """
+
+        with open(self.path, 'rb') as pcap_file:
+            if os.fstat(pcap_file.fileno()).st_size == 0:
+                yield b''
+                return
+            with mmap.mmap(pcap_file.fileno(), 0, access=mmap.ACCESS_READ) as pcap:
+                yield pcap
@@ -0,0 +1,158 @@
+"""
+Registry of the components classes.
+Components classes are declared by name, either by the 'lego.components' entry points group
+or by the [lego_components] section of the lego manager's inventory, whose paths the manager
+returns for the components it allocates:
+
+    [lego_components]
+    zebra = Octavius.example.components.zebra.Zebra
+
+A class is imported only when a component of it is actually built, and then it is memoized
+for the rest of the session. The module doesn't depend on pytest, so the lego manager uses it
+as well as the plugin.
+
+Example for entry points declaration in setup.py:
+    entry_points={'lego.components': ['zebra = Octavius.example.components.zebra:Zebra']}
+"""
+from __future__ import annotations
+from typing import Dict, Optional, Type, TYPE_CHECKING
+import importlib
+import sys
+import threading
+
+if TYPE_CHECKING:
+    from Octavius.lego.components import BaseComponent
+
+ENTRY_POINTS_GROUP = 'lego.components'
+
+
+def _load_entry_points() -> Dict[str, str]:
+    """Reads the components declared in the entry points group, without importing them.
+
+    Returns:
+        Components classes paths by their names.
+    """
+
+    from importlib import metadata  # pylint: disable=import-outside-toplevel
+
+    if sys.version_info >= (3, 10):
+        group = metadata.entry_points(group=ENTRY_POINTS_GROUP)
+    else:
+        # Before python 3.10 the entry points are grouped in a dictionary.
+        group = metadata.entry_points().get(ENTRY_POINTS_GROUP, ())
+
+    return {entry_point.name: entry_point.value for entry_point in group}
+
+
+def _import_class(component_path: str) -> Type[BaseComponent]:
+    """Imports a component class.
+
+    Args:
+        component_path: The path to the class, either 'package.module.Class'
+                        or 'package.module:Class'.
+
+    Returns:
+        The component's class object.
+    """
+
+    if ':' in component_path:
+        module, component_class = component_path.split(':')
+    else:
+        module, _, component_class = component_path.rpartition('.')
+
+    return getattr(importlib.import_module(module), component_class)
+
+
+class ComponentRegistry:
+    """Lazily resolved and memoized mapping of components classes.
+
+    Attributes:
+        declarations: Components classes paths by their names.
+    """
+
+    declarations: Dict[str, str]
+
+    def __init__(self) -> None:
+        self.declarations = {}
+        self._classes: Dict[str, Type[BaseComponent]] = {}
+        self._entry_points_loaded = False
+        self._lock = threading.Lock()
+
+    def register(self, name: str, component_path: str) -> None:
+        """Declares a component class without importing it.
+
+        Args:
+            name: The component class name, e.g. 'zebra'.
+            component_path: The path to the requested component class.
+                            For example, Octavius.example.components.zebra.Zebra
+        """
+
+        with self._lock:
+            self.declarations[name] = component_path
+
+    def _declaration(self, name: str) -> Optional[str]:
+        """Gets the path of a declared component class.
+
+        Args:
+            name: The component class name.
+
+        Returns:
+            The path of the class, or None if it isn't declared.
+        """
+
+        if name not in self.declarations and not self._entry_points_loaded:
+            self._entry_points_loaded = True
+            for entry_name, component_path in _load_entry_points().items():
+                self.declarations.setdefault(entry_name, component_path)
+
+        return self.declarations.get(name)
+
+    def path(self, name: str) -> str:
+        """Gets the path of a declared component class, without importing it.
+
+        Args:
+            name: The component class name, e.g. 'zebra'.
+
+        Returns:
+            The path to the class.
+
+        Raises:
+            KeyError: If the class isn't declared.
+        """
+
+        with self._lock:
+            component_path = self._declaration(name)
+        if component_path is None:
+            raise KeyError(f'Component class {name} is not declared')
+
+        return component_path
+
+    def resolve(self, name_or_path: str) -> Type[BaseComponent]:
+        """Gets the requested component's class object.
+
+        Args:
+            name_or_path: Either a declared component class name (e.g. 'zebra') or a path
+                          to the class (e.g. 'Octavius.example.components.zebra.Zebra').
+
+        Returns:
+            The component's class object.
+        """
+
+        try:
+            # Fast path, without locking, for classes that were already resolved.
+            return self._classes[name_or_path]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if name_or_path not in self._classes:
+                component_path = self._declaration(name_or_path) or name_or_path
+                self._classes[name_or_path] = _import_class(component_path)
+
+            return self._classes[name_or_path]
+
+    def clear(self) -> None:
+        """Forgets the resolved classes, mainly for tests."""
+
+        with self._lock:
+            self._classes.clear()
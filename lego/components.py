@@ -2,7 +2,8 @@
 Component object provides the API which tests and libs will use to run code on the component.
 """
 from __future__ import annotations
-from typing import Optional, Type, TypeVar
+from typing import (
+    Any, Callable, Dict, Optional, Sequence, Tuple, Type, TypeVar, Union, TYPE_CHECKING)
 from types import TracebackType
 import abc
 import socket
@@ -10,7 +11,17 @@ import ipaddress
 
 import rpyc
 
-from .connections import BaseConnection, RPyCConnection
+from .connections import (
+    BaseConnection, LocalConnection, RPyCConnection, DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_SSH_RACE_DELAY, REMOTE)
+
+if TYPE_CHECKING:
+    # The features of the components are imported on their first use, so importing a
+    # component doesn't import all of them.
+    from .capture import Capture
+    from .installs import InstallCache
+    from .remote_functions import FunctionRunner
+    from .supervisor import Supervisor
 
 Component = TypeVar('Component', bound='BaseComponent')
 
@@ -58,6 +69,15 @@ class BaseComponent(metaclass=abc.ABCMeta):
     def close(self) -> None:
         """Allow subclasses to free resources after finishing tests."""
 
+    def software_signature(self) -> str:
+        """Describes the software of the component, the tests results depend on it.
+
+        Returns:
+            The signature, a change of the component's software should change it.
+        """
+
+        return f'{type(self).__module__}.{type(self).__qualname__}'
+
     @property
     @abc.abstractmethod
     def connection(self) -> BaseConnection:
@@ -72,34 +92,174 @@ class RPyCComponent(BaseComponent):
     python on the component.
     """
 
-    _connection: RPyCConnection
+    _connection: Union[RPyCConnection, LocalConnection]
+    # Commands whose output describes the software the component's API depends on,
+    # e.g. versions of tools.
+    SIGNATURE_COMMANDS: Tuple[str, ...] = ()
+    # Files (may be glob patterns) and outputs of commands which are collected from the
+    # component when a test which uses it fails.
+    ARTIFACT_FILES: Tuple[str, ...] = ()
+    ARTIFACT_COMMANDS: Tuple[str, ...] = ()
 
     def __init__(
             self,
             hostname: str,
             username: Optional[str] = None,
-            password: Optional[str] = None
+            password: Optional[str] = None,
+            port: int = rpyc.classic.DEFAULT_SERVER_PORT,
+            connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+            backend: str = REMOTE,
+            ssh_race_delay: float = DEFAULT_SSH_RACE_DELAY
     ) -> None:
         """Initiates RPyC connection to SlaveService on remote machine.
 
         Connect to RPyC SlaveService on remote machine. If the service isn't running, try
         to deploy it with SSHConnection and RPyC zero deploy library.
+        With a local backend, the service is started on this machine instead, and the
+        other arguments are ignored (see LocalConnection).
 
         Args:
             hostname: Hostname of remote machine.
             username: Username for SSH login (if needed).
             password: Password for SSH login (if needed).
+            port (optional): Port of the running SlaveService. Defaults to RPyC classic port.
+            connect_timeout (optional): Seconds to wait for the component to connect.
+                                        Defaults to DEFAULT_CONNECT_TIMEOUT.
+            backend (optional): REMOTE, LOCAL_THREAD or LOCAL_PROCESS (see connections).
+                                Defaults to REMOTE.
+            ssh_race_delay (optional): Seconds the direct connection has before the SSH
+                                       deployment is started alongside it.
+                                       Defaults to DEFAULT_SSH_RACE_DELAY.
         """
-        rpyc_connection = RPyCConnection(hostname, username, password)
+        rpyc_connection: Union[RPyCConnection, LocalConnection]
+        if backend == REMOTE:
+            rpyc_connection = RPyCConnection(
+                hostname, username, password, port, connect_timeout, ssh_race_delay)
+        else:
+            rpyc_connection = LocalConnection(backend)
+        self._supervisor: Optional[Supervisor] = None
+        self._capture: Optional[Capture] = None
+        self._function_runner: Optional[FunctionRunner] = None
+        self._installs: Optional[InstallCache] = None
 
         super().__init__(rpyc_connection)
 
+    def close(self) -> None:
+        """Uninstalls the tools which libs installed, stops the running capture, and kills the
+        processes which were started by the supervisor and are still running."""
+
+        if self._installs is not None:
+            self._installs.clear()
+        if self._capture is not None:
+            self.stop_capture()
+        if self._supervisor is not None:
+            self._supervisor.close()
+
     @property
     def connection(self) -> rpyc.Connection:
         """The RPyc connection to component."""
 
         return self._connection.rpyc
 
+    @property
+    def supervisor(self) -> Supervisor:
+        """Supervisor of processes on the component, uploaded on first use."""
+
+        if self._supervisor is None:
+            from .supervisor import Supervisor  # pylint: disable=import-outside-toplevel
+            self._supervisor = Supervisor(self.connection)
+
+        return self._supervisor
+
+    @property
+    def installs(self) -> InstallCache:
+        """The tools which libs installed on the component, reused across tests."""
+
+        if self._installs is None:
+            from .installs import InstallCache  # pylint: disable=import-outside-toplevel
+            self._installs = InstallCache()
+
+        return self._installs
+
+    def run_remote(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Runs a local pure function on the component, in a single round trip.
+
+        The function's source is shipped on its first call and cached on the component, so
+        loops over remote data (e.g. checking packets or parsing logs) run next to the data.
+
+        Args:
+            func: A function which imports the modules it uses inside its body. Its arguments
+                  and result must be picklable.
+            args: Positional arguments of the function.
+            kwargs: Keyword arguments of the function.
+
+        Returns:
+            The result of the function.
+        """
+
+        if self._function_runner is None:
+            # pylint: disable=import-outside-toplevel
+            from .remote_functions import FunctionRunner
+            self._function_runner = FunctionRunner(self.connection)
+
+        return self._function_runner.run(func, *args, **kwargs)
+
+    def software_signature(self) -> str:
+        """Describes the platform and Python of the component, and the outputs of
+        SIGNATURE_COMMANDS.
+
+        Returns:
+            The signature, a change of the component's software should change it.
+        """
+
+        r_platform = self.connection.modules.platform
+        parts = [super().software_signature(), r_platform.platform(),
+                 r_platform.python_version()]
+        if self.SIGNATURE_COMMANDS:
+            processes = self.supervisor.start_many(self.SIGNATURE_COMMANDS)
+            returncodes = self.supervisor.wait(processes)
+            for command, returncode, (stdout, stderr) in zip(
+                    self.SIGNATURE_COMMANDS, returncodes, self.supervisor.output(processes)):
+                parts.append(f'{command}: {returncode}\n{stdout.decode(errors="replace")}'
+                             f'{stderr.decode(errors="replace")}')
+            self.supervisor.forget(processes)
+
+        return '\n'.join(parts)
+
+    def collect_artifacts(
+            self,
+            path: str,
+            files: Sequence[str] = (),
+            commands: Sequence[str] = (),
+            max_bytes: Optional[int] = None,
+            timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Archives files and commands outputs on the component, along with ARTIFACT_FILES and
+        ARTIFACT_COMMANDS, and streams the compressed archive into a local file.
+
+        Args:
+            path: The local archive, a compressed tar file.
+            files (optional): Paths of files on the component, may be glob patterns.
+                              Defaults to none.
+            commands (optional): Shell commands to run on the component. Defaults to none.
+            max_bytes (optional): Bytes to archive, before compression.
+                                  Defaults to artifacts.DEFAULT_MAX_BYTES.
+            timeout (optional): Seconds the collection may take.
+                                Defaults to artifacts.DEFAULT_TIMEOUT.
+
+        Returns:
+            The bytes collected, whether the archive was cut by the timeout, and the artifacts
+            which were skipped or truncated.
+        """
+
+        from . import artifacts  # pylint: disable=import-outside-toplevel
+
+        return artifacts.stream_archive(
+            self.connection, path, tuple(files) + self.ARTIFACT_FILES,
+            tuple(commands) + self.ARTIFACT_COMMANDS,
+            artifacts.DEFAULT_MAX_BYTES if max_bytes is None else max_bytes,
+            artifacts.DEFAULT_TIMEOUT if timeout is None else timeout)
+
     def getpid(self) -> int:
         """Gets the PID of the service process."""
 
@@ -143,3 +303,48 @@ class RPyCComponent(BaseComponent):
             r_socket.close()
 
         return ipaddress.ip_address(component_ip)
+
+    def start_capture(
+            self,
+            bpf_filter: str = '',
+            snaplen: Optional[int] = None,
+            interface: str = 'any',
+            path: Optional[str] = None
+    ) -> Capture:
+        """Starts capturing packets on the component, into a local pcap file.
+
+        Args:
+            bpf_filter (optional): Filter of the captured packets, applied on the component.
+                                   Defaults to every packet.
+            snaplen (optional): Bytes captured of every packet.
+                                Defaults to capture.DEFAULT_SNAPLEN.
+            interface (optional): The interface to capture on. Defaults to all interfaces.
+            path (optional): The local pcap file. Defaults to a new temporary file.
+
+        Returns:
+            The running capture, its counters are available while it runs.
+        """
+
+        if self._capture is not None:
+            raise ValueError(f'A capture into {self._capture.path} is already running')
+
+        from .capture import Capture, DEFAULT_SNAPLEN  # pylint: disable=import-outside-toplevel
+
+        self._capture = Capture(
+            self.connection, bpf_filter, DEFAULT_SNAPLEN if snaplen is None else snaplen,
+            interface, path)
+        return self._capture
+
+    def stop_capture(self) -> Capture:
+        """Stops the running capture, once all of its packets were written to the local file.
+
+        Returns:
+            The stopped capture.
+        """
+
+        if self._capture is None:
+            raise ValueError('No capture is running')
+
+        capture, self._capture = self._capture, None
+        capture.stop()
+        return capture
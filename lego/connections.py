@@ -4,16 +4,61 @@ functionality to the component, such as running a shell command or upload a file
 Each connection should be based on different protocol, e.g. SSH or telnet.
 """
 from __future__ import annotations
-from typing import Optional, Type, TypeVar
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar, TYPE_CHECKING
 from types import TracebackType
 import abc
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
 
-import plumbum
 import rpyc
-from rpyc.utils.zerodeploy import DeployedServer
+
+if TYPE_CHECKING:
+    # Plumbum is needed only for SSH, so it is imported when SSH is actually used.
+    import plumbum
 
 Connection = TypeVar('Connection', bound='BaseConnection')
 
+# Seconds to wait for a component to accept a connection.
+DEFAULT_CONNECT_TIMEOUT = 3.0
+# Seconds the direct connection has before the SSH deployment is started alongside it.
+DEFAULT_SSH_RACE_DELAY = 0.25
+# Seconds a failure to connect to a component is remembered, so tests fail fast.
+NEGATIVE_CACHE_TTL = 30.0
+
+# Connection paths to RPyC SlaveService.
+DIRECT = 'direct'
+SSH_DEPLOY = 'ssh_deploy'
+
+# Backends of RPyC components: a remote machine, or a SlaveService on this machine which is
+# served in a thread of this process, or in a child process.
+REMOTE = 'remote'
+LOCAL_THREAD = 'local_thread'
+LOCAL_PROCESS = 'local_process'
+BACKENDS = (REMOTE, LOCAL_THREAD, LOCAL_PROCESS)
+# Seconds a local process has to exit once its connection is closed, before it is killed.
+LOCAL_PROCESS_EXIT_TIMEOUT = 5.0
+# Serves SlaveService in the child process, on the socket whose descriptor is its argument.
+_SERVE_SOCKET = (
+    'import socket, sys, rpyc;'
+    'rpyc.utils.factory.connect_stream(rpyc.SocketStream(socket.socket(fileno=int(sys.argv[1]))),'
+    ' rpyc.SlaveService).serve_all()')
+
+# Recent connection failures by hostname and port: the time they happened, and the error's
+# description and the error, which are only chained to the errors of the cached failures.
+_failures: Dict[Tuple[str, int], Tuple[float, str, BaseException]] = dict()
+_failures_lock = threading.Lock()
+
+
+def clear_negative_cache() -> None:
+    """Forgets the recent connection failures, e.g. after a component was fixed."""
+
+    with _failures_lock:
+        _failures.clear()
+
 
 class BaseConnection(metaclass=abc.ABCMeta):
     """
@@ -65,19 +110,30 @@ class SSHConnection(BaseConnection):
     https://plumbum.readthedocs.io/en/latest/#user-guide
     """
 
-    def __init__(self, hostname: str, username: str, password: str) -> None:
+    def __init__(
+            self,
+            hostname: str,
+            username: str,
+            password: str,
+            connect_timeout: float = DEFAULT_CONNECT_TIMEOUT
+    ) -> None:
         """Initiates SSH connection.
 
         Args:
             hostname: The hostname of the component we want to connect to.
             username: Username for SSH connection.
             password: Password for SSH connection.
+            connect_timeout (optional): Seconds to wait for the SSH connection.
+                                        Defaults to DEFAULT_CONNECT_TIMEOUT.
         """
 
+        import plumbum  # pylint: disable=import-outside-toplevel
+
         # TODO: Check if Paramkio machine can be used with rpyc.DeployedServer.
         #       SshMachine uses an ssh connection for every command, and paramkio use only
         #       one connection.
-        self._machine = plumbum.SshMachine(hostname, user=username, password=password)
+        self._machine = plumbum.SshMachine(
+            hostname, user=username, password=password, connect_timeout=connect_timeout)
 
     @property
     def shell(self) -> plumbum.SshMachine:
@@ -95,39 +151,145 @@ class RPyCConnection(BaseConnection):
     """RPyC wrapper for component connection.
 
     In case the machine doesn't already run SlaveService, we will try to use SSH to upload and
-    deploy RPyC SlaveService.
+    deploy RPyC SlaveService. The deployment is raced against the direct connection, so a
+    component which is slow to answer doesn't cost the sum of both of the timeouts.
+
+    Attributes:
+        path: The path which connected, either DIRECT or SSH_DEPLOY.
+        timings: Seconds every attempted path took, by the path.
     """
 
+    path: str
+    timings: Dict[str, float]
+
     def __init__(
             self,
             hostname: str,
             username: Optional[str] = None,
-            password: Optional[str] = None
+            password: Optional[str] = None,
+            port: int = rpyc.classic.DEFAULT_SERVER_PORT,
+            connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+            ssh_race_delay: float = DEFAULT_SSH_RACE_DELAY
     ) -> None:
         """Connects (or start with SSH if needed) to RPyC remote SlaveService.
 
-        Connect to RPyC SlaveService on remote machine. If the service isn't running, try
-        to deploy it with SSHConnection and RPyC zero deploy library.
+        Connect to RPyC SlaveService on remote machine. If the service doesn't answer quickly,
+        try to deploy it with SSHConnection and RPyC zero deploy library at the same time, and
+        use the first path that connects. A failure of all of the paths is remembered for
+        NEGATIVE_CACHE_TTL seconds, in which connecting to the component fails immediately.
 
         Args:
             hostname: The hostname of the component we want to connect to.
             username: Username for SSH login (if needed).
             password: Password for SSH login (if needed).
+            port (optional): Port of the running SlaveService. Defaults to RPyC classic port.
+            connect_timeout (optional): Seconds to wait for every path to connect.
+                                        Defaults to DEFAULT_CONNECT_TIMEOUT.
+            ssh_race_delay (optional): Seconds the direct connection has before the SSH
+                                       deployment is started alongside it.
+                                       Defaults to DEFAULT_SSH_RACE_DELAY.
+
+        Raises:
+            ConnectionError: If connecting to the component failed in the last
+                             NEGATIVE_CACHE_TTL seconds, chained to that failure.
         """
 
+        # The port and timeouts may arrive as strings from pytest's configuration file.
+        port = int(port)
+        connect_timeout = float(connect_timeout)
+        self._ssh_race_delay = float(ssh_race_delay)
         self._server = None
+        self.timings = dict()
+
+        address = (hostname, port)
+        with _failures_lock:
+            failure = _failures.get(address)
+        if failure is not None:
+            failed_at, description, error = failure
+            age = time.monotonic() - failed_at
+            if age < NEGATIVE_CACHE_TTL:
+                raise ConnectionError(f'{hostname}:{port} failed {age:.1f}s ago: {description}') \
+                    from error
+
+        paths: Dict[str, Callable[[], Tuple[rpyc.Connection, Any]]] = {
+            DIRECT: lambda: (_connect_direct(hostname, port, connect_timeout), None)}
+        if username is not None and password is not None:
+            paths[SSH_DEPLOY] = lambda: _deploy(hostname, username, password, connect_timeout)
+
         try:
-            # Checks if the machine already runs RPyC SlaveService.
-            self._connection = rpyc.classic.connect(hostname, keepalive=True)
-        except ConnectionRefusedError:
-            if username is None or password is None:
-                # Not given necessary SSH credentials.
-                raise
-
-            with SSHConnection(hostname, username, password) as ssh:
-                # Upload RPyC and start SlaveService in a temporarily directory.
-                self._server = DeployedServer(ssh.shell)  # pylint: disable=no-member
-                self._connection = self._server.classic_connect()
+            self.path, (self._connection, self._server) = self._race(paths)
+        except Exception as error:
+            with _failures_lock:
+                _failures[address] = (time.monotonic(), f'{type(error).__name__}: {error}', error)
+            raise
+
+        with _failures_lock:
+            _failures.pop(address, None)
+
+    def _race(
+            self,
+            paths: Dict[str, Callable[[], Tuple[rpyc.Connection, Any]]]
+    ) -> Tuple[str, Tuple[rpyc.Connection, Any]]:
+        """Connects through the paths, and keeps the first one that connects.
+
+        The SSH deployment is started only once the direct connection failed, or didn't
+        connect within the SSH race delay, since a deployment is expensive. A path which connects
+        after another one won is closed.
+
+        Args:
+            paths: Functions which connect by the path, by the path name, in order of preference.
+
+        Returns:
+            The name of the path which connected, and its connection and deployed server.
+        """
+
+        results: queue.Queue = queue.Queue()
+        lock = threading.Lock()
+        winner: List[str] = []
+
+        def attempt(path: str) -> None:
+            start = time.perf_counter()
+            try:
+                connected = paths[path]()
+            except Exception as error:  # pylint: disable=broad-except
+                self.timings[path] = time.perf_counter() - start
+                results.put((path, None, error))
+                return
+
+            self.timings[path] = time.perf_counter() - start
+            with lock:
+                lost = bool(winner)
+                winner.append(path)
+            if lost:
+                _close(*connected)
+            else:
+                results.put((path, connected, None))
+
+        pending = list(paths)
+        errors: Dict[str, Exception] = dict()
+        running = 0
+        while True:
+            # Starts the next path, since the previous one failed or is too slow.
+            if pending:
+                threading.Thread(
+                    target=attempt, args=(pending.pop(0),), name='LegoConnect', daemon=True
+                ).start()
+                running += 1
+
+            try:
+                path, connected, error = results.get(
+                    timeout=self._ssh_race_delay if pending else None)
+            except queue.Empty:
+                continue
+
+            running -= 1
+            if error is None:
+                return path, connected
+            errors[path] = error
+            if not pending and running == 0:
+                # The direct connection error explains the failure, unless SSH was tried too.
+                last_error = errors.get(SSH_DEPLOY, errors[DIRECT])
+                raise last_error
 
     @property
     def rpyc(self) -> rpyc.Connection:
@@ -138,8 +300,130 @@ class RPyCConnection(BaseConnection):
     def close(self) -> None:
         """Closes RPyC connections."""
 
+        _close(self._connection, self._server)
+
+
+def _connect_direct(hostname: str, port: int, timeout: float) -> rpyc.Connection:
+    """Connects to a running SlaveService.
+
+    Args:
+        hostname: The hostname of the component.
+        port: Port of the running SlaveService.
+        timeout: Seconds to wait for the component to accept the connection.
+
+    Returns:
+        Classic RPyC connection to the component.
+    """
+
+    # RPyC retries a refused connection with a back off, which only delays the SSH deployment.
+    sock = socket.create_connection((hostname, port), timeout)
+    sock.settimeout(None)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    return rpyc.classic.connect_stream(rpyc.SocketStream(sock))
+
+
+def _deploy(
+        hostname: str,
+        username: str,
+        password: str,
+        timeout: float
+) -> Tuple[rpyc.Connection, Any]:
+    """Uploads RPyC with SSH and starts SlaveService in a temporary directory.
+
+    Args:
+        hostname: The hostname of the component.
+        username: Username for SSH login.
+        password: Password for SSH login.
+        timeout: Seconds to wait for the SSH connection.
+
+    Returns:
+        Classic RPyC connection to the component, and the deployed server.
+    """
+
+    from rpyc.utils.zerodeploy import DeployedServer  # pylint: disable=import-outside-toplevel
+
+    with SSHConnection(hostname, username, password, timeout) as ssh:
+        server = DeployedServer(ssh.shell)  # pylint: disable=no-member
+        try:
+            return server.classic_connect(), server
+        except Exception:
+            server.close()
+            raise
+
+
+def _close(connection: rpyc.Connection, server: Any) -> None:
+    """Closes a connection, and the server which was deployed for it.
+
+    Args:
+        connection: RPyC connection.
+        server: The deployed server, None if it wasn't deployed.
+    """
+
+    connection.close()
+    if server is not None:
+        server.close()
+
+
+class LocalConnection(BaseConnection):
+    """RPyC connection to a SlaveService on this machine, for development runs without a lab.
+
+    The service is served over a socket pair, so no port is listened on: in a thread of this
+    process (the fastest, but the components share the process, e.g. its working directory),
+    or in a child process (every component has its own process, like a remote machine).
+
+    Attributes:
+        path: The backend which serves the service, LOCAL_THREAD or LOCAL_PROCESS.
+        timings: Seconds the service took to start, by the backend.
+    """
+
+    path: str
+    timings: Dict[str, float]
+
+    def __init__(self, backend: str = LOCAL_THREAD) -> None:
+        """Starts SlaveService, and connects to it.
+
+        Args:
+            backend (optional): LOCAL_THREAD or LOCAL_PROCESS. Defaults to LOCAL_THREAD.
+        """
+
+        start = time.perf_counter()
+        self.path = backend
+        self._process: Optional[subprocess.Popen] = None
+        sock, served_sock = socket.socketpair()
+        if backend == LOCAL_THREAD:
+            served = rpyc.utils.factory.connect_stream(
+                rpyc.SocketStream(served_sock), rpyc.SlaveService)
+            threading.Thread(target=served.serve_all, name='LegoLocal', daemon=True).start()
+        elif backend == LOCAL_PROCESS:
+            with served_sock:
+                self._process = subprocess.Popen(
+                    [sys.executable, '-c', _SERVE_SOCKET, str(served_sock.fileno())],
+                    pass_fds=(served_sock.fileno(),))
+        else:
+            sock.close()
+            served_sock.close()
+            raise ValueError(f'Unknown local backend {backend!r}, expected one of '
+                             f'{(LOCAL_THREAD, LOCAL_PROCESS)}')
+
+        self._connection = rpyc.classic.connect_stream(rpyc.SocketStream(sock))
+        self.timings = {backend: time.perf_counter() - start}
+
+    @property
+    def rpyc(self) -> rpyc.Connection:
+        """The RPyc connection to component."""
+
+        return self._connection
+
+    def close(self) -> None:
+        """Closes the RPyC connection, which stops the service, and waits for its process."""
+
         self._connection.close()
-        if self._server is not None:
-            self._server.close()
+        if self._process is not None:
+            try:
+                self._process.wait(LOCAL_PROCESS_EXIT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+
 
 # TODO: Add telnet connection that will support RPyC.
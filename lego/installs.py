@@ -0,0 +1,113 @@
+"""
+Cache of the tools which libs installed on a component.
+Installing a tool around every test (e.g. starting a server) is repeated for hundreds of tests
+which use the same version with the same parameters. Instead, libs install through the cache of
+the component: a tool is installed once, and as long as the following tests ask for the same
+fingerprint (tool, version and parameters) and the installed state passes a cheap verification,
+it is reused. Only a tool whose fingerprint changed, or whose state broke, is reinstalled.
+
+Usage example:
+    process = giraffe.installs.ensure(
+        'tetanus', 3, lambda: giraffe.supervisor.start(f'ncat -l {port} --udp'),
+        uninstall=lambda process: process.kill(), verify=lambda process: process.status() is None,
+        parameters={'port': port})
+"""
+from typing import Any, Callable, Dict, Hashable, Mapping, NamedTuple, Optional, Tuple, TypeVar
+
+State = TypeVar('State')
+
+# A fingerprint is made of the version and the parameters of the tool.
+Fingerprint = Tuple[Hashable, Tuple[Tuple[str, Hashable], ...]]
+
+
+class Installation(NamedTuple):
+    """An installed tool.
+
+    Attributes:
+        fingerprint: The version and parameters the tool was installed with.
+        state: What installing the tool returned, e.g. a handle of its process.
+        uninstall: Uninstalls the tool, given its state.
+    """
+
+    fingerprint: Fingerprint
+    state: Any
+    uninstall: Callable[[Any], None]
+
+
+class InstallCache:
+    """The tools installed on a component, by their names.
+
+    Attributes:
+        installs: How many times tools were installed.
+        reuses: How many times installed tools were reused.
+    """
+
+    installs: int
+    reuses: int
+
+    def __init__(self) -> None:
+        self._installed: Dict[str, Installation] = {}
+        self.installs = 0
+        self.reuses = 0
+
+    def ensure(
+            self,
+            tool: str,
+            version: Hashable,
+            install: Callable[[], State],
+            uninstall: Callable[[State], None],
+            verify: Optional[Callable[[State], bool]] = None,
+            parameters: Optional[Mapping[str, Hashable]] = None
+    ) -> State:
+        """Installs a tool, unless it is already installed with the same fingerprint.
+
+        A tool which is installed with another fingerprint, or whose state fails verification,
+        is uninstalled and installed again.
+
+        Args:
+            tool: Name of the tool, a component has a single installation of every tool.
+            version: Version of the tool.
+            install: Installs the tool, and returns its state.
+            uninstall: Uninstalls the tool, given its state.
+            verify (optional): Checks cheaply that the installed state is still valid.
+                               Defaults to trusting it.
+            parameters (optional): Parameters the tool is installed with. Defaults to none.
+
+        Returns:
+            The state of the installed tool.
+        """
+
+        fingerprint = (version, tuple(sorted((parameters or {}).items())))
+        installation = self._installed.get(tool)
+        if installation is not None:
+            if installation.fingerprint == fingerprint and (
+                    verify is None or verify(installation.state)):
+                self.reuses += 1
+                return installation.state
+            self.remove(tool)
+
+        state = install()
+        self._installed[tool] = Installation(fingerprint, state, uninstall)
+        self.installs += 1
+
+        return state
+
+    def remove(self, tool: str) -> None:
+        """Uninstalls a tool, if it is installed.
+
+        Args:
+            tool: Name of the tool.
+        """
+
+        installation = self._installed.pop(tool, None)
+        if installation is not None:
+            installation.uninstall(installation.state)
+
+    def clear(self) -> None:
+        """Uninstalls all of the tools, in the reverse order of their installation."""
+
+        for tool in reversed(list(self._installed)):
+            self.remove(tool)
+
+    def __contains__(self, tool: str) -> bool:
+        return tool in self._installed
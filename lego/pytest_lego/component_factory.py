@@ -2,13 +2,32 @@
 Supply components to the plugin by acquiring them in the lego manager,
 then getting their arguments from pytest configuration (pytest.ini file).
 """
-from typing import List, Any, Type, Iterator
+from __future__ import annotations
+from typing import (
+    List, Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Type, Iterator,
+    TYPE_CHECKING)
 
+import asyncio
 import contextlib
-import importlib
-import rpyc
+import functools
+import uuid
 
-from Octavius.lego.components import BaseComponent
+from .component_registry import registry
+from .tracing import TESTS_TRACK
+
+if TYPE_CHECKING:
+    # Components and RPyC are imported only when a component is actually built.
+    import rpyc
+    from Octavius.lego.components import BaseComponent
+    from Octavius.lego_manager.timeline import Timeline
+
+# Seconds between the first polls of a pending setup, the interval doubles while it waits.
+POLL_INTERVAL = 0.01
+# Maximal seconds between polls of a pending setup.
+MAX_POLL_INTERVAL = 0.5
+# Identifies the setups of this test process to the lego manager, which prefers handing it the
+# instances it recently used.
+SESSION = uuid.uuid4().hex
 
 
 def _get_component_class(component_path: str) -> Type[BaseComponent]:
@@ -22,17 +41,23 @@ def _get_component_class(component_path: str) -> Type[BaseComponent]:
         The component's class object.
     """
 
-    *module, component_class = component_path.split('.')
-    return getattr(importlib.import_module('.'.join(module)), component_class)
+    return registry.resolve(component_path)
 
 
-def _get_component(component_name: str, component_path: str, pytest_config: Any) -> BaseComponent:
+def _get_component(
+        component_name: str,
+        component_path: str,
+        pytest_config: Any,
+        backend: Optional[str] = None
+) -> BaseComponent:
     """Initialize the component object.
 
     Args:
         component_name: The component name in pytest config file (usually, pytest.ini file).
         component_path: The path to the requested component class.
         pytest_config: A PyTest configuration object associated with current test.
+        backend (optional): The backend of RPyC components, overrides the one of the
+                            component's section (see connections.BACKENDS). Defaults to None.
 
     Returns:
         Component object.
@@ -44,6 +69,12 @@ def _get_component(component_name: str, component_path: str, pytest_config: Any)
         raise KeyError(f"{component_name} missing in pytest's configuration file.")
 
     component_class = _get_component_class(component_path)
+    if backend is not None:
+        # pylint: disable=import-outside-toplevel
+        from Octavius.lego.components import RPyCComponent
+        if issubclass(component_class, RPyCComponent):
+            component_config = {**component_config, 'backend': backend}
+
     return component_class(**component_config)
 
 
@@ -52,7 +83,10 @@ def acquire_components(
         lego_manager: rpyc.Connection,
         pytest_config: Any,
         query: str,
-        exclusive: bool = True
+        exclusive: bool = True,
+        timeline: Optional[Timeline] = None,
+        before_release: Optional[Callable[[Dict[str, BaseComponent]], None]] = None,
+        backend: Optional[str] = None
 ) -> Iterator[List[BaseComponent]]:
     """Creates components based on the requested setup.
 
@@ -61,15 +95,171 @@ def acquire_components(
         pytest_config: A PyTest configuration object associated with current test.
         query: A query that describes the requested setup.
         exclusive (optional): Whether to lock the requested setup. Defaults to True.
+        timeline (optional): Records the wait for the manager, and the connection to and
+                             the hold of every component. Defaults to None, for no recording.
+        before_release (optional): Called with the components by their names once they are
+                                   no longer used, before they are closed, e.g. to collect
+                                   their artifacts. Defaults to None.
+        backend (optional): The backend of the RPyC components, e.g. a local one for
+                            development runs (see connections.BACKENDS). Defaults to None, in
+                            which case every component uses the backend of its section.
+
+    Yields:
+        The requested components.
+    """
+
+    with contextlib.ExitStack() as stack:
+        with _span(timeline, 'wait for manager', (TESTS_TRACK,), query=query):
+            available_components = stack.enter_context(
+                lego_manager.root.acquire_setup(query, exclusive, SESSION))
+
+        components = []
+        names = []
+        for component_name, component_path in available_components.items():
+            names.append(component_name)
+            with _span(timeline, 'connect', (TESTS_TRACK, component_name)) as args:
+                component = _get_component(
+                    component_name, component_path, pytest_config, backend)
+                # pylint: disable=protected-access
+                args.update(_connection_details(component._connection))
+            if timeline is not None:
+                # Closed after the component, so the hold covers the test and its teardown.
+                stack.enter_context(timeline.span('hold', (component_name,), query=query))
+            components.append(stack.enter_context(component))
+        yield components
+
+        if before_release is not None:
+            before_release(dict(zip(names, components)))
+
+
+@contextlib.asynccontextmanager
+async def acquire_components_async(
+        lego_manager: rpyc.Connection,
+        pytest_config: Any,
+        query: str,
+        exclusive: bool = True,
+        backend: Optional[str] = None
+) -> AsyncIterator[List[BaseComponent]]:
+    """Creates components based on the requested setup, without blocking the event loop.
+
+    The setup is requested from the lego manager and polled until it is granted, so a test can
+    wait for several setups at once, or do other work meanwhile. Cancelling the acquisition
+    withdraws the request from the manager. The components are built concurrently.
+
+    Example:
+        .. code-block:: python
+
+            async def check(query):
+                async with acquire_components_async(lego_manager, config, query) as components:
+                    ...
+
+            # Both setups are waited for at once.
+            await asyncio.gather(check('zebra.alice'), check('giraffe.bob'))
+
+    Args:
+        lego_manager: A lego manager instance.
+        pytest_config: A PyTest configuration object associated with current test.
+        query: A query that describes the requested setup.
+        exclusive (optional): Whether to lock the requested setup. Defaults to True.
+        backend (optional): The backend of the RPyC components (see connections.BACKENDS).
+                            Defaults to None, in which case every component uses the backend
+                            of its section.
 
     Yields:
         The requested components.
     """
 
-    with lego_manager.root.acquire_setup(query, exclusive) as available_components:
-        with contextlib.ExitStack() as stack:
-            components = []
-            for component_name, component_path in available_components.items():
-                component = _get_component(component_name, component_path, pytest_config)
-                components.append(stack.enter_context(component))
+    loop = asyncio.get_running_loop()
+    root = lego_manager.root
+
+    def call(function: Callable[..., Any], *args: Any) -> Awaitable[Any]:
+        # Every round trip and connection blocks, so it runs in the default executor.
+        return loop.run_in_executor(None, functools.partial(function, *args))
+
+    submission = asyncio.ensure_future(call(root.submit_setup, query, exclusive, SESSION))
+    try:
+        # Shielded, so a ticket which is issued after the acquisition is cancelled is released.
+        ticket = await asyncio.shield(submission)
+    except BaseException:
+        await asyncio.wait([submission])
+        if not submission.cancelled() and submission.exception() is None:
+            await asyncio.shield(call(root.release_setup, submission.result()))
+        raise
+
+    try:
+        interval = POLL_INTERVAL
+        available_components = await call(root.poll_setup, ticket)
+        while available_components is None:
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+            available_components = await call(root.poll_setup, ticket)
+
+        builds = [asyncio.ensure_future(
+                      call(_get_component, component_name, component_path, pytest_config, backend))
+                  for component_name, component_path in available_components]
+        try:
+            # Shielded, so the builds aren't abandoned when the acquisition is cancelled.
+            components = list(await asyncio.gather(*map(asyncio.shield, builds)))
+        except BaseException:
+            if builds:
+                await asyncio.wait(builds)
+            await _close_components(call, [
+                build.result() for build in builds if build.exception() is None])
+            raise
+
+        try:
             yield components
+        finally:
+            await _close_components(call, components)
+    finally:
+        # Withdraws the request if it is still pending.
+        await asyncio.shield(call(root.release_setup, ticket))
+
+
+async def _close_components(
+        call: Callable[..., Awaitable[Any]],
+        components: List[BaseComponent]
+) -> None:
+    """Closes components concurrently.
+
+    Args:
+        call: Runs a blocking function in the executor.
+        components: The components to close.
+    """
+
+    results = await asyncio.gather(
+        *(call(component.__exit__, None, None, None) for component in components),
+        return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        raise errors[0]
+
+
+def _span(timeline: Optional[Timeline], name: str, tracks: Iterable[str], **args: Any) -> Any:
+    """Records a span on the timeline, if there is one.
+
+    Returns:
+        A context manager which yields the arguments of the span.
+    """
+
+    if timeline is None:
+        return contextlib.nullcontext(args)
+
+    return timeline.span(name, tracks, **args)
+
+
+def _connection_details(connection: Any) -> Dict[str, Any]:
+    """Gets the path a connection took and its timings, if it raced several paths.
+
+    Args:
+        connection: Connection to a component.
+
+    Returns:
+        Arguments of the connection's span.
+    """
+
+    timings = getattr(connection, 'timings', None)
+    if not timings:
+        return {}
+
+    return {'path': connection.path, 'timings': dict(timings)}
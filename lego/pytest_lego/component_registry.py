@@ -0,0 +1,8 @@
+"""
+The registry of the components classes of the session, see Octavius.lego.component_registry.
+"""
+# pylint: disable=unused-import
+from Octavius.lego.component_registry import ENTRY_POINTS_GROUP, ComponentRegistry
+
+# The registry is shared by all of the tests in the session.
+registry = ComponentRegistry()
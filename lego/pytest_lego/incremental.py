@@ -0,0 +1,436 @@
+"""
+Incremental selection of lego tests by fingerprints.
+The fingerprint of a test covers everything its result depends on: the sources of the test
+module, of the project modules it uses (libs, components) and of the conftest files, the
+configuration file, and the software signatures of the components it acquired. The signatures
+are taken from the setup the test acquired, so whether the test changed is known once it is set
+up: a test that passed with the same fingerprint isn't run, it is either skipped or its cached
+result is replayed.
+
+The fingerprints and results are stored locally, in a JSON file next to the configuration file.
+Under pytest-xdist every worker writes its results to a file of its own, and the results are
+merged into the store when the session finishes.
+
+Example for configuration in pytest.ini:
+    [lego]
+    lego_incremental = replay
+    lego_fingerprints = .lego_fingerprints.json
+
+A full run is forced with '--lego-full-run'.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, TYPE_CHECKING
+import glob
+import hashlib
+import inspect
+import json
+import os
+import sys
+import time
+import types
+
+import pytest
+
+if TYPE_CHECKING:
+    from _pytest.nodes import Item
+    from _pytest.reports import TestReport
+
+# Unchanged tests are reported as skipped.
+SKIP = 'skip'
+# Unchanged tests are reported with their cached result, without running.
+REPLAY = 'replay'
+MODES = (SKIP, REPLAY)
+
+DEFAULT_STORE = '.lego_fingerprints.json'
+_STORE_VERSION = 1
+
+
+def _read(path: str) -> Dict[str, Dict[str, Any]]:
+    """Reads the results of a store file, a missing or corrupted file has none."""
+
+    try:
+        with open(path, encoding='utf-8') as store_file:
+            store = json.load(store_file)
+        if store.get('version') == _STORE_VERSION:
+            return store['tests']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    return dict()
+
+
+def _write(path: str, tests: Dict[str, Dict[str, Any]]) -> None:
+    """Writes the results to a store file, atomically."""
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as store_file:
+        json.dump({'version': _STORE_VERSION, 'tests': tests}, store_file, indent=1)
+    os.replace(temporary_path, path)
+
+
+class FingerprintStore:
+    """The local store of the tests fingerprints and results.
+
+    A pytest-xdist worker saves the results it recorded to a file of its own, next to the store.
+    The files of the workers are merged into the store when it is saved without a worker.
+
+    Attributes:
+        path: The JSON file of the store.
+        worker: The id of the pytest-xdist worker, None if the session doesn't run on one.
+    """
+
+    path: str
+    worker: Optional[str]
+
+    def __init__(self, path: str, worker: Optional[str] = None) -> None:
+        """Loads the store, a missing or corrupted store is empty.
+
+        Args:
+            path: The JSON file of the store.
+            worker: (optional) The id of the pytest-xdist worker. Defaults to None.
+        """
+
+        self.path = path
+        self.worker = worker
+        self._tests, _ = self._merged()
+        self._recorded: Dict[str, Dict[str, Any]] = dict()
+
+    def _worker_path(self, worker: str) -> str:
+        """Gets the file of the results a worker recorded."""
+
+        root, extension = os.path.splitext(self.path)
+        return f'{root}.{worker}{extension}'
+
+    def _merged(self) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """Reads the store and the files of the workers, the latest result of a test is kept.
+
+        Returns:
+            The results, and the files of the workers.
+        """
+
+        tests = _read(self.path)
+        root, extension = os.path.splitext(self.path)
+        worker_paths = sorted(glob.glob(f'{glob.escape(root)}.*{glob.escape(extension)}'))
+        for worker_path in worker_paths:
+            for nodeid, result in _read(worker_path).items():
+                if nodeid not in tests or tests[nodeid]['recorded'] < result['recorded']:
+                    tests[nodeid] = result
+
+        return tests, worker_paths
+
+    def get(self, nodeid: str) -> Optional[Dict[str, Any]]:
+        """Gets the last recorded result of a test.
+
+        Args:
+            nodeid: The test id.
+
+        Returns:
+            The fingerprint, outcome, duration and record time of the result, None if there
+            isn't any.
+        """
+
+        return self._tests.get(nodeid)
+
+    def record(self, nodeid: str, test_fingerprint: str, outcome: str, duration: float) -> None:
+        """Records the result of a test.
+
+        Args:
+            nodeid: The test id.
+            test_fingerprint: The fingerprint the test ran with.
+            outcome: The outcome of the test, e.g. 'passed'.
+            duration: Seconds the test took.
+        """
+
+        self._tests[nodeid] = self._recorded[nodeid] = {
+            'fingerprint': test_fingerprint, 'outcome': outcome, 'duration': duration,
+            'recorded': time.time()}
+
+    def save(self) -> None:
+        """Writes the recorded results, atomically.
+
+        A worker writes them to its own file. Otherwise they are written to the store, with the
+        results in the files of the workers, and the files of the workers are removed.
+        """
+
+        if self.worker is not None:
+            worker_path = self._worker_path(self.worker)
+            tests = _read(worker_path)
+            tests.update(self._recorded)
+            _write(worker_path, tests)
+            return
+
+        tests, worker_paths = self._merged()
+        tests.update(self._recorded)
+        _write(self.path, tests)
+        for worker_path in worker_paths:
+            try:
+                os.remove(worker_path)
+            except OSError:
+                pass
+
+
+def project_modules(module: types.ModuleType, root: str) -> List[types.ModuleType]:
+    """Finds the project modules a module depends on, transitively.
+
+    A module depends on the modules it imports, and on the modules of the classes and
+    functions it imports. Project modules are the ones under the root directory, excluding
+    installed packages.
+
+    Args:
+        module: The module.
+        root: The project root directory.
+
+    Returns:
+        The module and its dependencies, ordered by their names.
+    """
+
+    root = os.path.abspath(root)
+
+    def in_project(candidate: Optional[types.ModuleType]) -> bool:
+        path = getattr(candidate, '__file__', None)
+        if not path:
+            return False
+        path = os.path.abspath(path)
+        return path.startswith(root + os.sep) and 'site-packages' not in path
+
+    found = {module.__name__: module}
+    unvisited = [module]
+    while unvisited:
+        for value in list(vars(unvisited.pop()).values()):
+            dependency = value if isinstance(value, types.ModuleType) else \
+                sys.modules.get(getattr(value, '__module__', None) or '')
+            if dependency is not None and dependency.__name__ not in found and \
+                    in_project(dependency):
+                found[dependency.__name__] = dependency
+                unvisited.append(dependency)
+
+    return [found[name] for name in sorted(found)]
+
+
+def fingerprint(parts: Iterable[str]) -> str:
+    """Hashes the parts a test depends on.
+
+    Args:
+        parts: The sources and signatures.
+
+    Returns:
+        Hex digest of the parts.
+    """
+
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = part.encode(errors='replace')
+        # The length prefix keeps ('ab', 'c') and ('a', 'bc') apart.
+        digest.update(len(encoded).to_bytes(8, 'big'))
+        digest.update(encoded)
+
+    return digest.hexdigest()
+
+
+class IncrementalSelection:
+    """Pytest plugin which doesn't run tests whose fingerprint didn't change since they passed.
+
+    The sources of the tests are fingerprinted at collection, and the software signatures of
+    the components once they are acquired, so a test is skipped or replayed only after its
+    setup.
+
+    Attributes:
+        mode: How unchanged tests are reported, one of MODES.
+        full_run: Whether to run every test, and only record the fingerprints.
+        store: The fingerprints and results of the previous runs.
+    """
+
+    mode: str
+    full_run: bool
+    store: FingerprintStore
+
+    def __init__(self, config: Any, mode: str, store_path: str, full_run: bool) -> None:
+        """Initiates the plugin.
+
+        Args:
+            config: A PyTest configuration object.
+            mode: How unchanged tests are reported, one of MODES.
+            store_path: The JSON file of the store.
+            full_run: Whether to run every test, and only record the fingerprints.
+        """
+
+        if mode not in MODES:
+            raise ValueError(f'Unknown incremental mode {mode}, should be one of {MODES}')
+
+        self.mode = mode
+        self.full_run = full_run
+        self.store = FingerprintStore(
+            store_path, getattr(config, 'workerinput', {}).get('workerid'))
+        self._config = config
+        self._sources: Dict[str, str] = dict()
+        # The fingerprints of the sources of the collected tests.
+        self._sources_fingerprints: Dict[str, str] = dict()
+        # The software signatures of the components acquired by a test or a class, None if
+        # they couldn't be taken.
+        self._signatures: Dict[str, Optional[str]] = dict()
+        self._fingerprints: Dict[str, str] = dict()
+        self._unchanged: Set[str] = set()
+        self._outcomes: Dict[str, str] = dict()
+        self._durations: Dict[str, float] = dict()
+
+    def _source(self, module: types.ModuleType) -> str:
+        """Gets the source of a module, memoized for the session."""
+
+        if module.__name__ not in self._sources:
+            try:
+                self._sources[module.__name__] = inspect.getsource(module)
+            except (OSError, TypeError):
+                self._sources[module.__name__] = ''
+
+        return self._sources[module.__name__]
+
+    def _common_parts(self) -> List[str]:
+        """Gets the sources every test depends on: conftest files and the configuration."""
+
+        parts = []
+        for plugin in self._config.pluginmanager.get_plugins():
+            if isinstance(plugin, types.ModuleType) and \
+                    os.path.basename(getattr(plugin, '__file__', '') or '') == 'conftest.py':
+                parts.append(self._source(plugin))
+        parts.sort()
+
+        inifile = getattr(self._config, 'inipath', None) or getattr(self._config, 'inifile', None)
+        if inifile:
+            with open(str(inifile), encoding='utf-8') as config_file:
+                parts.append(config_file.read())
+
+        return parts
+
+    def _sources_fingerprint(self, item: Item, common_parts: List[str]) -> Optional[str]:
+        """Computes the fingerprint of the sources of a test.
+
+        Args:
+            item: The test.
+            common_parts: The sources every test depends on.
+
+        Returns:
+            The fingerprint, None if the test can't be fingerprinted and should always run.
+        """
+
+        module = getattr(item, 'module', None)
+        if module is None:
+            return None
+
+        parts = [item.nodeid] + common_parts
+        parts.extend(self._source(dependency)
+                     for dependency in project_modules(module, str(self._config.rootdir)))
+
+        return fingerprint(parts)
+
+    def _item_fingerprint(self, item: Item) -> Optional[str]:
+        """Computes the fingerprint of a test which is set up, from the fingerprint of its
+        sources and the signatures of the components it acquired.
+
+        Args:
+            item: The test.
+
+        Returns:
+            The fingerprint, None if the test can't be fingerprinted and should always run.
+        """
+
+        sources_fingerprint = self._sources_fingerprints.get(item.nodeid)
+        if sources_fingerprint is None:
+            return None
+
+        parts = [sources_fingerprint]
+        # The components of the class setup and of the test itself.
+        for node in item.listchain():
+            if node.nodeid not in self._signatures:
+                continue
+            signature = self._signatures[node.nodeid]
+            if signature is None:
+                return None
+            parts.append(signature)
+
+        return fingerprint(parts)
+
+    def acquired(self, node: Any, components: Iterable[Any]) -> None:
+        """Takes the software signature of components a test or a class acquired.
+
+        Args:
+            node: The test, or the class whose setup acquired the components.
+            components: The acquired components.
+        """
+
+        try:
+            self._signatures[node.nodeid] = '\n'.join(
+                component.software_signature() for component in components)
+        except Exception:  # pylint: disable=broad-except
+            # The test always runs.
+            self._signatures[node.nodeid] = None
+
+    def pytest_collection_modifyitems(self, session: Any, config: Any, items: List[Item]) -> None:
+        """Fingerprints the sources of the collected tests."""
+
+        common_parts = self._common_parts()
+        for item in items:
+            sources_fingerprint = self._sources_fingerprint(item, common_parts)
+            if sources_fingerprint is not None:
+                self._sources_fingerprints[item.nodeid] = sources_fingerprint
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_call(self, item: Item) -> None:
+        """Fingerprints a test which is set up, and skips it if it is unchanged."""
+
+        item_fingerprint = self._item_fingerprint(item)
+        self._signatures.pop(item.nodeid, None)
+        if item_fingerprint is None:
+            return
+        self._fingerprints[item.nodeid] = item_fingerprint
+
+        previous = self.store.get(item.nodeid)
+        if self.full_run or previous is None or previous['fingerprint'] != item_fingerprint \
+                or previous['outcome'] != 'passed':
+            return
+
+        self._unchanged.add(item.nodeid)
+        if self.mode == SKIP:
+            pytest.skip(f'lego: unchanged since it passed at {time.ctime(previous["recorded"])}')
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_pyfunc_call(self, pyfuncitem: Any) -> Optional[bool]:
+        """Doesn't call an unchanged test whose result is replayed."""
+
+        if pyfuncitem.nodeid in self._unchanged:
+            return True
+
+        return None
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item: Item, call: Any) -> Any:
+        """Reports the cached duration of a replayed test."""
+
+        outcome = yield
+        report = outcome.get_result()
+        if report.when == 'call' and item.nodeid in self._unchanged and self.mode == REPLAY:
+            previous = self.store.get(item.nodeid)
+            assert previous is not None
+            report.duration = previous['duration']
+            report.user_properties.append(('lego_replayed', previous['recorded']))
+
+    def pytest_runtest_logreport(self, report: TestReport) -> None:
+        """Collects the outcomes of the tests which ran."""
+
+        if report.nodeid not in self._fingerprints or report.nodeid in self._unchanged:
+            return
+
+        if report.failed:
+            self._outcomes[report.nodeid] = 'failed'
+        elif report.skipped:
+            self._outcomes.setdefault(report.nodeid, 'skipped')
+        elif report.when == 'call':
+            self._outcomes.setdefault(report.nodeid, 'passed')
+            self._durations[report.nodeid] = report.duration
+
+    def pytest_sessionfinish(self, session: Any) -> None:
+        """Stores the fingerprints and outcomes of the tests which ran."""
+
+        for nodeid, outcome in self._outcomes.items():
+            self.store.record(
+                nodeid, self._fingerprints[nodeid], outcome, self._durations.get(nodeid, 0.0))
+        self.store.save()
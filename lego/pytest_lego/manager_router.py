@@ -0,0 +1,355 @@
+"""
+Route queries between several lego managers, each of them owns a shard of the inventory.
+The router has the same API as an RPyC connection to a single LegoManager, so the rest of the
+plugin doesn't know whether the setup is sharded.
+
+A query which spans several shards is requested from all of their managers at once, in the
+order of the shards, so overlapping queries are queued in the same order by every manager.
+A shard's components are held while the other shards are waited for, and all of the shards
+are released if any of them fails, or if the acquisition is abandoned.
+
+Components without an instance name (e.g. 'zebra' or 'zebra*2') are owned by a single shard
+with the class sharding. With the instance sharding any shard may own instances of the class,
+so they are requested from every shard which accepts them, and the first shard to grant them
+provides them, the requests of the other shards are withdrawn.
+
+Example for configuration in pytest.ini:
+    [lego]
+    lego_manager_shards = central:18861, central:18862, backup:18861
+    lego_manager_sharding = class
+"""
+from __future__ import annotations
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Set, Tuple, TYPE_CHECKING
+import contextlib
+import json
+import time
+import uuid
+
+from Octavius.lego_manager.query import parse_query
+from Octavius.lego_manager.sharding import shard_of, BY_CLASS, BY_INSTANCE
+
+from .component_factory import MAX_POLL_INTERVAL, POLL_INTERVAL
+
+if TYPE_CHECKING:
+    import rpyc
+
+
+def parse_shards(description: str) -> List[Tuple[str, int]]:
+    """Parses the managers addresses from pytest configuration.
+
+    Args:
+        description: Comma separated managers addresses, ordered by their shard index.
+                     For example, 'central:18861, central:18862'.
+
+    Returns:
+        Hostname and port of every manager.
+    """
+
+    addresses = []
+    for address in description.split(','):
+        hostname, port = address.strip().rsplit(':', 1)
+        addresses.append((hostname, int(port)))
+
+    return addresses
+
+
+def _merge(
+        query: str,
+        shards: Sequence[int],
+        allocated: Mapping[int, Sequence[Tuple[str, str]]]
+) -> Tuple[Tuple[str, str], ...]:
+    """Merges the components which the shards granted back into the order of the query.
+
+    Args:
+        query: The query of the setup.
+        shards: The shard of every component of the query.
+        allocated: The granted components of every shard, in the order of its sub query.
+
+    Returns:
+        The components names and the corresponding paths to Components classes, in the order
+        of the query.
+
+    Raises:
+        ValueError: If a shard granted fewer components than it was asked for, e.g. for
+                    'zebra and zebra' from a manager without an inventory.
+    """
+
+    for shard, shard_components in allocated.items():
+        requested = shards.count(shard)
+        if len(shard_components) != requested:
+            raise ValueError(f'Shard {shard} granted {len(shard_components)} components for '
+                             f'{requested} terms of {query}, repeated terms of a class need '
+                             f'the inventory of its manager')
+
+    # Every shard returns its components in the order of its sub query.
+    remaining = {shard: iter(shard_components) for shard, shard_components in allocated.items()}
+    return tuple(next(remaining[shard]) for shard in shards)
+
+
+class _ShardedTicket:
+    """An asynchronous request which is split between shards."""
+
+    def __init__(
+            self,
+            query: str,
+            components: List[str],
+            shards: List[Optional[int]],
+            exclusive: bool,
+            session: Optional[str]
+    ) -> None:
+        self.query = query
+        self.components = components
+        # The shard of every component of the query, None for the components which any shard
+        # may provide, until one of the shards grants them.
+        self.shards = shards
+        self.exclusive = exclusive
+        self.session = session
+        # The tickets of the shards, and their sub queries.
+        self.sub_tickets: Dict[int, str] = dict()
+        self.sub_queries: Dict[int, str] = dict()
+        # The shards whose sub queries request the components which any shard may provide,
+        # until one of them is granted.
+        self.alternatives: Set[int] = set()
+        # The granted components of every shard, in the order of its sub query.
+        self.allocated: Dict[int, Tuple[Tuple[str, str], ...]] = dict()
+
+    def sub_query(self, shard: int, with_unowned: bool) -> str:
+        """Gets the sub query of a shard, in the order of the query.
+
+        Args:
+            shard: The index of the shard.
+            with_unowned: Whether to add the components which any shard may provide.
+        """
+
+        return ' and '.join(
+            component for component, component_shard in zip(self.components, self.shards)
+            if component_shard == shard or (with_unowned and component_shard is None))
+
+
+class ShardedLegoManager:
+    """Client side router of queries to sharded lego managers.
+
+    Attributes:
+        connections: RPyC connections to the managers, by their shard index.
+        sharding: How components are mapped to shards.
+    """
+
+    connections: Sequence[rpyc.Connection]
+    sharding: str
+
+    def __init__(self, connections: Sequence[rpyc.Connection], sharding: str = BY_CLASS) -> None:
+        """Initiates the router.
+
+        Args:
+            connections: RPyC connections to the managers, ordered by their shard index.
+            sharding (optional): How components are mapped to shards. Defaults to BY_CLASS.
+        """
+
+        self.connections = connections
+        self.sharding = sharding
+        self._tickets: Dict[str, _ShardedTicket] = dict()
+
+    @property
+    def root(self) -> ShardedLegoManager:
+        """Allows using the router like an RPyC connection to LegoManager."""
+
+        return self
+
+    @contextlib.contextmanager
+    def acquire_setup(
+            self,
+            query: str,
+            exclusive: bool,
+            session: Optional[str] = None
+    ) -> Iterator[Dict[str, str]]:
+        """Acquires the desired setup from the managers of its components.
+
+        The setup is requested from all of the managers at once, and polled until all of them
+        granted their components. The acquisition is all or nothing: if any of them fails,
+        the components of all of them are released.
+
+        Args:
+            query: A query that describes the desired setup.
+            exclusive: Whether the required setup is needed exclusively.
+            session (optional): Identifies the requesting test session. Defaults to None.
+
+        Yields:
+            Allocated components names and corresponding paths to Components classes,
+            in the order of the query.
+
+        Raises:
+            ValueError: If no shard accepts the query, or a shard granted fewer components
+                        than the query has for it.
+        """
+
+        ticket = self.submit_setup(query, exclusive, session)
+        try:
+            interval = POLL_INTERVAL
+            setup = self.poll_setup(ticket)
+            while setup is None:
+                time.sleep(interval)
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+                setup = self.poll_setup(ticket)
+
+            yield dict(setup)
+        finally:
+            self.release_setup(ticket)
+
+    def _split(self, query: str) -> Tuple[List[str], List[Optional[int]]]:
+        """Splits a query between the shards of its components.
+
+        Args:
+            query: A query that describes the desired setup.
+
+        Returns:
+            The components of the query, and the shard of every component, None for the
+            components which any shard may provide.
+        """
+
+        # A count term is split to a term of its class for every instance, which are
+        # resolved together by the manager which provides them.
+        components = parse_query(query)
+        shards: List[Optional[int]] = [
+            None if self.sharding == BY_INSTANCE and '.' not in component
+            else shard_of(component, len(self.connections), self.sharding)
+            for component in components]
+
+        return components, shards
+
+    def submit_setup(self, query: str, exclusive: bool, session: Optional[str] = None) -> str:
+        """Requests the desired setup without waiting for it, for asynchronous clients.
+
+        The sub queries are requested from all of their managers at once, in the order of
+        the shards. The components which any shard may provide are requested from every shard
+        which accepts them.
+
+        Args:
+            query: A query that describes the desired setup.
+            exclusive: Whether the required setup is needed exclusively.
+            session (optional): Identifies the requesting test session. Defaults to None.
+
+        Returns:
+            A ticket, which is polled until the setup is granted, and then released.
+
+        Raises:
+            ValueError: If no shard accepts the components which any shard may provide.
+        """
+
+        components, shards = self._split(query)
+        sharded_ticket = _ShardedTicket(query, components, shards, exclusive, session)
+        ticket = uuid.uuid4().hex
+        self._tickets[ticket] = sharded_ticket
+        try:
+            unowned = None in shards
+            rejection: Optional[ValueError] = None
+            for shard in range(len(self.connections)):
+                if unowned:
+                    try:
+                        self._submit(sharded_ticket, shard, with_unowned=True)
+                        sharded_ticket.alternatives.add(shard)
+                        continue
+                    except ValueError as error:
+                        # The shard doesn't own enough instances of the classes.
+                        rejection = error
+                if shard in shards:
+                    self._submit(sharded_ticket, shard, with_unowned=False)
+            if unowned and not sharded_ticket.alternatives:
+                assert rejection is not None
+                raise rejection
+        except BaseException:
+            self.release_setup(ticket)
+            raise
+
+        return ticket
+
+    def _submit(self, sharded_ticket: _ShardedTicket, shard: int, with_unowned: bool) -> None:
+        """Requests the sub query of a shard from its manager."""
+
+        sub_query = sharded_ticket.sub_query(shard, with_unowned)
+        sharded_ticket.sub_tickets[shard] = self.connections[shard].root.submit_setup(
+            sub_query, sharded_ticket.exclusive, sharded_ticket.session)
+        sharded_ticket.sub_queries[shard] = sub_query
+
+    def _release(self, sharded_ticket: _ShardedTicket, shard: int) -> None:
+        """Releases the ticket of a shard, or withdraws its pending sub query."""
+
+        sharded_ticket.allocated.pop(shard, None)
+        del sharded_ticket.sub_queries[shard]
+        self.connections[shard].root.release_setup(sharded_ticket.sub_tickets.pop(shard))
+
+    def poll_setup(self, ticket: str) -> Optional[Tuple[Tuple[str, str], ...]]:
+        """Checks whether the setup of a ticket was granted by all of the managers.
+
+        Once a shard grants the components which any shard may provide, the requests of the
+        other shards are withdrawn, and they are requested again for their own components.
+
+        Args:
+            ticket: The ticket of the request.
+
+        Returns:
+            None while the setup is pending. Once it is granted, the components names and the
+            corresponding paths to Components classes, in the order of the query.
+
+        Raises:
+            ValueError: If a shard granted fewer components than the query has for it.
+        """
+
+        sharded_ticket = self._tickets[ticket]
+        for shard in sorted(sharded_ticket.sub_tickets):
+            if shard not in sharded_ticket.allocated:
+                shard_components = self.connections[shard].root.poll_setup(
+                    sharded_ticket.sub_tickets[shard])
+                if shard_components is not None:
+                    sharded_ticket.allocated[shard] = shard_components
+
+        granted = sorted(sharded_ticket.alternatives.intersection(sharded_ticket.allocated))
+        if granted:
+            provider = granted[0]
+            for shard in sorted(sharded_ticket.alternatives - {provider}):
+                self._release(sharded_ticket, shard)
+                if shard in sharded_ticket.shards:
+                    self._submit(sharded_ticket, shard, with_unowned=False)
+            sharded_ticket.alternatives.clear()
+            sharded_ticket.shards = [provider if shard is None else shard
+                                     for shard in sharded_ticket.shards]
+
+        shards = [shard for shard in sharded_ticket.shards if shard is not None]
+        if len(shards) < len(sharded_ticket.shards) or \
+                len(sharded_ticket.allocated) < len(sharded_ticket.sub_tickets):
+            return None
+
+        return _merge(sharded_ticket.query, shards, sharded_ticket.allocated)
+
+    def release_setup(self, ticket: str) -> None:
+        """Releases the setup of a ticket, or withdraws its pending sub queries.
+
+        Args:
+            ticket: The ticket of the request.
+        """
+
+        sharded_ticket = self._tickets.pop(ticket)
+        for shard in sorted(sharded_ticket.sub_tickets, reverse=True):
+            self._release(sharded_ticket, shard)
+
+    def get_timeline(self, since: int = 0) -> str:
+        """Gets the recorded spans of all of the managers, as Chrome trace events.
+
+        Args:
+            since (optional): Only spans which ended since this time are returned, in wall clock
+                              microseconds. Defaults to all of the spans.
+
+        Returns:
+            JSON list of the trace events of the managers.
+        """
+
+        events = []
+        for connection in self.connections:
+            events.extend(json.loads(connection.root.get_timeline(since)))
+
+        return json.dumps(events)
+
+    def close(self) -> None:
+        """Closes the connections to all of the managers."""
+
+        for connection in self.connections:
+            connection.close()
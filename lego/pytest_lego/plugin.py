@@ -5,22 +5,26 @@ Pytest-lego plugin provides 'Components' objects representing different componen
 Every test function can use the lego mark: 'pytest.mark.lego(<components_list>)' and with lego plugin it will receive
 python objects which provides API to run code/commands on the requested components.
 """
-from typing import Any, List
+from typing import Any, Callable, List, Optional
 import functools
+import os
+import re
 
 import pytest
-import rpyc
 
 from . import component_factory
-from Octavius.lego.components import BaseComponent
 
 LEGO_MARK = 'lego'
 
 
 @pytest.fixture(scope='session')
-def lego_manager(request) -> rpyc.Connection:
+def lego_manager(request) -> 'rpyc.Connection':
     """Provides the connection to the lego manager.
 
+    If the inventory is sharded between several managers ('lego_manager_shards' option),
+    the connection routes every component of a query to the manager of its shard.
+    With a local backend, the session runs its own manager.
+
     Args:
         request: A PyTest fixture helper, with information on the requesting test function.
 
@@ -28,23 +32,66 @@ def lego_manager(request) -> rpyc.Connection:
         RPyC connection to LegoManager service.
     """
 
-    assert LEGO_MARK in request.config.inicfg.config.sections, f'Missing {LEGO_MARK} section in inifile'
+    lego_manager = _connect_lego_manager(request.config)
+    request.addfinalizer(lego_manager.close)
+    recorder = request.config.pluginmanager.get_plugin('lego_timeline')
+    if recorder is not None:
+        # Finalizers run in reverse order, so the timeline is fetched before the connection
+        # is closed.
+        request.addfinalizer(lambda: recorder.fetch_manager_timeline(lego_manager))
+
+    return lego_manager
+
+
+def _connect_lego_manager(config: Any) -> 'rpyc.Connection':
+    """Connects to the lego manager, or to the managers of the inventory shards.
+
+    Args:
+        config: A PyTest configuration object.
+
+    Returns:
+        RPyC connection to LegoManager service.
+    """
+
+    if _backend(config) not in (None, 'remote'):
+        import rpyc
+        from Octavius.lego_manager.inventory import Inventory
+        from Octavius.lego_manager.lego_manager import LegoManager
+
+        # Local components are private to the session, so there is nothing to share with
+        # other sessions, and the manager is served in a thread of this process. Its inventory
+        # is the components sections of the inifile.
+        inventory = Inventory.from_sections(
+            getattr(getattr(config.inicfg, 'config', None), 'sections', {}))
+        return rpyc.utils.factory.connect_thread(
+            remote_service=LegoManager(inventory=inventory),
+            remote_config={'allow_public_attrs': True})
+
+    assert LEGO_MARK in config.inicfg.config.sections, f'Missing {LEGO_MARK} section in inifile'
+    lego_config = config.inicfg.config.sections[LEGO_MARK]
+
+    # RPyC is imported only by sessions which actually use the lego manager.
+    import rpyc
+
+    if 'lego_manager_shards' in lego_config:
+        from .manager_router import ShardedLegoManager, parse_shards
+
+        return ShardedLegoManager(
+            [rpyc.connect(hostname, port) for hostname, port in parse_shards(lego_config['lego_manager_shards'])],
+            lego_config.get('lego_manager_sharding', 'class'))
 
     try:
-        manager_hostname = request.config.inicfg.config.sections[LEGO_MARK]['lego_manager_hostname']
-        manager_port = request.config.inicfg.config.sections[LEGO_MARK]['lego_manager_port']
+        manager_hostname = lego_config['lego_manager_hostname']
+        manager_port = lego_config['lego_manager_port']
     except KeyError as e:
         missing_key = e.args[0]
         raise KeyError(f'Missing {missing_key} under {LEGO_MARK} section in inifile')
 
-    lego_manager = rpyc.connect(manager_hostname, manager_port)
-    request.addfinalizer(lego_manager.close)
-
-    return lego_manager
+    return rpyc.connect(manager_hostname, manager_port)
 
 
 @pytest.fixture(scope='function')
-def components(request, lego_manager) -> List[BaseComponent]:
+def components(request, lego_manager) -> List['BaseComponent']:
     """Provides the components requested in corresponding lego mark for the test.
 
     This fixture provides the components requested by the test function.
@@ -82,17 +129,165 @@ def components(request, lego_manager) -> List[BaseComponent]:
         # There is no resources to free.
         return
 
+    def failed() -> bool:
+        reports = (getattr(request.node, f'lego_report_{when}', None) for when in ('setup', 'call'))
+        return any(report is not None and report.failed for report in reports)
+
     with component_factory.acquire_components(
             lego_manager,
             request.config,
             *lego_mark.args,
+            timeline=_timeline(request.config),
+            before_release=_artifacts_collector(request, failed),
+            backend=_backend(request.config),
             **lego_mark.kwargs
     ) as components:
+        _record_signatures(request, components)
         yield components
 
 
+def _lego_option(config: Any, name: str, default: Any = None) -> Any:
+    """Gets an option from the lego section of the inifile.
+
+    Args:
+        config: A PyTest configuration object.
+        name: The option name.
+        default (optional): The value if the option is missing. Defaults to None.
+    """
+
+    sections = getattr(getattr(config.inicfg, 'config', None), 'sections', {})
+    return sections.get(LEGO_MARK, {}).get(name, default)
+
+
+def _backend(config: Any) -> Optional[str]:
+    """Gets the backend of the session's RPyC components, if it overrides their sections.
+
+    Args:
+        config: A PyTest configuration object.
+    """
+
+    return config.getoption('lego_backend') or _lego_option(config, 'lego_backend')
+
+
+def _timeline(config: Any) -> Optional['Timeline']:
+    """Gets the timeline of the session, if it is recorded.
+
+    Args:
+        config: A PyTest configuration object.
+    """
+
+    recorder = config.pluginmanager.get_plugin('lego_timeline')
+    return None if recorder is None else recorder.timeline
+
+
+def _artifacts_collector(request, failed: Callable[[], bool]) -> Optional[Callable[[dict], None]]:
+    """Creates a collector of the artifacts of the components of a test, or a test class.
+
+    The artifacts are collected when the test failed, or always, by the lego_artifacts option,
+    the collection is disabled by default. They are archived into a directory per test, under lego_artifacts_dir.
+
+    Example for configuration in pytest.ini:
+        [lego]
+        lego_artifacts = on-failure
+        lego_artifacts_dir = lego_artifacts
+        lego_artifacts_files =
+            /var/log/syslog
+            /tmp/*.log
+        lego_artifacts_commands =
+            dmesg | tail -n 100
+        lego_artifacts_max_bytes = 67108864
+        lego_artifacts_timeout = 30
+
+    Args:
+        request: A PyTest fixture helper, with information on the requesting test.
+        failed: Checks whether the test failed, once its components are no longer used.
+
+    Returns:
+        The collector, called with the components by their names before they are released,
+        None if the collection is disabled.
+    """
+
+    config = request.config
+    mode = config.getoption('lego_artifacts') or _lego_option(config, 'lego_artifacts', 'never')
+    if mode == 'never':
+        return None
+
+    def lines(name: str) -> List[str]:
+        return [line.strip() for line in _lego_option(config, name, '').splitlines() if line.strip()]
+
+    def collect_artifacts(components: dict) -> None:
+        if mode != 'always' and not failed():
+            return
+
+        from Octavius.lego import artifacts
+
+        directory = os.path.join(
+            str(config.rootdir), _lego_option(config, 'lego_artifacts_dir', 'lego_artifacts'),
+            re.sub(r'[^\w.-]+', '_', request.node.nodeid))
+        artifacts.collect(
+            components, directory, lines('lego_artifacts_files'), lines('lego_artifacts_commands'),
+            int(_lego_option(config, 'lego_artifacts_max_bytes', artifacts.DEFAULT_MAX_BYTES)),
+            float(_lego_option(config, 'lego_artifacts_timeout', artifacts.DEFAULT_TIMEOUT)))
+
+    return collect_artifacts
+
+
+def _record_signatures(request: Any, components: List['BaseComponent']) -> None:
+    """Passes the acquired components to the incremental selection, if it is enabled.
+
+    Args:
+        request: A PyTest fixture helper, of the test or the class which acquired the components.
+        components: The acquired components.
+    """
+
+    incremental = request.config.pluginmanager.get_plugin('lego_incremental')
+    if incremental is not None:
+        incremental.acquired(request.node, components)
+
+
+def pytest_addoption(parser: Any) -> None:
+    """Adds the lego options.
+
+    Args:
+        parser: A PyTest options parser.
+    """
+
+    group = parser.getgroup(LEGO_MARK)
+    group.addoption(
+        '--lego-incremental', choices=('skip', 'replay'), default=None,
+        help="Don't run tests which passed and didn't change since, by the fingerprint of their "
+             "sources and of their components' software: 'skip' reports them as skipped, "
+             "'replay' reports their cached result. Defaults to lego_incremental in the inifile.")
+    group.addoption(
+        '--lego-full-run', action='store_true', default=False,
+        help='Run every test, even with incremental selection, and record the fingerprints.')
+    group.addoption(
+        '--lego-artifacts', choices=('on-failure', 'always', 'never'), default=None,
+        help='When to collect the artifacts (files and commands outputs) of the components of '
+             'a test, in parallel. Defaults to lego_artifacts in the inifile, or never.')
+    group.addoption(
+        '--lego-backend', metavar='BACKEND', default=None,
+        help="Run every RPyC component on a backend: 'remote' (the lab), 'local_thread' or "
+             "'local_process' (served on this machine, with a manager of the session), for fast "
+             "development runs. Defaults to lego_backend in the inifile, or to the backend in "
+             "the section of every component.")
+    group.addoption(
+        '--lego-timeline', metavar='PATH', default=None,
+        help='Export the timeline of the tests phases, components and lego manager as a Chrome '
+             'trace (chrome://tracing, ui.perfetto.dev). Defaults to lego_timeline in the inifile.')
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    """Keeps the reports of the test phases on the test, for the artifacts collection."""
+
+    outcome = yield
+    report = outcome.get_result()
+    setattr(item, f'lego_report_{report.when}', report)
+
+
 def pytest_configure(config: Any) -> None:
-    """Adds the lego mark.
+    """Adds the lego mark, and the incremental selection and the timeline if they are enabled.
 
     Args:
         config: A PyTest configuration object.
@@ -103,6 +298,23 @@ def pytest_configure(config: Any) -> None:
         f'{LEGO_MARK}: Lego mark used in order to supply components by query'
     )
 
+    mode = config.getoption('lego_incremental') or _lego_option(config, 'lego_incremental')
+    if mode:
+        from .incremental import DEFAULT_STORE, IncrementalSelection
+
+        store_path = os.path.join(
+            str(config.rootdir), _lego_option(config, 'lego_fingerprints', DEFAULT_STORE))
+        config.pluginmanager.register(IncrementalSelection(
+            config, mode, store_path, config.getoption('lego_full_run')), 'lego_incremental')
+
+    timeline_path = config.getoption('lego_timeline') or _lego_option(config, 'lego_timeline')
+    if timeline_path:
+        from .tracing import TimelineRecorder
+
+        config.pluginmanager.register(
+            TimelineRecorder(config, os.path.join(str(config.rootdir), timeline_path)),
+            'lego_timeline')
+
 
 @pytest.mark.tryfirst
 def pytest_fixture_setup(fixturedef, request):
@@ -125,12 +337,19 @@ def pytest_fixture_setup(fixturedef, request):
     @functools.wraps(fixturedef.func)
     def setup_class_wrapper(*args, **kwargs):
         lego_manager = request.getfixturevalue('lego_manager')
+        # The class failed if any of its tests failed.
+        failures = request.session.testsfailed
         with component_factory.acquire_components(
                 lego_manager,
                 request.config,
                 *lego_mark.args,
+                timeline=_timeline(request.config),
+                before_release=_artifacts_collector(
+                    request, lambda: request.session.testsfailed > failures),
+                backend=_backend(request.config),
                 **lego_mark.kwargs
         ) as wrapped_components:
+            _record_signatures(request, wrapped_components)
             test_class.setup_class(wrapped_components, *args, **kwargs)
             try:
                 yield
@@ -0,0 +1,96 @@
+"""
+Timeline of the lego tests, exported as a Chrome trace at the end of the session.
+Every test process records the setup, call and teardown of its tests on its 'tests' track, and
+the waits for the manager, the connections to the components and their holds on the track of
+every component. The spans of the lego manager are fetched at the end of the session, so the
+trace shows where the session spent its time on both sides.
+
+Example for configuration in pytest.ini:
+    [lego]
+    lego_timeline = lego_timeline.json
+
+With pytest-xdist, every worker exports its own trace, e.g. lego_timeline.gw0.json.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional
+import json
+import os
+
+import pytest
+
+from Octavius.lego_manager.timeline import Timeline, now
+
+# The track of the tests phases, in the process of the test worker.
+TESTS_TRACK = 'tests'
+
+
+class TimelineRecorder:
+    """Pytest plugin which records the timeline of the session, and exports it.
+
+    Attributes:
+        path: The exported trace file.
+        timeline: The spans of this test process.
+    """
+
+    path: str
+    timeline: Timeline
+
+    def __init__(self, config: Any, path: str) -> None:
+        """Initiates the plugin.
+
+        Args:
+            config: A PyTest configuration object.
+            path: The exported trace file.
+        """
+
+        worker = getattr(config, 'workerinput', {}).get('workerid')
+        if worker is not None:
+            root, extension = os.path.splitext(path)
+            path = f'{root}.{worker}{extension}'
+
+        self.path = path
+        self.timeline = Timeline(f'pytest {worker or "main"}')
+        self._start = now()
+        self._manager_events: List[Dict[str, Any]] = []
+
+    def fetch_manager_timeline(self, lego_manager: Any) -> None:
+        """Fetches the spans the lego manager recorded during the session.
+
+        Args:
+            lego_manager: A connection to the lego manager.
+        """
+
+        try:
+            self._manager_events = json.loads(lego_manager.root.get_timeline(self._start))
+        except AttributeError:
+            # The manager doesn't record a timeline.
+            pass
+
+    def _phase(self, item: Any, when: str) -> Iterator[None]:
+        """Records a phase of a test around the hook implementations."""
+
+        with self.timeline.span(when, (TESTS_TRACK,), test=item.nodeid):
+            yield
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_setup(self, item: Any) -> Iterator[None]:
+        """Records the setup of a test, which includes acquiring its components."""
+
+        yield from self._phase(item, 'setup')
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item: Any) -> Iterator[None]:
+        """Records the call of a test."""
+
+        yield from self._phase(item, 'call')
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_teardown(self, item: Any, nextitem: Optional[Any]) -> Iterator[None]:
+        """Records the teardown of a test, which includes releasing its components."""
+
+        yield from self._phase(item, 'teardown')
+
+    def pytest_sessionfinish(self, session: Any) -> None:
+        """Exports the trace of the session."""
+
+        self.timeline.export(self.path, self._manager_events)
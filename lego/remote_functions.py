@@ -0,0 +1,151 @@
+"""
+Remote execution of local functions on a component.
+Running logic on a component through RPyC netrefs costs a network round trip for every
+attribute access and call, so a loop over remote data costs a round trip per iteration.
+Instead, the source of a local function is shipped to the component, where it is compiled
+once and cached by the hash of its source. Every call is then a single round trip: the
+arguments and the result are pickled and passed by value.
+
+The source of the function is sent along with its first call only, or again if the component
+lost its cache. It is compiled with the builtins as its globals, so the function should be pure:
+it can't be a closure or a lambda, and it should import the modules it uses inside its body.
+The module is executed on the remote side as is, so it must use only the standard library.
+
+Usage example:
+    def count_errors(path):
+        with open(path) as log:
+            return sum('ERROR' in line for line in log)
+
+    assert giraffe.run_remote(count_errors, '/var/log/tool.log') == 0
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, Optional, Set, Tuple, TYPE_CHECKING
+import ast
+import builtins
+import hashlib
+import inspect
+import pickle
+import sys
+import textwrap
+import types
+
+if TYPE_CHECKING:
+    import rpyc
+
+# Supported by every Python 3 the components may run.
+PICKLE_PROTOCOL = 4
+
+
+def function_source(func: Callable[..., Any]) -> Tuple[str, str]:
+    """Gets the source of a function's definition, without its decorators.
+
+    Args:
+        func: A pure function, or a wrapper of one, like functools.wraps makes.
+
+    Returns:
+        The name of the function, and the source which defines it.
+
+    Raises:
+        TypeError: If the function can't be executed remotely.
+    """
+
+    func = inspect.unwrap(func)
+    if not isinstance(func, types.FunctionType) or func.__name__ == '<lambda>':
+        raise TypeError(f'Only functions defined with def can be run remotely, not {func!r}')
+    if func.__code__.co_freevars:
+        raise TypeError(f'{func.__qualname__} is a closure of {func.__code__.co_freevars}, '
+                        'which can not be run remotely')
+
+    source = textwrap.dedent(inspect.getsource(func))
+    definition = ast.parse(source).body[0]
+    if not isinstance(definition, ast.FunctionDef):
+        raise TypeError(f'Only functions defined with def can be run remotely, not {func!r}')
+
+    # Decorators are local, the definition starts at the def line.
+    return func.__name__, ''.join(source.splitlines(keepends=True)[definition.lineno - 1:])
+
+
+class RemoteFunctions:
+    """The functions cache running on the component, with the builtins as their globals."""
+
+    def __init__(self) -> None:
+        self._functions: Dict[str, Callable[..., Any]] = dict()
+
+    def call(
+            self,
+            digest: str,
+            name: str,
+            source: Optional[str],
+            payload: bytes
+    ) -> Optional[bytes]:
+        """Calls a cached function, after compiling it if its source is given.
+
+        Args:
+            digest: The hash of the function's source.
+            name: The function name.
+            source: The function's source, if it isn't cached yet.
+            payload: The pickled positional and keyword arguments.
+
+        Returns:
+            The pickled result, None if the function isn't cached and its source isn't given.
+        """
+
+        if digest not in self._functions:
+            if source is None:
+                return None
+            namespace: Dict[str, Any] = {'__builtins__': builtins, '__name__': __name__}
+            # pylint: disable=exec-used
+            exec(compile(source, f'<remote {name}>', 'exec'), namespace)
+            self._functions[digest] = namespace[name]
+
+        args, kwargs = pickle.loads(payload)
+        return pickle.dumps(self._functions[digest](*args, **kwargs), PICKLE_PROTOCOL)
+
+
+class FunctionRunner:
+    """Client of a RemoteFunctions cache running on a component."""
+
+    def __init__(self, connection: rpyc.Connection) -> None:
+        """Uploads the functions cache to the component.
+
+        Args:
+            connection: Classic RPyC connection to the component.
+        """
+
+        from .supervisor import upload_module  # pylint: disable=import-outside-toplevel
+
+        r_functions = upload_module(connection, sys.modules[__name__]).RemoteFunctions()
+        # Every attribute access of a netref is a round trip, so the method is fetched once.
+        self._r_call = r_functions.call
+        # Hash, name and source of every function which ran.
+        self._sources: Dict[Callable[..., Any], Tuple[str, str, str]] = dict()
+        # Hashes of the functions cached on the component.
+        self._shipped: Set[str] = set()
+
+    def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Runs a function on the component, in a single round trip.
+
+        Args:
+            func: A pure function, its arguments and result must be picklable.
+            args: Positional arguments of the function.
+            kwargs: Keyword arguments of the function.
+
+        Returns:
+            The result of the function.
+        """
+
+        if func not in self._sources:
+            name, source = function_source(func)
+            self._sources[func] = (hashlib.sha256(source.encode()).hexdigest(), name, source)
+        digest, name, source = self._sources[func]
+
+        payload = pickle.dumps((args, kwargs), PICKLE_PROTOCOL)
+        result = None
+        if digest in self._shipped:
+            result = self._r_call(digest, name, None, payload)
+        if result is None:
+            # Not shipped yet, or the cache of the component was lost (e.g. it restarted).
+            result = self._r_call(digest, name, source, payload)
+            self._shipped.add(digest)
+
+        return pickle.loads(result)
@@ -0,0 +1,414 @@
+"""
+Supervisor of processes on a remote component.
+Starting a tool through RPyC netrefs costs a network round trip for every attribute and call,
+and callbacks such as preexec_fn are called back across the network. Instead, this module is
+uploaded once to the component, and a supervisor object runs there: it starts processes,
+buffers their output and kills them, and every operation on many processes is a single call
+whose arguments and results are passed by value.
+
+The module is executed on the remote side as is, so it must use only the standard library.
+
+Exited processes are kept for their return codes and output until they are forgotten. Only the
+last max_exited of them are kept, the older ones are dropped when new processes are started.
+
+Usage example:
+    tools = giraffe.supervisor.start_many(['ncat -l 1337 --udp', 'ncat -l 1338 --udp'])
+    ...
+    giraffe.supervisor.kill(tools, signal.SIGINT)
+    giraffe.supervisor.wait(tools)
+"""
+from __future__ import annotations
+from typing import (
+    Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union, TYPE_CHECKING)
+import inspect
+import itertools
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import types
+
+if TYPE_CHECKING:
+    import rpyc
+
+# Bytes of output kept for every stream of a process.
+DEFAULT_BUFFER_SIZE = 64 * 1024
+# Exited processes kept for their return codes and output, until they are forgotten.
+DEFAULT_MAX_EXITED = 256
+
+# A command is either a shell command line or the arguments of the program.
+Command = Union[str, Sequence[str]]
+
+
+def upload_module(connection: rpyc.Connection, module: types.ModuleType) -> Any:
+    """Executes the source of a local module on the component, as a new module.
+
+    Args:
+        connection: Classic RPyC connection to the component.
+        module: A module which uses only the standard library.
+
+    Returns:
+        A netref to the remote module.
+    """
+
+    r_module = connection.modules['types'].ModuleType(module.__name__.rsplit('.', 1)[-1])
+    connection.builtins.exec(inspect.getsource(module), r_module.__dict__)
+    return r_module
+
+
+class _RingBuffer:
+    """Keeps the last bytes written to it."""
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._data = bytearray()
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes) -> None:
+        with self._lock:
+            self._data += data
+            if len(self._data) > self._size:
+                del self._data[:len(self._data) - self._size]
+
+    def read(self) -> bytes:
+        with self._lock:
+            return bytes(self._data)
+
+
+class _SupervisedProcess:
+    """A process started by the remote supervisor, and the buffers of its output."""
+
+    def __init__(self, command: Command, cwd: Optional[str], env: Optional[Dict[str, str]],
+                 buffer_size: int) -> None:
+        # A new session allows killing the process with all of its children.
+        self.process = subprocess.Popen(
+            command, shell=isinstance(command, str), cwd=cwd, env=env,
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True)
+        self.stdout = _RingBuffer(buffer_size)
+        self.stderr = _RingBuffer(buffer_size)
+        self._readers = [
+            threading.Thread(target=self._read, args=(stream, buffer), daemon=True)
+            for stream, buffer in ((self.process.stdout, self.stdout),
+                                   (self.process.stderr, self.stderr))]
+        for reader in self._readers:
+            reader.start()
+
+    @staticmethod
+    def _read(stream, buffer: _RingBuffer) -> None:  # type: ignore
+        with stream:
+            for chunk in iter(lambda: os.read(stream.fileno(), 4096), b''):
+                buffer.write(chunk)
+
+    def join_readers(self, timeout: Optional[float]) -> None:
+        """Waits for the rest of the output, children of the process may still hold it open."""
+
+        for reader in self._readers:
+            reader.join(timeout)
+
+
+class RemoteSupervisor:
+    """The supervisor which runs on the component, it is used only through Supervisor."""
+
+    def __init__(self, max_exited: int = DEFAULT_MAX_EXITED) -> None:
+        self._processes: Dict[int, _SupervisedProcess] = dict()
+        self._ids = itertools.count(1)
+        self._max_exited = max_exited
+
+    def _get(self, process_id: int) -> _SupervisedProcess:
+        """Gets a process by its id."""
+
+        try:
+            return self._processes[process_id]
+        except KeyError:
+            raise KeyError(f'Process {process_id} exited and was dropped') from None
+
+    def _drop_exited(self) -> None:
+        """Drops the oldest exited processes beyond max_exited."""
+
+        exited = [process_id for process_id, supervised in self._processes.items()
+                  if supervised.process.poll() is not None]
+        for process_id in exited[:max(len(exited) - self._max_exited, 0)]:
+            del self._processes[process_id]
+
+    def start(
+            self,
+            commands: Sequence[Command],
+            cwd: Optional[str],
+            env: Optional[Sequence[Tuple[str, str]]],
+            buffer_size: int
+    ) -> Tuple[Tuple[int, int], ...]:
+        """Starts processes, and returns the id and pid of every process."""
+
+        self._drop_exited()
+        environment = None if env is None else dict(os.environ, **dict(env))
+        started = []
+        for command in commands:
+            process_id = next(self._ids)
+            self._processes[process_id] = _SupervisedProcess(
+                command, cwd, environment, buffer_size)
+            started.append((process_id, self._processes[process_id].process.pid))
+
+        return tuple(started)
+
+    def status(self, process_ids: Sequence[int]) -> Tuple[Optional[int], ...]:
+        """Gets the return codes of processes, None for running processes."""
+
+        return tuple(self._get(process_id).process.poll() for process_id in process_ids)
+
+    def output(self, process_ids: Sequence[int]) -> Tuple[Tuple[bytes, bytes], ...]:
+        """Gets the buffered stdout and stderr of processes."""
+
+        return tuple((self._get(process_id).stdout.read(), self._get(process_id).stderr.read())
+                     for process_id in process_ids)
+
+    def kill(self, process_ids: Sequence[int], signal_number: int) -> None:
+        """Sends a signal to the process groups of running processes."""
+
+        for process_id in process_ids:
+            process = self._get(process_id).process
+            if process.poll() is None:
+                try:
+                    os.killpg(process.pid, signal_number)
+                except ProcessLookupError:
+                    # Exited after it was polled.
+                    pass
+
+    def wait(
+            self,
+            process_ids: Sequence[int],
+            timeout: Optional[float]
+    ) -> Tuple[Optional[int], ...]:
+        """Waits for processes to exit, and returns their return codes (None on timeout)."""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for process_id in process_ids:
+            supervised = self._get(process_id)
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                supervised.process.wait(remaining)
+            except subprocess.TimeoutExpired:
+                continue
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            supervised.join_readers(remaining)
+
+        return self.status(process_ids)
+
+    def forget(self, process_ids: Sequence[int]) -> None:
+        """Drops exited processes and their buffers."""
+
+        for process_id in process_ids:
+            supervised = self._processes.get(process_id)
+            if supervised is not None and supervised.process.poll() is not None:
+                del self._processes[process_id]
+
+    def running(self) -> Tuple[int, ...]:
+        """Gets the ids of the running processes."""
+
+        return tuple(process_id for process_id, supervised in self._processes.items()
+                     if supervised.process.poll() is None)
+
+
+class ProcessHandle(NamedTuple):
+    """A lightweight handle of a supervised process, operations on it are a single call.
+
+    Attributes:
+        supervisor: The supervisor which started the process.
+        process_id: The id of the process in the supervisor.
+        pid: The pid of the process on the component.
+    """
+
+    supervisor: Supervisor
+    process_id: int
+    pid: int
+
+    def status(self) -> Optional[int]:
+        """Gets the return code of the process, None if it is still running."""
+
+        return self.supervisor.status([self])[0]
+
+    def output(self) -> Tuple[bytes, bytes]:
+        """Gets the last buffered stdout and stderr of the process."""
+
+        return self.supervisor.output([self])[0]
+
+    def kill(self, signal_number: int = signal.SIGTERM) -> None:
+        """Sends a signal to the process and its children.
+
+        Args:
+            signal_number (optional): The signal to send. Defaults to SIGTERM.
+        """
+
+        self.supervisor.kill([self], signal_number)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        """Waits for the process to exit.
+
+        Args:
+            timeout (optional): Seconds to wait. Defaults to forever.
+
+        Returns:
+            The return code of the process, None if it is still running.
+        """
+
+        return self.supervisor.wait([self], timeout)[0]
+
+
+class Supervisor:
+    """Client of a RemoteSupervisor running on a component.
+
+    Attributes:
+        buffer_size: Bytes of output kept for every stream of a process.
+    """
+
+    buffer_size: int
+
+    def __init__(
+            self,
+            connection: rpyc.Connection,
+            buffer_size: int = DEFAULT_BUFFER_SIZE,
+            max_exited: int = DEFAULT_MAX_EXITED
+    ) -> None:
+        """Uploads the supervisor to the component, and starts it.
+
+        Args:
+            connection: Classic RPyC connection to the component.
+            buffer_size (optional): Bytes of output kept for every stream of a process.
+                                    Defaults to DEFAULT_BUFFER_SIZE.
+            max_exited (optional): Exited processes which are kept until they are forgotten,
+                                   older ones are dropped. Defaults to DEFAULT_MAX_EXITED.
+        """
+
+        self.buffer_size = buffer_size
+        r_supervisor = upload_module(
+            connection, sys.modules[__name__]).RemoteSupervisor(max_exited)
+        # Every attribute access of a netref is a round trip, so the methods are fetched once.
+        self._r_start = r_supervisor.start
+        self._r_status = r_supervisor.status
+        self._r_output = r_supervisor.output
+        self._r_kill = r_supervisor.kill
+        self._r_wait = r_supervisor.wait
+        self._r_forget = r_supervisor.forget
+        self._r_running = r_supervisor.running
+
+    @staticmethod
+    def _ids(handles: Iterable[ProcessHandle]) -> Tuple[int, ...]:
+        """Tuples are passed by value by RPyC, unlike lists which become netrefs."""
+
+        return tuple(handle.process_id for handle in handles)
+
+    def start(
+            self,
+            command: Command,
+            cwd: Optional[str] = None,
+            env: Optional[Dict[str, str]] = None
+    ) -> ProcessHandle:
+        """Starts a process on the component.
+
+        Args:
+            command: A shell command line, or the arguments of the program.
+            cwd (optional): Working directory of the process. Defaults to the service's.
+            env (optional): Variables to add to the environment of the process.
+
+        Returns:
+            A handle of the started process.
+        """
+
+        return self.start_many([command], cwd, env)[0]
+
+    def start_many(
+            self,
+            commands: Sequence[Command],
+            cwd: Optional[str] = None,
+            env: Optional[Dict[str, str]] = None
+    ) -> List[ProcessHandle]:
+        """Starts processes on the component in a single call.
+
+        Args:
+            commands: Shell command lines, or the arguments of the programs.
+            cwd (optional): Working directory of the processes. Defaults to the service's.
+            env (optional): Variables to add to the environment of the processes.
+
+        Returns:
+            Handles of the started processes, in the order of the commands.
+        """
+
+        commands = tuple(command if isinstance(command, str) else tuple(command)
+                         for command in commands)
+        environment = None if env is None else tuple(env.items())
+        started = self._r_start(commands, cwd, environment, self.buffer_size)
+        return [ProcessHandle(self, process_id, pid) for process_id, pid in started]
+
+    def status(self, handles: Iterable[ProcessHandle]) -> List[Optional[int]]:
+        """Gets the return codes of processes, None for running processes.
+
+        Args:
+            handles: The processes.
+        """
+
+        return list(self._r_status(self._ids(handles)))
+
+    def output(self, handles: Iterable[ProcessHandle]) -> List[Tuple[bytes, bytes]]:
+        """Gets the last buffered stdout and stderr of processes.
+
+        Args:
+            handles: The processes.
+        """
+
+        return list(self._r_output(self._ids(handles)))
+
+    def kill(self, handles: Iterable[ProcessHandle], signal_number: int = signal.SIGTERM) -> None:
+        """Sends a signal to processes and their children.
+
+        Args:
+            handles: The processes.
+            signal_number (optional): The signal to send. Defaults to SIGTERM.
+        """
+
+        self._r_kill(self._ids(handles), int(signal_number))
+
+    def wait(
+            self,
+            handles: Iterable[ProcessHandle],
+            timeout: Optional[float] = None
+    ) -> List[Optional[int]]:
+        """Waits for processes to exit.
+
+        Args:
+            handles: The processes.
+            timeout (optional): Seconds to wait for all of the processes. Defaults to forever.
+
+        Returns:
+            The return codes of the processes, None for processes which are still running.
+        """
+
+        return list(self._r_wait(self._ids(handles), timeout))
+
+    def forget(self, handles: Iterable[ProcessHandle]) -> None:
+        """Frees the buffers of exited processes, which are otherwise kept until max_exited
+        newer processes exit.
+
+        Args:
+            handles: The processes.
+        """
+
+        self._r_forget(self._ids(handles))
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Kills the processes which are still running.
+
+        Args:
+            timeout (optional): Seconds to wait for the processes to exit after SIGTERM,
+                                before they are killed. Defaults to 5.
+        """
+
+        running = self._r_running()
+        if not running:
+            return
+
+        self._r_kill(running, int(signal.SIGTERM))
+        if None in self._r_wait(running, timeout):
+            self._r_kill(running, int(signal.SIGKILL))
+            self._r_wait(running, timeout)
@@ -0,0 +1,28 @@
+# type: ignore
+# pylint: skip-file
+import threading
+import time
+
+import pytest
+from rpyc.utils.server import ThreadedServer
+
+
+@pytest.fixture
+def serve():
+    """Serves RPyC services on local ports, in threads, and closes the servers after the test."""
+    servers = []
+
+    def serve(service, **kwargs):
+        server = ThreadedServer(service, hostname='127.0.0.1', port=0, **kwargs)
+        servers.append(server)
+        threading.Thread(target=server.start, daemon=True).start()
+        # The server listens once it starts, connecting before that is refused.
+        deadline = time.monotonic() + 5
+        while not server.active:
+            assert time.monotonic() < deadline, 'The server did not start'
+            time.sleep(0.001)
+        return server
+
+    yield serve
+    for server in servers:
+        server.close()
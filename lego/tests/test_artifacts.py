@@ -0,0 +1,69 @@
+# type: ignore
+# pylint: skip-file
+import json
+import os
+import tarfile
+import time
+
+import pytest
+import rpyc
+
+from Octavius.lego import artifacts
+from Octavius.lego.components import RPyCComponent
+
+
+@pytest.fixture
+def components(serve):
+    server = serve(rpyc.SlaveService)
+    with RPyCComponent('127.0.0.1', port=server.port) as alice, \
+            RPyCComponent('127.0.0.1', port=server.port) as bob:
+        yield {'zebra.alice': alice, 'zebra.bob': bob}
+
+
+def _members(path):
+    with tarfile.open(path) as archive:
+        return {member.name: archive.extractfile(member).read() for member in archive}
+
+
+def test_artifacts_are_collected_from_every_component(components, tmp_path):
+    log = tmp_path / 'tool.log'
+    log.write_text('started\n')
+
+    summary = artifacts.collect(components, str(tmp_path / 'test_a'),
+                                files=(str(tmp_path / '*.log'), '/missing.log'),
+                                commands=('echo hello',))
+
+    for name in components:
+        members = _members(tmp_path / 'test_a' / f'{name}.tar.gz')
+        assert members['commands/echo_hello.txt'] == b'hello\n'
+        assert members[str(log).lstrip(os.sep)] == b'started\n'
+        assert summary[name]['skipped'] == ['/missing.log: not found']
+    assert json.loads((tmp_path / 'test_a' / 'collection.json').read_text()) == summary
+
+
+def test_size_cap_keeps_the_end_of_files(components, tmp_path):
+    log = tmp_path / 'tool.log'
+    log.write_bytes(os.urandom(1024 * 1024) + b'the end')
+
+    summary = artifacts.collect({'zebra.alice': components['zebra.alice']}, str(tmp_path),
+                                files=(str(log), str(log)), max_bytes=100 * 1024)
+
+    # Random data doesn't compress, so the archive is about the size of the data.
+    assert summary['zebra.alice']['bytes'] < 105 * 1024
+    assert summary['zebra.alice']['skipped'] == [
+        f'{log}: truncated to its last {100 * 1024} bytes', f'{log}: size cap']
+    content = _members(tmp_path / 'zebra.alice.tar.gz')[str(log).lstrip(os.sep)]
+    assert content.endswith(b'the end')
+
+
+def test_collection_is_parallel_and_capped_in_time(components, tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, 'GRACE_PERIOD', 0.2)
+    start = time.monotonic()
+
+    summary = artifacts.collect(components, str(tmp_path), commands=('sleep 10', 'echo late'),
+                                timeout=1)
+
+    assert time.monotonic() - start < 1.5
+    for name in components:
+        assert summary[name]['skipped'] == ['echo late: time cap']
+        assert _members(tmp_path / f'{name}.tar.gz')['commands/sleep_10.txt'] == b'\n[timed out]\n'
@@ -0,0 +1,142 @@
+# type: ignore
+# pylint: skip-file
+import asyncio
+import time
+import types
+
+import pytest
+import rpyc
+
+from Octavius.lego.pytest_lego import component_factory
+from Octavius.lego.pytest_lego.component_factory import acquire_components_async
+from Octavius.lego_manager.lego_manager import LegoManager
+
+
+@pytest.fixture
+def manager_server(serve):
+    manager = LegoManager()
+    return manager, serve(manager, protocol_config={'allow_public_attrs': True})
+
+
+@pytest.fixture
+def lab(manager_server, serve):
+    component_server = serve(rpyc.SlaveService)
+    manager, manager_server = manager_server
+    lego_manager = rpyc.connect('127.0.0.1', manager_server.port,
+                                config={'allow_public_attrs': True})
+    component_config = {'hostname': '127.0.0.1', 'port': str(component_server.port)}
+    config = types.SimpleNamespace(inicfg=types.SimpleNamespace(config=types.SimpleNamespace(
+        sections={'zebra.alice': component_config, 'zebra.bob': component_config})))
+    yield manager, lego_manager, config
+    lego_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_waiting_doesnt_block_the_loop(lab):
+    manager, lego_manager, config = lab
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    async def acquire():
+        async with acquire_components_async(lego_manager, config, 'zebra.alice') as (zebra,):
+            return zebra.getpid()
+
+    ticker = asyncio.ensure_future(tick())
+    with manager.exposed_acquire_setup('zebra.alice', True):
+        acquisition = asyncio.ensure_future(acquire())
+        await asyncio.sleep(0.3)
+        assert not acquisition.done()
+        assert ticks >= 10
+    assert await acquisition
+    ticker.cancel()
+    assert manager.exposed_get_statistics()['busy'] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancellation_withdraws_the_request(lab):
+    manager, lego_manager, config = lab
+
+    async def acquire():
+        async with acquire_components_async(lego_manager, config, 'zebra.alice'):
+            pass
+
+    with manager.exposed_acquire_setup('zebra.alice', True):
+        task = asyncio.ensure_future(acquire())
+        await asyncio.sleep(0.1)
+        assert manager.exposed_get_statistics()['pending'] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    statistics = manager.exposed_get_statistics()
+    assert statistics['pending'] == 0 and statistics['withdrawn'] == 1
+    assert statistics['busy'] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancellation_during_the_submission_releases_the_ticket(lab):
+    manager, lego_manager, config = lab
+    root = lego_manager.root
+
+    def submit_setup(*args):
+        time.sleep(0.3)
+        return root.submit_setup(*args)
+
+    slow_manager = types.SimpleNamespace(root=types.SimpleNamespace(
+        submit_setup=submit_setup, poll_setup=root.poll_setup, release_setup=root.release_setup))
+
+    async def acquire():
+        async with acquire_components_async(slow_manager, config, 'zebra.alice'):
+            pass
+
+    task = asyncio.ensure_future(acquire())
+    await asyncio.sleep(0.1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    statistics = manager.exposed_get_statistics()
+    assert statistics['granted'] == statistics['released'] == 1
+    assert statistics['busy'] == statistics['pending'] == 0
+
+
+def test_disconnection_releases_the_tickets(manager_server):
+    manager, server = manager_server
+    client = rpyc.connect('127.0.0.1', server.port, config={'allow_public_attrs': True})
+    client.root.submit_setup('zebra.alice', True)
+    with manager.exposed_acquire_setup('zebra.bob', True):
+        client.root.submit_setup('zebra.bob', True)
+        statistics = manager.exposed_get_statistics()
+        assert (statistics['busy'], statistics['pending']) == (2, 1)
+
+        client.close()
+        deadline = time.monotonic() + 5
+        while manager.exposed_get_statistics()['busy'] != 1:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert manager.exposed_get_statistics()['pending'] == 0
+    assert manager.exposed_get_statistics()['busy'] == 0
+
+
+@pytest.mark.asyncio
+async def test_components_are_built_concurrently(lab, monkeypatch):
+    manager, lego_manager, config = lab
+    get_component = component_factory._get_component
+
+    def slow_get_component(*args):
+        time.sleep(0.3)
+        return get_component(*args)
+
+    monkeypatch.setattr(component_factory, '_get_component', slow_get_component)
+    start = time.monotonic()
+    async with acquire_components_async(
+            lego_manager, config, 'zebra.alice and zebra.bob') as (alice, bob):
+        assert time.monotonic() - start < 0.5
+        assert alice.getpid() == bob.getpid()
+        assert manager.exposed_get_statistics()['busy'] == 2
+    assert manager.exposed_get_statistics()['busy'] == 0
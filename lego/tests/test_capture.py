@@ -0,0 +1,91 @@
+# type: ignore
+# pylint: skip-file
+import struct
+import sys
+import time
+
+import pytest
+import rpyc
+
+from Octavius.lego import capture
+from Octavius.lego.capture import _PcapCounter
+from Octavius.lego.components import RPyCComponent
+
+PACKETS = 20000
+SNAPLEN = 100
+WIRE_LENGTH = 1500
+
+# Writes a pcap stream like 'tcpdump -w -', until it is interrupted.
+FAKE_TCPDUMP = f'''#!{sys.executable}
+import signal, struct, sys, time
+interrupted = []
+signal.signal(signal.SIGINT, lambda *_: interrupted.append(True))
+out = sys.stdout.buffer
+out.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, {SNAPLEN}, 1))
+record = struct.pack('<IIII', 0, 0, {SNAPLEN}, {WIRE_LENGTH}) + bytes({SNAPLEN})
+for _ in range({PACKETS} // 1000):
+    out.write(record * 1000)
+out.flush()
+while not interrupted:
+    time.sleep(0.01)
+sys.stderr.write('{PACKETS} packets captured\\n3 packets dropped by kernel\\n')
+'''
+
+
+@pytest.fixture
+def component(tmp_path, monkeypatch, serve):
+    tcpdump = tmp_path / 'tcpdump'
+    tcpdump.write_text(FAKE_TCPDUMP)
+    tcpdump.chmod(0o755)
+    monkeypatch.setattr(capture, 'TCPDUMP', str(tcpdump))
+
+    server = serve(rpyc.SlaveService)
+    with RPyCComponent('127.0.0.1', port=server.port) as component:
+        yield component
+
+
+def test_capture_is_streamed_into_a_local_file(component, tmp_path):
+    running = component.start_capture('udp and port 1337', snaplen=SNAPLEN,
+                                      path=str(tmp_path / 'capture.pcap'))
+    with pytest.raises(ValueError):
+        component.start_capture()
+
+    deadline = time.monotonic() + 10
+    while running.counters().packets < PACKETS and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert running.counters() == (
+        PACKETS, PACKETS * SNAPLEN, PACKETS * WIRE_LENGTH, 24 + PACKETS * (16 + SNAPLEN))
+
+    stopped = component.stop_capture()
+    assert stopped is running and not stopped.running
+    assert stopped.returncode == 0
+    assert stopped.dropped == 3
+    with stopped.mmap() as pcap:
+        assert len(pcap) == 24 + PACKETS * (16 + SNAPLEN)
+        assert struct.unpack_from('<IIII', pcap, 24) == (0, 0, SNAPLEN, WIRE_LENGTH)
+
+
+def test_empty_capture_is_mapped(component, tmp_path, monkeypatch):
+    idle = tmp_path / 'idle'
+    idle.write_text(f'#!{sys.executable}\nimport time\ntime.sleep(60)\n')
+    idle.chmod(0o755)
+    monkeypatch.setattr(capture, 'TCPDUMP', str(idle))
+
+    running = component.start_capture(path=str(tmp_path / 'empty.pcap'))
+    with running.mmap() as pcap:
+        assert len(pcap) == 0
+    stopped = component.stop_capture()
+    with stopped.mmap() as pcap:
+        assert pcap == b''
+
+
+def test_pcap_counter_handles_any_chunking():
+    header = struct.pack('>IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+    stream = header + b''.join(
+        struct.pack('>IIII', 0, 0, size, size * 2) + bytes(size) for size in (0, 1, 40, 7))
+
+    for chunk_size in (1, 3, 16, 17, len(stream)):
+        counter = _PcapCounter()
+        for offset in range(0, len(stream), chunk_size):
+            counter.feed(stream[offset:offset + chunk_size])
+        assert (counter.packets, counter.captured_bytes, counter.wire_bytes) == (4, 48, 96)
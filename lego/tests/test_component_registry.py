@@ -0,0 +1,62 @@
+# type: ignore
+# pylint: skip-file
+import os
+import subprocess
+import sys
+
+import pytest
+
+from Octavius.lego.component_registry import ComponentRegistry
+
+# Modules which the plugin and the manager import only when a setup is acquired.
+HEAVY_MODULES = ('rpyc', 'plumbum', 'scapy', 'watchdog', 'Octavius.lego.components',
+                 'Octavius.example.components')
+
+_IMPORTED_MODULES = '''
+import sys
+import {module}
+print('\\n'.join(sys.modules))
+'''
+
+
+def _imported_modules(module):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.run(
+        [sys.executable, '-c', _IMPORTED_MODULES.format(module=module)], env=env,
+        stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    return output.splitlines()
+
+
+def test_plugin_import_is_light():
+    modules = _imported_modules('Octavius.lego.pytest_lego.plugin, Octavius.lego')
+    assert [module for module in modules if module.startswith(HEAVY_MODULES)] == []
+
+
+def test_manager_doesnt_import_pytest():
+    modules = _imported_modules('Octavius.lego_manager.lego_manager')
+    assert [module for module in modules
+            if module.startswith(('pytest', '_pytest', 'Octavius.lego.pytest_lego'))] == []
+
+
+def test_resolve_is_lazy_and_memoized(monkeypatch):
+    registry = ComponentRegistry()
+    imports = []
+    import importlib
+    original_import = importlib.import_module
+
+    def counting_import(name):
+        imports.append(name)
+        return original_import(name)
+
+    monkeypatch.setattr(importlib, 'import_module', counting_import)
+    registry.register('ordered', 'collections.OrderedDict')
+    assert imports == []
+
+    assert registry.resolve('ordered') is registry.resolve('ordered')
+    assert registry.resolve('collections:Counter').__name__ == 'Counter'
+    assert imports == ['collections', 'collections']
+
+
+def test_resolve_unknown_class():
+    with pytest.raises(AttributeError):
+        ComponentRegistry().resolve('collections.NoSuchComponent')
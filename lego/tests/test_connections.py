@@ -0,0 +1,98 @@
+# type: ignore
+# pylint: skip-file
+import socket
+import threading
+import time
+
+import pytest
+import rpyc
+
+from Octavius.lego import connections
+from Octavius.lego.connections import DIRECT, SSH_DEPLOY, RPyCConnection, clear_negative_cache
+
+
+@pytest.fixture(autouse=True)
+def negative_cache():
+    clear_negative_cache()
+    yield
+    clear_negative_cache()
+
+
+@pytest.fixture
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class _FakeConnection:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def test_direct_connection_is_timed(serve):
+    server = serve(rpyc.SlaveService)
+    with RPyCConnection('127.0.0.1', port=str(server.port), connect_timeout='1') as connection:
+        assert connection.path == DIRECT
+        assert list(connection.timings) == [DIRECT]
+        assert connection.rpyc.modules.os.getpid()
+
+
+def test_failures_are_remembered(closed_port):
+    start = time.monotonic()
+    with pytest.raises(ConnectionRefusedError):
+        RPyCConnection('127.0.0.1', port=closed_port)
+    # RPyC used to retry refused connections with a back off.
+    assert time.monotonic() - start < 0.5
+
+    start = time.perf_counter()
+    cached_failure = r'failed [\d.]+s ago: ConnectionRefusedError'
+    with pytest.raises(ConnectionError, match=cached_failure) as cached:
+        RPyCConnection('127.0.0.1', port=closed_port)
+    assert time.perf_counter() - start < 0.01
+    assert isinstance(cached.value.__cause__, ConnectionRefusedError)
+    # Every caller gets an error of its own.
+    with pytest.raises(ConnectionError) as again:
+        RPyCConnection('127.0.0.1', port=closed_port)
+    assert again.value is not cached.value
+
+    clear_negative_cache()
+    with pytest.raises(ConnectionRefusedError):
+        RPyCConnection('127.0.0.1', port=closed_port)
+
+
+def test_slow_direct_connection_is_raced_by_ssh(monkeypatch):
+    late_direct = _FakeConnection()
+    deployed = _FakeConnection()
+
+    def slow_direct(hostname, port, timeout):
+        time.sleep(0.5)
+        return late_direct
+
+    monkeypatch.setattr(connections, '_connect_direct', slow_direct)
+    monkeypatch.setattr(connections, '_deploy', lambda *args: (deployed, None))
+
+    start = time.monotonic()
+    connection = RPyCConnection('alice', 'root', 'password')
+    assert time.monotonic() - start < 0.45
+    assert connection.path == SSH_DEPLOY
+    assert connection.rpyc is deployed
+
+    # The direct connection lost the race, so it is closed once it connects.
+    assert late_direct.closed.wait(2)
+    assert not deployed.closed.is_set()
+    assert set(connection.timings) == {DIRECT, SSH_DEPLOY}
+
+
+def test_ssh_starts_immediately_after_direct_failure(monkeypatch, closed_port):
+    deployed = _FakeConnection()
+    monkeypatch.setattr(connections, '_deploy', lambda *args: (deployed, None))
+
+    start = time.monotonic()
+    connection = RPyCConnection('127.0.0.1', 'root', 'password', port=closed_port,
+                                ssh_race_delay='10')
+    assert time.monotonic() - start < 1
+    assert connection.path == SSH_DEPLOY
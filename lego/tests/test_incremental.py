@@ -0,0 +1,152 @@
+# type: ignore
+# pylint: skip-file
+import json
+import os
+import sys
+import types
+
+import pytest
+
+from Octavius.lego.pytest_lego.incremental import FingerprintStore, fingerprint, project_modules
+
+pytest_plugins = ['pytester']
+
+_HELPER = '''
+def add(a, b):
+    return a + b
+'''
+
+_CONFTEST = '''
+import pytest
+
+
+class Component:
+    def software_signature(self):
+        with open('version') as version:
+            return version.read()
+
+
+@pytest.fixture
+def component(request):
+    component = Component()
+    request.config.pluginmanager.get_plugin('lego_incremental').acquired(request.node, [component])
+    return component
+'''
+
+_TESTS = '''
+from helper import add
+
+
+def test_add(component):
+    with open('runs', 'a') as runs:
+        runs.write('test_add\\n')
+    assert add(1, 2) == 3
+
+
+def test_fails():
+    assert add(1, 1) == 3
+'''
+
+
+def test_store_roundtrip(tmp_path):
+    path = str(tmp_path / 'store.json')
+    store = FingerprintStore(path)
+    assert store.get('test_a') is None
+
+    store.record('test_a', 'abc', 'passed', 1.5)
+    store.save()
+    assert FingerprintStore(path).get('test_a')['fingerprint'] == 'abc'
+
+    (tmp_path / 'store.json').write_text('{corrupted')
+    assert FingerprintStore(path).get('test_a') is None
+
+
+def test_workers_results_are_merged(tmp_path):
+    path = str(tmp_path / 'store.json')
+    store = FingerprintStore(path)
+    store.record('test_a', 'old', 'passed', 1.0)
+    store.save()
+
+    for worker, nodeid in (('gw0', 'test_a'), ('gw1', 'test_b')):
+        store = FingerprintStore(path, worker)
+        store.record(nodeid, worker, 'passed', 1.0)
+        store.save()
+    assert sorted(os.listdir(tmp_path)) == ['store.gw0.json', 'store.gw1.json', 'store.json']
+    # A worker of the next session sees the results before they are merged.
+    assert FingerprintStore(path, 'gw2').get('test_b')['fingerprint'] == 'gw1'
+
+    FingerprintStore(path).save()
+    assert os.listdir(tmp_path) == ['store.json']
+    store = FingerprintStore(path)
+    assert store.get('test_a')['fingerprint'] == 'gw0'
+    assert store.get('test_b')['fingerprint'] == 'gw1'
+
+
+def test_fingerprint_separates_parts():
+    assert fingerprint(['ab', 'c']) != fingerprint(['a', 'bc'])
+    assert fingerprint(['ab', 'c']) == fingerprint(['ab', 'c'])
+
+
+def test_project_modules(tmp_path):
+    lib = types.ModuleType('lib')
+    lib.__file__ = str(tmp_path / 'lib.py')
+    lib.json = json
+    test = types.ModuleType('test_module')
+    test.__file__ = str(tmp_path / 'test_module.py')
+    test.lib = lib
+    test.dumps = json.dumps
+    test.os = os
+
+    assert project_modules(test, str(tmp_path)) == [lib, test]
+
+
+@pytest.fixture
+def suite(pytester):
+    pytester.makeconftest(_CONFTEST)
+    pytester.makepyfile(helper=_HELPER, test_suite=_TESTS)
+    (pytester.path / 'version').write_text('1')
+
+    def run(*args):
+        return pytester.runpytest_subprocess(
+            '-p', 'Octavius.lego.pytest_lego.plugin', '-p', 'no:cacheprovider', *args)
+
+    def runs():
+        return (pytester.path / 'runs').read_text().count('test_add')
+
+    return run, runs
+
+
+@pytest.fixture(autouse=True)
+def _octavius_path(monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(sys.path))
+
+
+def test_unchanged_tests_are_skipped(suite, pytester):
+    run, runs = suite
+
+    run('--lego-incremental=skip').assert_outcomes(passed=1, failed=1)
+    # The failed test runs again.
+    run('--lego-incremental=skip').assert_outcomes(skipped=1, failed=1)
+    assert runs() == 1
+
+    pytester.makepyfile(helper=_HELPER + '\n# Changed.\n')
+    run('--lego-incremental=skip').assert_outcomes(passed=1, failed=1)
+    assert runs() == 2
+
+    run('--lego-incremental=skip', '--lego-full-run').assert_outcomes(passed=1, failed=1)
+    assert runs() == 3
+
+    # The software of the acquired component changed.
+    (pytester.path / 'version').write_text('2')
+    run('--lego-incremental=skip').assert_outcomes(passed=1, failed=1)
+    assert runs() == 4
+    run('--lego-incremental=skip').assert_outcomes(skipped=1, failed=1)
+    assert runs() == 4
+
+
+def test_unchanged_tests_are_replayed(suite):
+    run, runs = suite
+
+    run('--lego-incremental=replay').assert_outcomes(passed=1, failed=1)
+    run('--lego-incremental=replay').assert_outcomes(passed=1, failed=1)
+    assert runs() == 1
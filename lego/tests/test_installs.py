@@ -0,0 +1,66 @@
+# type: ignore
+# pylint: skip-file
+
+import pytest
+import rpyc
+
+from Octavius.lego.components import RPyCComponent
+from Octavius.lego.installs import InstallCache
+
+
+def test_only_changed_tools_are_reinstalled():
+    cache = InstallCache()
+    log = []
+
+    def ensure(tool, version, **parameters):
+        return cache.ensure(
+            tool, version, lambda: log.append(('install', tool, version)) or [tool, version],
+            uninstall=lambda state: log.append(('uninstall', *state)),
+            verify=lambda state: state[1] is not None, parameters=parameters)
+
+    ensure('tetanus', 3, port=1337)
+    ensure('capture', 1)
+    ensure('tetanus', 3, port=1337)
+    assert log == [('install', 'tetanus', 3), ('install', 'capture', 1)]
+    assert (cache.installs, cache.reuses) == (2, 1)
+
+    ensure('tetanus', 3, port=1338)
+    ensure('capture', 1)
+    assert log[2:] == [('uninstall', 'tetanus', 3), ('install', 'tetanus', 3)]
+
+    # A state which fails verification is reinstalled.
+    ensure('tetanus', 3, port=1338)[1] = None
+    ensure('tetanus', 3, port=1338)
+    assert log[4:] == [('uninstall', 'tetanus', None), ('install', 'tetanus', 3)]
+
+    cache.clear()
+    assert log[6:] == [('uninstall', 'tetanus', 3), ('uninstall', 'capture', 1)]
+    assert 'tetanus' not in cache
+
+
+@pytest.fixture
+def component(serve):
+    server = serve(rpyc.SlaveService)
+    with RPyCComponent('127.0.0.1', port=server.port) as component:
+        yield component
+
+
+def test_running_tool_is_reused_until_it_dies(component):
+    def install():
+        return component.installs.ensure(
+            'sleeper', 1, lambda: component.supervisor.start(['sleep', '30']),
+            uninstall=lambda process: process.kill(),
+            verify=lambda process: process.status() is None)
+
+    process = install()
+    assert install() == process
+
+    process.kill()
+    process.wait()
+    restarted = install()
+    assert restarted != process
+    assert component.supervisor.status([restarted]) == [None]
+
+    component.close()
+    assert restarted.wait(5) is not None
+    assert 'sleeper' not in component.installs
@@ -0,0 +1,56 @@
+# type: ignore
+# pylint: skip-file
+import os
+import types
+
+import pytest
+
+from Octavius.example.components.zebra import Zebra
+from Octavius.lego.components import RPyCComponent
+from Octavius.lego.connections import LOCAL_PROCESS, LOCAL_THREAD, LocalConnection
+from Octavius.lego.pytest_lego import plugin
+from Octavius.lego.pytest_lego.component_factory import acquire_components
+
+
+def test_thread_and_process_backends():
+    with RPyCComponent('unused', backend=LOCAL_THREAD) as component:
+        assert component.getpid() == os.getpid()
+        assert component._connection.path == LOCAL_THREAD
+
+    with RPyCComponent('unused', backend=LOCAL_PROCESS) as component:
+        pid = component.getpid()
+        assert pid != os.getpid()
+        process = component._connection._process
+    # The service process exits once its connection is closed.
+    assert process.poll() == 0
+    assert pid == process.pid
+
+    with pytest.raises(ValueError):
+        LocalConnection('docker')
+
+
+@pytest.mark.parametrize('option, ini, backend', [
+    (None, LOCAL_PROCESS, LOCAL_PROCESS), (LOCAL_THREAD, LOCAL_PROCESS, LOCAL_THREAD)])
+def test_setup_runs_without_a_lab(option, ini, backend):
+    config = types.SimpleNamespace(
+        getoption=lambda name: option,
+        inicfg=types.SimpleNamespace(config=types.SimpleNamespace(sections={
+            'lego': {'lego_backend': ini},
+            'zebra.alice': {'hostname': 'alice'},
+            'zebra.logan': {'hostname': 'logan'}})))
+
+    lego_manager = plugin._connect_lego_manager(config)
+    try:
+        with acquire_components(lego_manager, config, 'zebra.alice and zebra.logan',
+                                backend=plugin._backend(config)) as (alice, logan):
+            assert isinstance(alice, Zebra)
+            pids = {alice.getpid(), logan.getpid()}
+            if backend == LOCAL_THREAD:
+                assert pids == {os.getpid()}
+            else:
+                assert len(pids) == 2 and os.getpid() not in pids
+            process = logan.supervisor.start('echo hello')
+            assert process.wait(5) == 0
+            assert process.output()[0] == b'hello\n'
+    finally:
+        lego_manager.close()
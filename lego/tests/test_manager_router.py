@@ -0,0 +1,208 @@
+# type: ignore
+# pylint: skip-file
+import os
+import socket
+import subprocess
+import contextlib
+import sys
+import threading
+import time
+
+import pytest
+import rpyc
+
+from Octavius.lego.pytest_lego.manager_router import ShardedLegoManager, parse_shards
+from Octavius.lego_manager.inventory import Inventory
+from Octavius.lego_manager.lego_manager import LegoManager
+from Octavius.lego_manager.sharding import Shard, shard_of, BY_CLASS, BY_INSTANCE
+
+SHARDS = 3
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, process):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        assert process.poll() is None
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(port)
+
+
+@pytest.fixture(scope='module')
+def shards():
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    addresses, processes = [], []
+    try:
+        for index in range(SHARDS):
+            port = _free_port()
+            processes.append(subprocess.Popen(
+                [sys.executable, '-m', 'Octavius.lego_manager.lego_manager', '--host', '127.0.0.1',
+                 '--port', str(port), '--shard', f'{index}/{SHARDS}', '--sharding', BY_INSTANCE],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            _wait_for_port(port, processes[-1])
+            addresses.append(f'127.0.0.1:{port}')
+        yield ', '.join(addresses)
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
+
+
+@pytest.fixture
+def router(shards):
+    connections = [rpyc.connect(hostname, port) for hostname, port in parse_shards(shards)]
+    router = ShardedLegoManager(connections, BY_INSTANCE)
+    yield router
+    router.close()
+
+
+def _components_in_different_shards():
+    by_shard = {}
+    for index in range(100):
+        by_shard.setdefault(shard_of(f'zebra.z{index}', SHARDS, BY_INSTANCE), f'zebra.z{index}')
+    return list(by_shard.values())
+
+
+def test_acquire_across_shards(router):
+    components = _components_in_different_shards()
+    query = ' and '.join(reversed(components))
+
+    with router.root.acquire_setup(query, True) as setup:
+        assert list(setup) == list(reversed(components))
+        assert set(setup.values()) == {'Octavius.example.components.zebra.Zebra'}
+
+
+def test_unnamed_terms_are_routed_by_the_sharding():
+    named = _components_in_different_shards()[0]
+    query = f'zebra*2 and {named}'
+
+    router = ShardedLegoManager([None] * SHARDS, BY_CLASS)
+    zebra_shard = shard_of('zebra', SHARDS, BY_CLASS)
+    assert router._split(query)[1] == [zebra_shard] * 3
+
+    # Any shard may own instances of the class.
+    router = ShardedLegoManager([None] * SHARDS, BY_INSTANCE)
+    assert router._split(query) == (
+        ['zebra', 'zebra', named], [None, None, shard_of(named, SHARDS, BY_INSTANCE)])
+
+
+@pytest.fixture
+def inventory_router(serve, tmp_path):
+    ini = tmp_path / 'pytest.ini'
+    ini.write_text(''.join(f'[zebra.z{index}]\nhostname = localhost\n' for index in range(6)))
+    managers, connections = [], []
+    for index in range(SHARDS):
+        shard = Shard(index, SHARDS, BY_INSTANCE)
+        managers.append(LegoManager(shard=shard, inventory=Inventory.load(str(ini), shard.owns)))
+        server = serve(managers[-1], protocol_config={'allow_public_attrs': True})
+        connections.append(rpyc.connect('127.0.0.1', server.port))
+    router = ShardedLegoManager(connections, BY_INSTANCE)
+    yield managers, router
+    router.close()
+
+
+def _idle(managers):
+    return all(manager.exposed_get_statistics()['busy'] == 0 and
+               manager.exposed_get_statistics()['pending'] == 0 for manager in managers)
+
+
+def test_unnamed_terms_are_granted_by_any_shard(inventory_router):
+    managers, router = inventory_router
+    named = f'zebra.z{SHARDS}'
+
+    with contextlib.ExitStack() as stack:
+        setup = stack.enter_context(router.root.acquire_setup(f'zebra and {named}', True))
+        assert list(setup)[1] == named
+        chosen = set(setup)
+        # Every instance is granted right away, whichever shard owns it.
+        start = time.monotonic()
+        for _ in range(4):
+            chosen.update(stack.enter_context(router.root.acquire_setup('zebra', True)))
+        assert time.monotonic() - start < 1
+        assert chosen == {f'zebra.z{index}' for index in range(6)}
+    assert _idle(managers)
+
+
+def test_rejected_queries_release_every_shard(inventory_router):
+    managers, router = inventory_router
+
+    with pytest.raises(ValueError, match='okapi'):
+        router.root.submit_setup('zebra.z0 and zebra.z1 and okapi', True)
+    assert _idle(managers)
+
+
+def test_manager_rejects_foreign_components(router):
+    first, second, *_ = _components_in_different_shards()
+    foreign_connection = router.connections[shard_of(second, SHARDS, BY_INSTANCE)]
+
+    with pytest.raises(ValueError):
+        with foreign_connection.root.acquire_setup(first, True):
+            pass
+
+
+def test_overlapping_queries_dont_deadlock(shards):
+    first, second, *_ = _components_in_different_shards()
+    errors = []
+
+    def client(query):
+        connections = [rpyc.connect(hostname, port) for hostname, port in parse_shards(shards)]
+        client_router = ShardedLegoManager(connections, BY_INSTANCE)
+        try:
+            for _ in range(20):
+                with client_router.root.acquire_setup(query, True):
+                    pass
+        except Exception as error:
+            errors.append(error)
+        finally:
+            client_router.close()
+
+    threads = [threading.Thread(target=client, args=(f'{first} and {second}',)),
+               threading.Thread(target=client, args=(f'{second} and {first}',))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(20)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert errors == []
+
+
+def test_tickets_across_shards(router):
+    components = _components_in_different_shards()
+    query = ' and '.join(reversed(components))
+
+    ticket = router.root.submit_setup(query, True)
+    setup = None
+    while setup is None:
+        setup = router.root.poll_setup(ticket)
+    assert [name for name, _ in setup] == list(reversed(components))
+
+    # The components are held until the ticket is released.
+    pending = router.root.submit_setup(components[0], True)
+    assert router.root.poll_setup(pending) is None
+    router.root.release_setup(ticket)
+    while router.root.poll_setup(pending) is None:
+        time.sleep(0.01)
+    router.root.release_setup(pending)
+
+
+def test_repeated_class_terms_need_an_inventory(router):
+    # Managers without an inventory can't tell the instances of 'zebra and zebra' apart.
+    with pytest.raises(ValueError, match='2 terms'):
+        with router.root.acquire_setup('zebra and zebra', True):
+            pass
+
+    ticket = router.root.submit_setup('zebra and zebra', True)
+    with pytest.raises(ValueError, match='2 terms'):
+        while router.root.poll_setup(ticket) is None:
+            time.sleep(0.01)
+    router.root.release_setup(ticket)
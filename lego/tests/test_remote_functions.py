@@ -0,0 +1,90 @@
+# type: ignore
+# pylint: skip-file
+import functools
+
+import pytest
+import rpyc
+
+from Octavius.lego.remote_functions import FunctionRunner, function_source
+
+
+class _RoundTrips:
+    """Counts the requests a connection sends to the server."""
+
+    def __init__(self, connection):
+        self.count = 0
+        sync_request = connection.sync_request
+
+        def counting_sync_request(*args):
+            self.count += 1
+            return sync_request(*args)
+
+        connection.sync_request = counting_sync_request
+
+
+def _checksums(packets, modulo=256):
+    import zlib
+    return [zlib.crc32(packet) % modulo for packet in packets]
+
+
+@functools.lru_cache()
+def _decorated(value):
+    return value * 2
+
+
+def _fails():
+    raise ValueError('remote failure')
+
+
+@pytest.fixture
+def connection():
+    connection = rpyc.classic.connect_thread()
+    yield connection
+    connection.close()
+
+
+def test_function_is_shipped_once(connection):
+    runner = FunctionRunner(connection)
+    shipped = []
+    r_call = runner._r_call
+    runner._r_call = lambda digest, name, source, payload: (
+        shipped.append(source), r_call(digest, name, source, payload))[1]
+    round_trips = _RoundTrips(connection)
+    packets = [bytes([index % 256]) * 100 for index in range(1000)]
+
+    assert runner.run(_checksums, packets) == _checksums(packets)
+    assert runner.run(_checksums, packets, modulo=2) == _checksums(packets, 2)
+    assert round_trips.count == 2
+    assert shipped[0].startswith('def _checksums') and shipped[1] is None
+
+
+def test_function_is_shipped_again_to_a_new_cache(connection):
+    runner = FunctionRunner(connection)
+    assert runner.run(_decorated, 1) == 2
+
+    # The component restarted, with an empty cache.
+    runner._r_call = FunctionRunner(connection)._r_call
+    assert runner.run(_decorated, 2) == 4
+
+
+def test_decorators_are_stripped(connection):
+    name, source = function_source(_decorated)
+    assert name == '_decorated' and source.startswith('def _decorated')
+    assert FunctionRunner(connection).run(_decorated, 21) == 42
+
+
+def test_impure_functions_are_rejected():
+    offset = 1
+
+    def closure(value):
+        return value + offset
+
+    with pytest.raises(TypeError, match='closure'):
+        function_source(closure)
+    with pytest.raises(TypeError, match='def'):
+        function_source(lambda: None)
+
+
+def test_remote_exceptions_are_raised(connection):
+    with pytest.raises(ValueError, match='remote failure'):
+        FunctionRunner(connection).run(_fails)
@@ -0,0 +1,84 @@
+# type: ignore
+# pylint: skip-file
+import signal
+import sys
+
+import pytest
+import rpyc
+
+from Octavius.lego.supervisor import Supervisor
+
+
+class _RoundTrips:
+    """Counts the requests a connection sends to the server."""
+
+    def __init__(self, connection):
+        self.count = 0
+        sync_request = connection.sync_request
+
+        def counting_sync_request(*args):
+            self.count += 1
+            return sync_request(*args)
+
+        connection.sync_request = counting_sync_request
+
+
+@pytest.fixture
+def connection():
+    connection = rpyc.classic.connect_thread()
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def supervisor(connection):
+    supervisor = Supervisor(connection, buffer_size=1024)
+    yield supervisor
+    supervisor.close()
+
+
+def test_many_processes_in_few_round_trips(connection, supervisor):
+    round_trips = _RoundTrips(connection)
+
+    tools = supervisor.start_many([[sys.executable, '-c', 'import time; time.sleep(60)']] * 20)
+    assert supervisor.status(tools) == [None] * 20
+    supervisor.kill(tools, signal.SIGINT)
+    assert all(code is not None for code in supervisor.wait(tools, timeout=10))
+
+    assert round_trips.count == 4
+
+
+def test_output_is_kept_in_ring_buffers(supervisor):
+    process = supervisor.start(
+        f'{sys.executable} -c "print(\'x\' * 5000); print(\'done\')"; echo error >&2',
+        env={'UNUSED': '1'})
+    assert process.wait(timeout=10) == 0
+
+    stdout, stderr = process.output()
+    assert len(stdout) == 1024
+    assert stdout.endswith(b'x\ndone\n')
+    assert stderr == b'error\n'
+
+
+def test_close_kills_the_process_group(supervisor):
+    # The signal is sent to the process group, so the child of the shell is killed as well.
+    process = supervisor.start('sleep 60 & wait')
+    assert process.wait(timeout=0.2) is None
+
+    supervisor.close()
+    assert process.status() is not None
+
+
+def test_only_the_last_exited_processes_are_kept(connection):
+    supervisor = Supervisor(connection, max_exited=2)
+    processes = supervisor.start_many(['true'] * 3)
+    supervisor.wait(processes, timeout=10)
+
+    running = supervisor.start('sleep 60')
+    assert supervisor.status(processes[1:]) == [0, 0]
+    with pytest.raises(KeyError, match='dropped'):
+        processes[0].status()
+
+    supervisor.forget(processes)
+    supervisor.close()
+    assert running.status() is not None
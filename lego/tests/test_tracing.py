@@ -0,0 +1,64 @@
+# type: ignore
+# pylint: skip-file
+import json
+import types
+
+import pytest
+import rpyc
+
+from Octavius.lego.pytest_lego.component_factory import acquire_components
+from Octavius.lego.pytest_lego.tracing import TimelineRecorder
+from Octavius.lego_manager.lego_manager import LegoManager
+from Octavius.lego_manager.timeline import Timeline
+
+
+@pytest.fixture
+def lab(serve):
+    component_server = serve(rpyc.SlaveService)
+    manager_server = serve(LegoManager(timeline=Timeline('lego manager', pid=0)),
+                           protocol_config={'allow_public_attrs': True})
+    lego_manager = rpyc.connect('127.0.0.1', manager_server.port,
+                                config={'allow_public_attrs': True})
+    config = types.SimpleNamespace(inicfg=types.SimpleNamespace(config=types.SimpleNamespace(
+        sections={'zebra.alice': {'hostname': '127.0.0.1', 'port': str(component_server.port)}})))
+    yield lego_manager, config
+    lego_manager.close()
+
+
+def _spans(events):
+    processes = {event['pid']: event['args']['name'] for event in events
+                 if event['name'] == 'process_name'}
+    tracks = {(event['pid'], event['tid']): event['args']['name'] for event in events
+              if event['name'] == 'thread_name'}
+    return {(processes[event['pid']], tracks[event['pid'], event['tid']], event['name'])
+            for event in events if event['ph'] == 'X'}
+
+
+def test_session_timeline(lab, tmp_path):
+    lego_manager, config = lab
+    recorder = TimelineRecorder(types.SimpleNamespace(), str(tmp_path / 'trace.json'))
+
+    with acquire_components(lego_manager, config, 'zebra.alice',
+                            timeline=recorder.timeline) as (zebra,):
+        assert zebra.getpid()
+    recorder.fetch_manager_timeline(lego_manager)
+    recorder.pytest_sessionfinish(None)
+
+    trace = json.loads((tmp_path / 'trace.json').read_text())
+    assert _spans(trace['traceEvents']) >= {
+        ('pytest main', 'tests', 'wait for manager'),
+        ('pytest main', 'tests', 'connect'),
+        ('pytest main', 'zebra.alice', 'connect'),
+        ('pytest main', 'zebra.alice', 'hold'),
+        ('lego manager', 'zebra.alice', 'hold'),
+    }
+    connect = next(event for event in trace['traceEvents'] if event['name'] == 'connect')
+    assert connect['args']['path'] == 'direct'
+
+
+def test_workers_export_their_own_traces(tmp_path):
+    config = types.SimpleNamespace(workerinput={'workerid': 'gw1'})
+    recorder = TimelineRecorder(config, str(tmp_path / 'trace.json'))
+
+    assert recorder.path == str(tmp_path / 'trace.gw1.json')
+    assert recorder.timeline.process == 'pytest gw1'
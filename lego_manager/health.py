@@ -0,0 +1,266 @@
+"""
+Background health checking of the inventory components.
+A single dispatcher thread hands the due checks to a bounded pool of workers, so the number of
+probes in flight and the rate at which they start never grow with the size of the lab.
+Every component is checked in its own adaptive interval: it doubles while the health of the
+component doesn't change, and falls back to the base interval once it changes, so a stable lab
+of thousands of hosts is probed rarely, while flapping components are watched closely.
+
+A probe is a TCP connection to the RPyC port of the component, or to its SSH port, from which
+RPyC can be deployed. Nothing is sent on the connection.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import concurrent.futures
+import heapq
+import random
+import socket
+import threading
+import time
+
+from .inventory import Inventory, InventoryEntry
+
+# Maximal number of probes in flight.
+DEFAULT_WORKERS = 16
+# Maximal number of probes started every second.
+DEFAULT_MAX_RATE = 50.0
+# Seconds between checks of a component whose health just changed.
+DEFAULT_INTERVAL = 30.0
+# Seconds between checks of a component whose health is stable.
+DEFAULT_MAX_INTERVAL = 600.0
+# Seconds a probe waits for a component to accept a connection.
+DEFAULT_TIMEOUT = 2.0
+# Consecutive failed probes after which a healthy component is considered unhealthy.
+FAILURES_THRESHOLD = 2
+
+
+def probe_tcp(entry: InventoryEntry, timeout: float = DEFAULT_TIMEOUT) -> bool:
+    """Checks whether a component accepts connections on its RPyC or SSH port.
+
+    Args:
+        entry: The component.
+        timeout (optional): Seconds to wait for every port. Defaults to DEFAULT_TIMEOUT.
+
+    Returns:
+        Whether the component is alive.
+    """
+
+    for port in (entry.port, entry.ssh_port):
+        try:
+            socket.create_connection((entry.hostname, port), timeout).close()
+            return True
+        except OSError:
+            continue
+
+    return False
+
+
+class HealthProber:
+    """Keeps the health of the inventory components up to date.
+
+    Attributes:
+        inventory: The components to check, which cache their health.
+        workers: Maximal number of probes in flight.
+        max_rate: Maximal number of probes started every second.
+        interval: Seconds between checks of a component whose health just changed.
+        max_interval: Seconds between checks of a component whose health is stable.
+    """
+
+    inventory: Inventory
+    workers: int
+    max_rate: float
+    interval: float
+    max_interval: float
+
+    def __init__(
+            self,
+            inventory: Inventory,
+            probe: Callable[[InventoryEntry], bool] = probe_tcp,
+            workers: int = DEFAULT_WORKERS,
+            max_rate: float = DEFAULT_MAX_RATE,
+            interval: float = DEFAULT_INTERVAL,
+            max_interval: float = DEFAULT_MAX_INTERVAL,
+            clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """Initiates the prober, every component is due for a check once it is started.
+
+        Args:
+            inventory: The components to check.
+            probe (optional): Checks whether a component is alive. Defaults to probe_tcp.
+            workers (optional): Maximal number of probes in flight. Defaults to DEFAULT_WORKERS.
+            max_rate (optional): Maximal number of probes started every second.
+                                 Defaults to DEFAULT_MAX_RATE.
+            interval (optional): Seconds between checks of a component whose health just
+                                 changed. Defaults to DEFAULT_INTERVAL.
+            max_interval (optional): Seconds between checks of a component whose health is
+                                     stable. Defaults to DEFAULT_MAX_INTERVAL.
+            clock (optional): Monotonic clock. Defaults to time.monotonic.
+        """
+
+        self.inventory = inventory
+        self.workers = workers
+        self.max_rate = max_rate
+        self.interval = interval
+        self.max_interval = max_interval
+        self._probe = probe
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._slots = threading.BoundedSemaphore(workers)
+        # Checks by their due time, an entry is stale if the component was rescheduled since.
+        self._due: List[Tuple[float, str]] = []
+        self._next_check: Dict[str, float] = dict()
+        self._intervals: Dict[str, float] = dict()
+        self._failures: Dict[str, int] = dict()
+        self._in_flight: Dict[str, bool] = dict()
+        now = clock()
+        for entry in inventory:
+            self._schedule(entry.name, now)
+
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._dispatcher: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Starts checking the components in the background."""
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            self.workers, thread_name_prefix='LegoProbe')
+        self._dispatcher = threading.Thread(
+            target=self._dispatch, name='LegoHealth', daemon=True)
+        self._dispatcher.start()
+
+    def stop(self) -> None:
+        """Stops checking the components, and waits for the probes in flight."""
+
+        self._stopped.set()
+        self._wakeup.set()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def check_soon(self, name: str) -> None:
+        """Checks a component as soon as possible, e.g. when a test asks for it while it is
+        considered unhealthy.
+
+        Args:
+            name: The component name.
+        """
+
+        if name in self.inventory:
+            with self._lock:
+                self._schedule(name, self._clock())
+            self._wakeup.set()
+
+    def _schedule(self, name: str, due: float) -> None:
+        """Schedules the next check of a component, the lock should be held.
+
+        Args:
+            name: The component name.
+            due: Monotonic time of the check.
+        """
+
+        if self._in_flight.get(name) or self._next_check.get(name, float('inf')) <= due:
+            return
+
+        self._next_check[name] = due
+        heapq.heappush(self._due, (due, name))
+
+    def _next_due(self) -> Tuple[Optional[str], Optional[float]]:
+        """Pops the next due check.
+
+        Returns:
+            The name of the due component, or the seconds until the next check is due
+            (None if there is no scheduled check).
+        """
+
+        with self._lock:
+            while self._due:
+                due, name = self._due[0]
+                if self._next_check.get(name) != due:
+                    # The component was rescheduled.
+                    heapq.heappop(self._due)
+                    continue
+                delay = due - self._clock()
+                if delay > 0:
+                    return None, delay
+                heapq.heappop(self._due)
+                del self._next_check[name]
+                self._in_flight[name] = True
+                return name, None
+
+        return None, None
+
+    def _dispatch(self) -> None:
+        """Starts the due probes, without exceeding the workers and the rate limits."""
+
+        assert self._executor is not None
+        spacing = 1 / self.max_rate
+        while not self._stopped.is_set():
+            name, delay = self._next_due()
+            if name is None:
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
+                continue
+
+            # Waits for a free worker, so due checks wait here rather than in a queue.
+            self._slots.acquire()
+            self._executor.submit(self._check, name).add_done_callback(
+                lambda _: self._slots.release())
+            self._stopped.wait(spacing)
+
+    def _check(self, name: str) -> None:
+        """Probes a component, and caches its health.
+
+        Args:
+            name: The component name.
+        """
+
+        entry = self.inventory.get(name)
+        assert entry is not None
+        try:
+            alive = self._probe(entry)
+        except Exception:  # pylint: disable=broad-except
+            alive = False
+
+        with self._lock:
+            self._in_flight[name] = False
+            previous = entry.healthy
+            failures = 0 if alive else self._failures.get(name, 0) + 1
+            self._failures[name] = failures
+            if alive:
+                healthy = True
+            elif previous is None or failures >= FAILURES_THRESHOLD:
+                healthy = False
+            else:
+                # A single failure of a healthy component may be a lost packet, it is
+                # checked again soon.
+                healthy = previous
+            stable = previous is not None and healthy == previous and (alive or not healthy)
+            interval = self.interval
+            if stable:
+                interval = min(self._intervals.get(name, self.interval) * 2, self.max_interval)
+            self._intervals[name] = interval
+
+            now = self._clock()
+            self.inventory.set_health(name, healthy, now)
+            # The jitter keeps checks of components added together from staying synchronized.
+            self._schedule(name, now + interval * random.uniform(0.9, 1.1))
+        self._wakeup.set()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Gets the cached health of every component.
+
+        Returns:
+            Health, seconds since the last check and the current check interval of every
+            component, by its name.
+        """
+
+        now = self._clock()
+        with self._lock:
+            return {entry.name: {
+                'healthy': entry.healthy,
+                'checked_ago': None if entry.checked_at is None else now - entry.checked_at,
+                'interval': self._intervals.get(entry.name),
+            } for entry in self.inventory}
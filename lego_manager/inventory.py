@@ -0,0 +1,210 @@
+"""
+Inventory of the components the lego manager allocates.
+The inventory is read from an ini file in the format of the components sections of pytest.ini,
+so a lab can point the manager at the same file its tests use:
+
+    [lego_components]
+    zebra = Octavius.example.components.zebra.Zebra
+
+    [zebra.alice]
+    hostname = alice
+    port = 18812
+
+The [lego_components] section declares the paths of the components classes of the lab.
+
+The inventory caches the health of every component, which the health prober keeps up to date,
+so the manager resolves queries to healthy instances without probing on the request path.
+"""
+from typing import Callable, Dict, Iterator, List, Mapping, Optional
+import configparser
+
+import rpyc
+
+# Port of SSH, which is used to deploy RPyC on components which don't run it.
+SSH_PORT = 22
+# Section of the paths of the components classes, by the names of the classes.
+COMPONENTS_SECTION = 'lego_components'
+
+
+class InventoryEntry:
+    """A component in the inventory.
+
+    Attributes:
+        name: The component name, e.g. 'zebra.alice'.
+        hostname: Hostname of the component.
+        port: Port of the RPyC SlaveService on the component.
+        ssh_port: Port of SSH on the component.
+        healthy: Whether the component was alive when it was last checked, None if it
+                 wasn't checked yet.
+        checked_at: Monotonic time of the last check, None if it wasn't checked yet.
+    """
+
+    name: str
+    hostname: str
+    port: int
+    ssh_port: int
+    healthy: Optional[bool]
+    checked_at: Optional[float]
+
+    def __init__(
+            self,
+            name: str,
+            hostname: str,
+            port: int = rpyc.classic.DEFAULT_SERVER_PORT,
+            ssh_port: int = SSH_PORT
+    ) -> None:
+        """Initiates an entry, whose health is unknown.
+
+        Args:
+            name: The component name, e.g. 'zebra.alice'.
+            hostname: Hostname of the component.
+            port (optional): Port of the RPyC SlaveService. Defaults to RPyC classic port.
+            ssh_port (optional): Port of SSH. Defaults to SSH_PORT.
+        """
+
+        self.name = name
+        self.hostname = hostname
+        self.port = port
+        self.ssh_port = ssh_port
+        self.healthy = None
+        self.checked_at = None
+
+    @property
+    def component_class(self) -> str:
+        """The class of the component, e.g. 'zebra'."""
+
+        return self.name.split('.')[0]
+
+    def __repr__(self) -> str:
+        return f'InventoryEntry({self.name!r}, {self.hostname!r}, healthy={self.healthy})'
+
+
+class Inventory:
+    """The components of the lab, by their names.
+
+    Attributes:
+        component_classes: Paths of the components classes by their names,
+                           e.g. {'zebra': 'Octavius.example.components.zebra.Zebra'}.
+    """
+
+    component_classes: Dict[str, str]
+
+    def __init__(
+            self,
+            entries: List[InventoryEntry],
+            component_classes: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Initiates the inventory.
+
+        Args:
+            entries: The components.
+            component_classes (optional): Paths of the components classes by their names.
+                                          Defaults to none.
+        """
+
+        self.component_classes = dict(component_classes or {})
+        self._entries: Dict[str, InventoryEntry] = {entry.name: entry for entry in entries}
+        # The instances of every class, ordered by their names, so resolving a query doesn't
+        # scan the whole inventory.
+        self._instances: Dict[str, List[InventoryEntry]] = dict()
+        for entry in sorted(self._entries.values(), key=lambda entry: entry.name):
+            self._instances.setdefault(entry.component_class, []).append(entry)
+
+    @classmethod
+    def load(cls, path: str, owns: Optional[Callable[[str], bool]] = None) -> 'Inventory':
+        """Reads the inventory from an ini file.
+
+        Args:
+            path: The ini file.
+            owns (optional): Whether a component belongs to this manager. Defaults to None,
+                             in which case every component belongs to it.
+
+        Returns:
+            The inventory.
+        """
+
+        parser = configparser.ConfigParser()
+        with open(path, encoding='utf-8') as inventory_file:
+            parser.read_file(inventory_file)
+
+        return cls.from_sections({name: parser[name] for name in parser.sections()}, owns)
+
+    @classmethod
+    def from_sections(
+            cls,
+            sections: Mapping[str, Mapping[str, str]],
+            owns: Optional[Callable[[str], bool]] = None
+    ) -> 'Inventory':
+        """Builds the inventory from the sections of an ini file.
+
+        Sections without a hostname, such as [pytest] and [lego], are ignored, except for
+        the [lego_components] section of the components classes.
+
+        Args:
+            sections: The options of the sections, by the names of the sections.
+            owns (optional): Whether a component belongs to this manager. Defaults to None,
+                             in which case every component belongs to it.
+
+        Returns:
+            The inventory.
+        """
+
+        entries = []
+        for name, section in sections.items():
+            if 'hostname' not in section or (owns is not None and not owns(name)):
+                continue
+            entries.append(InventoryEntry(
+                name, section['hostname'],
+                int(section.get('port', rpyc.classic.DEFAULT_SERVER_PORT)),
+                int(section.get('ssh_port', SSH_PORT))))
+
+        return cls(entries, dict(sections.get(COMPONENTS_SECTION, {})))
+
+    def __iter__(self) -> Iterator[InventoryEntry]:
+        return iter(list(self._entries.values()))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._entries
+
+    def get(self, name: str) -> Optional[InventoryEntry]:
+        """Gets a component by its name, None if it isn't in the inventory."""
+
+        return self._entries.get(name)
+
+    def instances(self, component_class: str) -> List[InventoryEntry]:
+        """Gets the instances of a component class, ordered by their names.
+
+        Args:
+            component_class: The class of the components, e.g. 'zebra'.
+        """
+
+        return list(self._instances.get(component_class, ()))
+
+    def is_healthy(self, name: str) -> bool:
+        """Checks whether a component may be handed out.
+
+        Components which weren't checked yet, and components outside of the inventory, are
+        assumed to be healthy.
+
+        Args:
+            name: The component name.
+        """
+
+        entry = self._entries.get(name)
+        return entry is None or entry.healthy is not False
+
+    def set_health(self, name: str, healthy: bool, checked_at: float) -> None:
+        """Caches the result of a health check.
+
+        Args:
+            name: The component name.
+            healthy: Whether the component is alive.
+            checked_at: Monotonic time of the check.
+        """
+
+        entry = self._entries[name]
+        entry.healthy = healthy
+        entry.checked_at = checked_at
@@ -0,0 +1,318 @@
+"""
+Journal of the lego manager allocations.
+Every allocation, release and lease renewal is appended to a journal file before the manager
+relies on it, so a restarted manager can rebuild its allocations and won't hand out components
+which are still in use.
+
+Writes are committed in groups: a single writer thread drains all of the pending records, writes
+them and calls fsync once for the whole group, so concurrent acquisitions share the cost of
+the fsync. If writing fails, the journal is broken: the waiters of the group and of every later
+record get the error, instead of waiting for a commit that never happens.
+
+Once in a while the journal is compacted into a snapshot of the live leases, which keeps the
+recovery time short.
+
+Files layout in the journal directory:
+    snapshot.json - The live leases up to some sequence number.
+    journal.jsonl - A record per line, with sequence numbers following the snapshot.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import os
+import queue
+import threading
+
+SNAPSHOT_FILE = 'snapshot.json'
+JOURNAL_FILE = 'journal.jsonl'
+
+# Leases by their ids, e.g., {'9f1c...': {'components': ['zebra.alice'], 'expires': 1589...}}
+Leases = Dict[str, Dict[str, Any]]
+
+
+def _apply(leases: Leases, record: Dict[str, Any]) -> None:
+    """Applies a journal record to the leases.
+
+    Args:
+        leases: The leases to update.
+        record: A journal record.
+    """
+
+    operation = record['op']
+    if operation == 'allocate':
+        leases[record['lease']] = {
+            'components': record['components'], 'expires': record['expires']}
+    elif operation == 'release':
+        leases.pop(record['lease'], None)
+    elif operation == 'lease':
+        if record['lease'] in leases:
+            leases[record['lease']]['expires'] = record['expires']
+    else:
+        raise ValueError(f'Unknown journal operation: {operation}')
+
+
+class Commit(threading.Event):
+    """Set once a record is durable, or once writing it failed.
+
+    Attributes:
+        error: The error the record failed to be written with, None if it wasn't.
+    """
+
+    error: Optional[BaseException]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.error = None
+
+    def fail(self, error: BaseException) -> None:
+        """Wakes the waiters of a record which failed to be written.
+
+        Args:
+            error: The error of the write.
+        """
+
+        self.error = error
+        self.set()
+
+    def result(self, timeout: Optional[float] = None) -> None:
+        """Waits until the record is durable.
+
+        Args:
+            timeout (optional): Seconds to wait. Defaults to forever.
+
+        Raises:
+            TimeoutError: If the record wasn't written in time.
+            OSError: The error writing the record failed with.
+        """
+
+        if not self.wait(timeout):
+            raise TimeoutError(f'The journal record wasn\'t written in {timeout} seconds')
+        if self.error is not None:
+            raise self.error
+
+
+def _fsync_directory(directory: str) -> None:
+    """Makes the files creations and renames in the directory durable.
+
+    Args:
+        directory: The directory to sync.
+    """
+
+    directory_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+
+
+class Journal:
+    """Append-only, group committed journal of the manager leases.
+
+    Attributes:
+        directory: The directory of the journal files.
+        snapshot_every: Number of records after which the journal is compacted.
+        recovered: The leases which were live when the journal was opened.
+    """
+
+    directory: str
+    snapshot_every: int
+    recovered: Leases
+
+    def __init__(self, directory: str, snapshot_every: int = 1000) -> None:
+        """Recovers the leases from the directory and starts the writer thread.
+
+        Args:
+            directory: The directory of the journal files, created if needed.
+            snapshot_every (optional): Number of records after which the journal is
+                                       compacted. Defaults to 1000.
+        """
+
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+
+        self._leases, self._sequence = self._recover()
+        self.recovered = {lease: dict(state) for lease, state in self._leases.items()}
+        self._records_since_snapshot = 0
+        self._pending: queue.Queue = queue.Queue()
+        # The error which broke the journal, every later record fails with it.
+        self._error: Optional[BaseException] = None
+        self._file = open(self._path(JOURNAL_FILE), 'a', encoding='utf-8')
+        # Compacting at startup drops torn records and the journal of a previous snapshot.
+        self._snapshot()
+
+        self._writer = threading.Thread(target=self._write_loop, name='LegoJournal', daemon=True)
+        self._writer.start()
+
+    def _path(self, name: str) -> str:
+        """Gets the path of a file in the journal directory."""
+
+        return os.path.join(self.directory, name)
+
+    def _recover(self) -> Tuple[Leases, int]:
+        """Rebuilds the leases from the snapshot and the journal after it.
+
+        Returns:
+            The leases and the sequence number of the last record.
+        """
+
+        leases: Leases = dict()
+        sequence = 0
+        try:
+            with open(self._path(SNAPSHOT_FILE), encoding='utf-8') as snapshot_file:
+                snapshot = json.load(snapshot_file)
+            leases, sequence = snapshot['leases'], snapshot['sequence']
+        except FileNotFoundError:
+            pass
+
+        try:
+            with open(self._path(JOURNAL_FILE), encoding='utf-8') as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn write of the last group, which was never acknowledged.
+                        break
+                    # Records up to the snapshot may remain if we crashed while compacting.
+                    if record['seq'] > sequence:
+                        _apply(leases, record)
+                        sequence = record['seq']
+        except FileNotFoundError:
+            pass
+
+        return leases, sequence
+
+    def _append(self, record: Dict[str, Any]) -> Commit:
+        """Queues a record for the writer thread.
+
+        Args:
+            record: The record to write.
+
+        Returns:
+            A commit which is set once the record is durable, or once writing it failed.
+        """
+
+        committed = Commit()
+        self._pending.put((record, committed))
+        return committed
+
+    def allocate(self, lease: str, components: Sequence[str], expires: float) -> Commit:
+        """Records an allocation of components.
+
+        Args:
+            lease: The id of the allocation.
+            components: The allocated components.
+            expires: Time (since the epoch) after which a recovered lease is released.
+
+        Returns:
+            A commit which is set once the record is durable, or once writing it failed.
+        """
+
+        return self._append(
+            {'op': 'allocate', 'lease': lease, 'components': list(components), 'expires': expires})
+
+    def release(self, lease: str) -> Commit:
+        """Records a release of an allocation.
+
+        Args:
+            lease: The id of the allocation.
+
+        Returns:
+            A commit which is set once the record is durable, or once writing it failed.
+        """
+
+        return self._append({'op': 'release', 'lease': lease})
+
+    def renew(self, lease: str, expires: float) -> Commit:
+        """Records a renewal of an allocation lease.
+
+        Args:
+            lease: The id of the allocation.
+            expires: The new expiration time (since the epoch).
+
+        Returns:
+            A commit which is set once the record is durable, or once writing it failed.
+        """
+
+        return self._append({'op': 'lease', 'lease': lease, 'expires': expires})
+
+    def _write_loop(self) -> None:
+        """Writes the pending records in groups, with a single fsync for every group."""
+
+        while True:
+            group = [self._pending.get()]
+            # Drains everything that was queued while the previous group was written.
+            while True:
+                try:
+                    group.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [record for record, _ in group if record is not None]
+            if self._error is None:
+                try:
+                    self._write(records)
+                except Exception as error:  # pylint: disable=broad-except
+                    # The file may hold a torn group, so nothing is written after it.
+                    self._error = error
+            for _, committed in group:
+                if self._error is None:
+                    committed.set()
+                else:
+                    committed.fail(self._error)
+
+            if any(record is None for record, _ in group):
+                # The journal was closed.
+                return
+
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        """Writes records to the journal and makes them durable.
+
+        Args:
+            records: The records to write.
+        """
+
+        if not records:
+            return
+
+        lines = []
+        for record in records:
+            self._sequence += 1
+            record['seq'] = self._sequence
+            _apply(self._leases, record)
+            lines.append(json.dumps(record, separators=(',', ':')))
+
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self._records_since_snapshot += len(records)
+        if self._records_since_snapshot >= self.snapshot_every:
+            self._snapshot()
+
+    def _snapshot(self) -> None:
+        """Compacts the journal into a snapshot of the live leases."""
+
+        temporary_path = self._path(SNAPSHOT_FILE + '.tmp')
+        with open(temporary_path, 'w', encoding='utf-8') as snapshot_file:
+            json.dump({'sequence': self._sequence, 'leases': self._leases}, snapshot_file)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, self._path(SNAPSHOT_FILE))
+        _fsync_directory(self.directory)
+
+        # The snapshot already contains every record, so the journal starts over.
+        self._file.truncate(0)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._records_since_snapshot = 0
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Writes the pending records and closes the journal.
+
+        Args:
+            timeout (optional): Seconds to wait for the writer thread. Defaults to forever.
+        """
+
+        self._pending.put((None, Commit()))
+        self._writer.join(timeout)
+        self._file.close()
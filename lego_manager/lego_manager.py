@@ -10,15 +10,48 @@ Main features:
 The manager runs on a central server.
 
 Note:
-     Most of the features mentioned above aren't implemented yet.
+     The timing of the tests is controlled by the scheduling policy (see scheduler.py),
+     which is chosen by the '--scheduler' argument.
 """
-from typing import List, Dict, Any, Iterator
+from typing import (
+    List, Dict, Any, Callable, Counter, Iterable, Iterator, Optional, Sequence, Set, Tuple)
 
+import argparse
+import collections
 import contextlib
+import heapq
+import itertools
+import json
+import threading
+import time
+import uuid
+
 import rpyc
 
+from Octavius.lego.component_registry import ComponentRegistry
+
+from .health import HealthProber, DEFAULT_WORKERS, DEFAULT_INTERVAL, DEFAULT_MAX_INTERVAL
+from .inventory import Inventory, InventoryEntry
+from .journal import Commit, Journal
+from .locking import StripedLocks
+from .query import has_count_terms, parse_query
+from .scheduler import (
+    Request, SchedulingStatistics, UtilizationScheduler, DEFAULT_MAX_WAIT, SCHEDULERS)
+from .sharding import Shard, SHARDINGS, BY_CLASS
+from .timeline import Timeline, now as timeline_now
+
 _ComponentsToClassPath = Dict[str, str]
 
+# Components classes of the example setup, which the [lego_components] section of the
+# inventory may override.
+DEFAULT_COMPONENT_CLASSES = {
+    'zebra': 'Octavius.example.components.zebra.Zebra',
+    'giraffe': 'Octavius.example.components.giraffe.Giraffe',
+}
+
+# Seconds an allocation recovered from the journal is kept, unless it was renewed.
+LEASE_DURATION = 600.0
+
 
 class LegoManager(rpyc.Service):
     """
@@ -30,12 +63,127 @@ class LegoManager(rpyc.Service):
     ALIASES = ["LegoManager"]
     DEFAULT_PORT = 18861
 
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
+    def __init__(
+            self,
+            *args: Any,
+            journal_directory: Optional[str] = None,
+            shard: Optional[Shard] = None,
+            scheduler: str = 'fifo',
+            max_wait: float = DEFAULT_MAX_WAIT,
+            clock: Callable[[], float] = time.monotonic,
+            trace_path: Optional[str] = None,
+            inventory: Optional[Inventory] = None,
+            prober: Optional[HealthProber] = None,
+            timeline: Optional[Timeline] = None,
+            **kwargs: Any
+    ) -> None:
+        """Initiates the manager, and recovers its allocations from the journal.
+
+        Args:
+            journal_directory (optional): Directory of the allocations journal. Defaults to
+                                          None, in which case the allocations aren't persisted.
+            shard (optional): The shard of the inventory this manager owns. Defaults to None,
+                              in which case the manager owns the whole inventory.
+            scheduler (optional): The name of the scheduling policy of pending requests,
+                                  one of SCHEDULERS. Defaults to 'fifo'.
+            max_wait (optional): Seconds a request may wait before the utilization scheduler
+                                 reserves its components. Defaults to DEFAULT_MAX_WAIT.
+            clock (optional): The clock of the scheduling, replaced by the simulator.
+                              Defaults to time.monotonic.
+            trace_path (optional): File to record the released requests in, for replay by
+                                   the simulator. Defaults to None, for no recording.
+            inventory (optional): The components of the lab, which resolve queries for a
+                                  component class to healthy instances. Defaults to None, in
+                                  which case queries are taken as is.
+            prober (optional): Keeps the health of the inventory components up to date,
+                               it is started by the manager. Defaults to None, for no checks.
+            timeline (optional): Records the acquisitions, and the waits and holds of every
+                                 component. Defaults to None, for no recording.
+        """
+
         super().__init__(*args, **kwargs)
-        # Allocation is a dictionary with the components from the setup as keys, and boolean values
-        # indicating if they are currently in use, e.g., {'zebra.alice': True, 'zebra.logan': False}
-        self._allocations: Dict = dict()
+        self._shard = shard
+        # Allocation is a dictionary with the components in use as keys, and the ids of the
+        # leases holding them as values, e.g., {'zebra.alice': '9f1c...', 'giraffe.bob': '9f1c...'}
+        # A component's allocation and demand are changed only while its stripe is locked.
+        self._allocations: Dict[str, str] = dict()
+        self._locks = StripedLocks()
+        # The components held by every lease.
+        self._leases: Dict[str, List[str]] = dict()
+        # Expiration times of leases recovered from the journal, their holders are gone.
+        self._recovered_leases: Dict[str, float] = dict()
+        # Guards the pending requests, and is notified when they are granted. It is taken
+        # only when components are contended, and always before the stripes.
+        self._allocations_changed = threading.Condition()
+        # Requests waiting for their setup, in order of arrival, with their submission numbers.
+        self._pending: Dict[Request, int] = dict()
+        self._submissions = itertools.count()
+        # The pending requests of every component, so a change of a component reschedules
+        # only the requests which await it.
+        self._awaiting: Dict[str, Set[Request]] = dict()
+        # Number of pending requests for every component.
+        self._demand: Counter = Counter()
+        # The granted request of every live lease.
+        self._granted: Dict[str, Request] = dict()
+        # Journal commits of allocations which weren't handed out yet.
+        self._commits: Dict[str, Commit] = dict()
+        # The components and request of every ticket of the asynchronous acquisitions,
+        # the request is None for a shared setup.
+        self._tickets: Dict[str, Tuple[List[str], Optional[Request]]] = dict()
+        # The session which a query was last resolved to every instance of the inventory for,
+        # the session reuses its components, whose connections are warm. An instance's session
+        # is changed only while its stripe is locked.
+        self._last_sessions: Dict[str, str] = dict()
+        # Guards the statistics, hold times estimations and trace, which all of the
+        # acquisitions update.
+        self._statistics_lock = threading.Lock()
+        self._scheduler = SCHEDULERS[scheduler]()
+        if isinstance(self._scheduler, UtilizationScheduler):
+            self._scheduler.max_wait = max_wait
+        self._scheduler_name = scheduler
+        self._clock = clock
+        self._statistics = SchedulingStatistics(clock())
+        self._trace = None if trace_path is None else open(
+            trace_path, 'a', buffering=1, encoding='utf-8')
         self._bg_threads: Dict = dict()
+        self._inventory = inventory
+        # Paths of the components classes, which are handed to the clients.
+        self._registry = ComponentRegistry()
+        component_classes = dict(DEFAULT_COMPONENT_CLASSES)
+        if inventory is not None:
+            component_classes.update(inventory.component_classes)
+        for name, component_path in component_classes.items():
+            self._registry.register(name, component_path)
+        self._prober = prober
+        self._timeline = timeline
+        if prober is not None:
+            prober.start()
+
+        self._journal: Optional[Journal] = None
+        if journal_directory is not None:
+            self._journal = Journal(journal_directory)
+            for lease, state in self._journal.recovered.items():
+                self._hold(lease, state['components'])
+                self._recovered_leases[lease] = state['expires']
+            threading.Thread(
+                target=self._renew_leases, name='LegoLeases', daemon=True).start()
+
+    def _connect(self, channel: Any, config: Optional[Dict[str, Any]] = None) -> rpyc.Connection:
+        """Connects a client, with a root of its own which owns the tickets it submits.
+
+        Args:
+            channel: The channel of the connection.
+            config (optional): The protocol configuration. Defaults to None, for the default
+                               configuration.
+
+        Returns:
+            The connection.
+        """
+
+        client = _Client(self)
+        conn = self._protocol(client, channel, config or dict())
+        client.on_connect(conn)
+        return conn
 
     def on_connect(self, conn: rpyc.Connection) -> None:
         """Initializes thread for the incoming connection.
@@ -55,93 +203,558 @@ class LegoManager(rpyc.Service):
 
         self._bg_threads.pop(conn).stop()
 
+    @staticmethod
+    def _parse_query(query: str) -> List[str]:
+        """Splits a query to its components, see query.parse_query.
+
+        Args:
+            query: A query that describes the desired setup.
+
+        Returns:
+            Names of the desired components.
+        """
+
+        return parse_query(query)
+
     @contextlib.contextmanager
     def _allocation(
             self,
             query: str,
-            exclusive: bool
+            exclusive: bool,
+            session: Optional[str] = None
     ) -> Iterator[_ComponentsToClassPath]:
         """Manages the components allocations.
 
         Args:
             query: A query that describes the desired setup.
             exclusive: Whether to lock the required setup.
+            session (optional): The session of the query, see _run_query. Defaults to None.
 
         Yields:
             Required components.
         """
 
-        del exclusive  # TODO: Add this functionality.
+        start = None if self._timeline is None else timeline_now()
+        components, request = self._request(query, exclusive, session)
+        if request is None:
+            # A shared setup isn't locked, and doesn't wait for exclusive holders.
+            yield self._get_components_path(components)
+            return
 
-        components = query.split('and')
-
-        self._allocate(components)
+        lease = self._allocate(request)
+        if self._timeline is not None:
+            assert start is not None
+            self._timeline.add('acquire', threading.current_thread().name, start,
+                               timeline_now(), {'components': sorted(components)})
         try:
-            yield self._get_components_path(query)
+            yield self._get_components_path(components)
         finally:
-            self._deallocate(components)
+            self._deallocate(lease)
 
-    def _allocate(self, components: List[str]) -> None:
-        """Allocates the desired components if available.
+    def _check_ownership(self, components: List[str]) -> None:
+        """Checks that the components belong to the shard of this manager.
 
         Args:
             components: Desired components.
+
+        Raises:
+            ValueError: If some of the components belong to other shards.
         """
 
-        for component in components:
-            self._allocations[component] = True
+        if self._shard is None:
+            return
 
-    def _deallocate(self, components: List[str]) -> None:
-        """Deallocates the desired components.
+        foreign = [component for component in components if not self._shard.owns(component)]
+        if foreign:
+            raise ValueError(f'{", ".join(foreign)} not in shard {self._shard.shard_index} '
+                             f'of {self._shard.shard_count} (by {self._shard.sharding})')
+
+    def _request(
+            self,
+            query: str,
+            exclusive: bool,
+            session: Optional[str]
+    ) -> Tuple[List[str], Optional[Request]]:
+        """Resolves a query, and requests its components if the setup is exclusive.
+
+        Components which are free and which no one waits for are held right away, under the
+        locks of their stripes only. Otherwise the request is queued for the scheduler.
+        Instances chosen for a component class are held or queued before the allocations lock
+        is released, so concurrent queries don't choose the same free instances.
+
+        Args:
+            query: A query that describes the desired setup.
+            exclusive: Whether to lock the required setup.
+            session: The session of the query, see _run_query.
+
+        Returns:
+            The components, and their request, which has a lease once it is granted. The
+            request is None for a shared setup.
+
+        Raises:
+            ValueError: If the query can't be resolved, or some of its components belong to
+                        other shards.
+        """
+
+        # Queries of named instances take the allocations lock only when they are contended.
+        resolving = exclusive and self._inventory is not None and \
+            any('.' not in component for component in self._parse_query(query))
+        with self._allocations_changed if resolving else contextlib.nullcontext():
+            components = self._parse_query(self._run_query(query, session))
+            self._check_ownership(components)
+            if not exclusive:
+                return components, None
+
+            request = self._try_hold(components)
+            if request is None:
+                with self._allocations_changed:
+                    request = self._submit(components)
+
+        return components, request
+
+    def _allocate(self, request: Request) -> str:
+        """Waits until the scheduler grants a request.
 
         Args:
-            components: Unneeded components.
+            request: The request of the desired components.
+
+        Returns:
+            The id of the lease which holds the components.
+
+        Raises:
+            OSError: If the allocation failed to be journaled, the components are released.
         """
 
+        if request.lease is None:
+            with self._allocations_changed:
+                while request.lease is None:
+                    self._allocations_changed.wait(self._next_expiration())
+                    self._expire_recovered_leases()
+
+        assert request.lease is not None
+        committed = self._commits.pop(request.lease, None)
+        if committed is not None:
+            # The components are handed out only once the allocation survives a crash.
+            try:
+                committed.result()
+            except Exception:
+                self._deallocate(request.lease)
+                raise
+
+        return request.lease
+
+    def _try_hold(self, components: List[str]) -> Optional[Request]:
+        """Holds uncontended components without the scheduler.
+
+        Args:
+            components: Desired components.
+
+        Returns:
+            The granted request, or None if some of the components are busy or awaited.
+        """
+
+        now = self._clock()
+        with self._locks.holding(components):
+            if any(component in self._allocations or self._demand[component]
+                   for component in components):
+                return None
+
+            request = Request(components, now)
+            request.lease = uuid.uuid4().hex
+            request.granted_at = now
+            self._granted[request.lease] = request
+            self._hold(request.lease, sorted(request.components), journal=True)
+
+        with self._statistics_lock:
+            self._statistics.requested(request)
+            self._statistics.granted(request)
+            self._statistics.update(now, len(self._allocations), bool(self._pending))
+
+        return request
+
+    def _submit(self, components: List[str]) -> Request:
+        """Queues a request for the scheduler, the allocations lock should be held.
+
+        Args:
+            components: Desired components.
+
+        Returns:
+            The request, which has a lease once it is granted.
+        """
+
+        request = Request(components, self._clock())
+        self._pending[request] = next(self._submissions)
+        for component in request.components:
+            self._awaiting.setdefault(component, set()).add(request)
+        # Once the components are awaited, they are no longer held without the scheduler.
+        with self._locks.holding(request.components):
+            self._demand.update(request.components)
+        with self._statistics_lock:
+            self._statistics.requested(request)
+        self._schedule(request.components)
+
+        return request
+
+    def _schedule(self, changed: Iterable[str]) -> None:
+        """Grants the pending requests chosen by the scheduler, the allocations lock should be
+        held.
+
+        Only the requests which await the changed components may have become grantable, and
+        only if all of their components are free, so the others aren't considered. The oldest
+        request is always considered, since the scheduler may reserve components for it.
+
+        Args:
+            changed: The components which were released, or whose demand changed.
+        """
+
+        now = self._clock()
+        grants = []
+        # Nothing can be granted while all of the demanded components are busy, which is
+        # common when many requests are waiting.
+        if any(component not in self._allocations for component in self._demand):
+            candidates = {request for component in changed if component not in self._allocations
+                          for request in self._awaiting.get(component, ())
+                          if request.components.isdisjoint(self._allocations)}
+            candidates.add(next(iter(self._pending)))
+            grants = self._scheduler.select(
+                sorted(candidates, key=self._pending.__getitem__), self._expected_releases(now),
+                now, self._demand)
+
+        for request in grants:
+            request.lease = uuid.uuid4().hex
+            request.granted_at = now
+            self._granted[request.lease] = request
+            with self._locks.holding(request.components):
+                # Awaited components are never held without the scheduler, so they are
+                # still free.
+                self._hold(request.lease, sorted(request.components), journal=True)
+                self._forget_demand(request)
+
+        with self._statistics_lock:
+            for request in grants:
+                self._statistics.granted(request)
+            self._statistics.update(now, len(self._allocations), bool(self._pending))
+        if grants:
+            self._allocations_changed.notify_all()
+
+    def _forget_demand(self, request: Request) -> None:
+        """Removes a request from the pending requests, and stops counting it in the demand of
+        its components. The allocations lock and the stripes of the components should be held.
+
+        Args:
+            request: A request which was granted or withdrawn.
+        """
+
+        del self._pending[request]
+        for component in request.components:
+            self._awaiting[component].discard(request)
+            if not self._awaiting[component]:
+                del self._awaiting[component]
+        self._demand.subtract(request.components)
+        for component in request.components:
+            if not self._demand[component]:
+                del self._demand[component]
+
+    def _withdraw(self, request: Request) -> bool:
+        """Withdraws a pending request, the allocations lock should be held.
+
+        Args:
+            request: The request.
+
+        Returns:
+            Whether the request was withdrawn, False if it was already granted.
+        """
+
+        if request.lease is not None:
+            return False
+
+        with self._locks.holding(request.components):
+            self._forget_demand(request)
+        with self._statistics_lock:
+            self._statistics.withdrawn()
+        # Requests may have been waiting behind the withdrawn one.
+        self._schedule(request.components)
+
+        return True
+
+    def _expected_releases(self, now: float) -> Dict[str, float]:
+        """Estimates when every busy component will be released.
+
+        Args:
+            now: The current monotonic time.
+
+        Returns:
+            Expected monotonic release time of every busy component.
+        """
+
+        expected_releases = dict()
+        # Uncontended leases come and go concurrently, copying the dictionary is atomic.
+        for lease, components in list(self._leases.items()):
+            if lease in self._recovered_leases:
+                release = now + self._recovered_leases[lease] - time.time()
+            else:
+                request = self._granted.get(lease)
+                if request is None or request.granted_at is None:
+                    # Released meanwhile.
+                    continue
+                release = request.granted_at + self._scheduler.estimator.estimate(request.key)
+            for component in components:
+                expected_releases[component] = release
+
+        return expected_releases
+
+    def _deallocate(self, lease: str) -> None:
+        """Deallocates the components of a lease.
+
+        Args:
+            lease: The id of the lease which holds the unneeded components.
+        """
+
+        self._release(lease)
+
+    def _hold(self, lease: str, components: List[str], journal: bool = False) -> None:
+        """Marks components as held by a lease, their stripes should be locked.
+
+        Args:
+            lease: The id of the lease.
+            components: The components of the lease.
+            journal (optional): Whether to journal the allocation. Defaults to False.
+        """
+
+        self._leases[lease] = components
         for component in components:
-            del self._allocations[component]
+            self._allocations[component] = lease
+        if journal and self._journal is not None:
+            # Journaled under the stripes, so the records of a component are in the order of
+            # its allocations and releases.
+            self._commits[lease] = self._journal.allocate(
+                lease, components, time.time() + LEASE_DURATION)
 
-    @staticmethod
-    def _get_components_path(query: str) -> _ComponentsToClassPath:
+    def _release(self, lease: str) -> None:
+        """Frees the components of a lease, and lets the scheduler hand them out if they are
+        awaited.
+
+        Args:
+            lease: The id of the lease.
+        """
+
+        components = self._leases[lease]
+        with self._locks.holding(components):
+            for component in components:
+                del self._allocations[component]
+            del self._leases[lease]
+            awaited = any(self._demand[component] for component in components)
+            if self._journal is not None:
+                # Losing a release only delays the components until the lease expires,
+                # so there is no need to wait for it.
+                self._journal.release(lease)
+
+        request = self._granted.pop(lease, None)
+        with self._statistics_lock:
+            if request is not None:
+                assert request.granted_at is not None
+                hold_time = self._clock() - request.granted_at
+                self._scheduler.estimator.observe(request.key, hold_time)
+                self._statistics.released()
+                if self._timeline is not None:
+                    self._record_spans(request, hold_time)
+                if self._trace is not None:
+                    self._trace.write(json.dumps({
+                        'arrival': request.arrival,
+                        'components': sorted(request.components),
+                        'hold': hold_time}) + '\n')
+            if not awaited:
+                self._statistics.update(
+                    self._clock(), len(self._allocations), bool(self._pending))
+
+        if awaited:
+            with self._allocations_changed:
+                self._schedule(components)
+
+    def _record_spans(self, request: Request, hold_time: float) -> None:
+        """Records the wait and the hold of a released request on its components' tracks.
+
+        Args:
+            request: The released request.
+            hold_time: Seconds the request held its components.
+        """
+
+        assert self._timeline is not None and request.granted_at is not None
+        # The scheduling clock isn't the timeline's, so the spans are placed back from now.
+        end = timeline_now()
+        granted_at = end - int(hold_time * 1e6)
+        arrival = granted_at - int((request.granted_at - request.arrival) * 1e6)
+        args = {'lease': request.lease, 'components': sorted(request.components)}
+        for component in sorted(request.components):
+            if arrival < granted_at:
+                self._timeline.add('wait', component, arrival, granted_at, args)
+            self._timeline.add('hold', component, granted_at, end, args)
+
+    def _expire_recovered_leases(self) -> None:
+        """Releases recovered leases which expired, the allocations lock should be held."""
+
+        now = time.time()
+        for lease, expires in list(self._recovered_leases.items()):
+            if expires <= now:
+                del self._recovered_leases[lease]
+                self._release(lease)
+
+    def _next_expiration(self) -> Optional[float]:
+        """Seconds until the next recovered lease expires, or None if there isn't any."""
+
+        if not self._recovered_leases:
+            return None
+
+        return max(0.0, min(self._recovered_leases.values()) - time.time())
+
+    def _renew_leases(self) -> None:
+        """Renews the leases of live allocations periodically, so they survive a crash."""
+
+        assert self._journal is not None
+        while True:
+            time.sleep(LEASE_DURATION / 3)
+            expires = time.time() + LEASE_DURATION
+            with self._allocations_changed:
+                live_leases = [lease for lease in list(self._leases)
+                               if lease not in self._recovered_leases]
+            for lease in live_leases:
+                self._journal.renew(lease, expires)
+
+    def _get_components_path(self, components: List[str]) -> _ComponentsToClassPath:
         """Maps between components names to the path of their python class objects.
 
         Args:
-            query: A query that describes the desired setup.
+            components: Names of the desired components.
 
         Returns:
             Desired components and the corresponding path to their class objects.
-        """
-
-        # TODO: Get this dictionary from Lego's DB/management files.
-        components_to_class_path = {
-            'zebra': 'Octavius.example.components.zebra.Zebra',
-            'giraffe': 'Octavius.example.components.giraffe.Giraffe',
-        }
 
-        test_components = (component.strip() for component in query.split('and'))
+        Raises:
+            KeyError: If the class of a component isn't declared.
+        """
 
-        return {component: components_to_class_path[component.split('.')[0]]
-                for component in test_components}
+        return {component: self._registry.path(component.split('.')[0])
+                for component in components}
 
-    @staticmethod
-    def _run_query(query: str) -> str:
+    def _run_query(self, query: str, session: Optional[str] = None) -> str:
         """Find available setup according to given query.
 
-        Runs the requested setup query on the setup management files, and add instance names
-        to components with unspecified names.
-        For example, query given - 'zebra.alice and elephant',
-        query returned - 'zebra.alice and elephant.bob'.
+        Runs the requested setup query on the inventory, and add instance names to
+        components with unspecified names. Unhealthy instances are skipped, and the
+        instances of every class are chosen together by _best_fit.
+        For example, query given - 'zebra.alice and elephant*2',
+        query returned - 'zebra.alice and elephant.bob and elephant.dan'.
 
         Args:
             query: A query that describes the desired setup.
+            session (optional): The session of the query, which its recently used instances
+                                are preferred for. Defaults to None.
 
         Returns:
             Final components query for the test. Each component should be built from
             component class and instance name.
+
+        Raises:
+            ValueError: If a requested instance is unhealthy, or there aren't enough healthy
+                        instances of a requested class.
+        """
+
+        if self._inventory is None:
+            if has_count_terms(query):
+                raise ValueError(f'{query} requests instances by count, which needs an inventory')
+            return query
+
+        components = self._parse_query(query)
+        unhealthy = [component for component in components
+                     if not self._inventory.is_healthy(component)]
+        if unhealthy:
+            if self._prober is not None:
+                # Recovered components are handed out once the prober notices them.
+                for component in unhealthy:
+                    self._prober.check_soon(component)
+            raise ValueError(f'{", ".join(unhealthy)} unhealthy, failing fast instead of '
+                             f'waiting for the test to time out')
+
+        chosen = {component for component in components if '.' in component}
+        # The indices of the components with unspecified names, by their class.
+        unnamed: Dict[str, List[int]] = dict()
+        for index, component in enumerate(components):
+            if '.' not in component:
+                unnamed.setdefault(component, []).append(index)
+
+        if unnamed:
+            # Only the choice of instances needs the allocations lock, named instances are
+            # resolved under their stripes alone.
+            with self._allocations_changed:
+                for component_class, indices in unnamed.items():
+                    instances = self._best_fit(component_class, len(indices), chosen, session)
+                    if len(instances) < len(indices):
+                        raise ValueError(f'No healthy instance of {component_class} is left '
+                                         f'for {query}, {len(indices)} are needed')
+                    for index, instance in zip(indices, instances):
+                        components[index] = instance
+                    chosen.update(instances)
+
+        if session is not None:
+            # Only instances of the inventory are remembered, so this is bounded.
+            remembered = [component for component in components if component in self._inventory]
+            with self._locks.holding(remembered):
+                for component in remembered:
+                    self._last_sessions[component] = session
+
+        return ' and '.join(components)
+
+    def _best_fit(
+            self,
+            component_class: str,
+            count: int,
+            chosen: Set[str],
+            session: Optional[str]
+    ) -> List[str]:
+        """Chooses instances of a class for a query, the allocations lock should be held.
+
+        The healthy instances which the query didn't choose yet are ranked by:
+            1. Free and not awaited, so the setup is granted right away. Then awaited, and
+               then busy instances, which are waited for.
+            2. Known to be healthy, over ones which weren't checked yet.
+            3. Last used by the same session, whose connections to them are warm.
+            4. On a host with fewer free instances of the class, so larger free groups are
+               kept for the queries which need them.
+        Only the best instances are sorted, so resolving a query is linear in the instances
+        of the class.
+
+        Args:
+            component_class: The class of the components, e.g. 'zebra'.
+            count: The number of instances to choose.
+            chosen: Instances which the query already chose.
+            session: The session of the query, None if it is unknown.
+
+        Returns:
+            The chosen instances, fewer than count if there aren't enough healthy ones.
         """
-        return query
 
-    def exposed_acquire_setup(self, query: str, exclusive: bool):  # type: ignore
+        assert self._inventory is not None
+        candidates = [entry for entry in self._inventory.instances(component_class)
+                      if entry.name not in chosen and entry.healthy is not False]
+        free_on_host: Counter = collections.Counter(
+            entry.hostname for entry in candidates
+            if entry.name not in self._allocations and not self._demand[entry.name])
+
+        def rank(entry: InventoryEntry) -> Tuple[int, bool, bool, int, str]:
+            availability = (2 if entry.name in self._allocations
+                            else 1 if self._demand[entry.name] else 0)
+            warm = session is not None and self._last_sessions.get(entry.name) == session
+            return (availability, entry.healthy is not True, not warm,
+                    free_on_host[entry.hostname], entry.name)
+
+        return [entry.name for entry in heapq.nsmallest(count, candidates, key=rank)]
+
+    def exposed_acquire_setup(  # type: ignore
+            self,
+            query: str,
+            exclusive: bool,
+            session: Optional[str] = None
+    ):
         """Acquired the desired setup if available.
 
         This function also will store all of the data about the setup usage.
@@ -151,32 +764,284 @@ class LegoManager(rpyc.Service):
             The query syntax is -
                 1. The components should be splitted by the word 'and'.
                 2. The format should be <component_class>.<instance_name>,
-                   or only <component_class> if specific instance isn't needed.
+                   or only <component_class> if specific instance isn't needed,
+                   or <component_class>*<count> for several instances of the class.
             Example:
-                 'zebra.alice and elephant.bob and giraffe.4'.
+                 'zebra.alice and elephant.bob and giraffe.4 and zebra*2'.
 
             exclusive: Whether the required setup is needed exclusively.
+            session (optional): Identifies the requesting test session, which is handed the
+                                instances it recently used when the query allows it.
+                                Defaults to None.
 
         Returns:
             Allocated requested setup as list of tuples made of
             components names and corresponding paths to Components classes.
             e.g. [('zebra.alice', 'Octavius.example.components.zebra.Zebra'), ...]
         """
-        return self._allocation(self._run_query(query), exclusive)
+        return self._allocation(query, exclusive, session)
+
+    def exposed_submit_setup(
+            self,
+            query: str,
+            exclusive: bool,
+            session: Optional[str] = None
+    ) -> str:
+        """Requests the desired setup without waiting for it, for asynchronous clients.
+
+        Args:
+            query: A query that describes the desired setup, see exposed_acquire_setup.
+            exclusive: Whether the required setup is needed exclusively.
+            session (optional): Identifies the requesting test session, see
+                                exposed_acquire_setup. Defaults to None.
+
+        Returns:
+            A ticket, which is polled until the setup is granted, and then released.
+        """
+
+        components, request = self._request(query, exclusive, session)
+        ticket = uuid.uuid4().hex
+        self._tickets[ticket] = (components, request)
+        return ticket
+
+    def exposed_poll_setup(self, ticket: str) -> Optional[Tuple[Tuple[str, str], ...]]:
+        """Checks whether the setup of a ticket was granted.
+
+        Args:
+            ticket: The ticket of the request.
+
+        Returns:
+            None while the setup is pending. Once it is granted, the components names and the
+            corresponding paths to Components classes, in the order of the query.
+
+        Raises:
+            OSError: If the allocation failed to be journaled.
+        """
+
+        components, request = self._tickets[ticket]
+        if request is not None:
+            if request.lease is None and self._recovered_leases:
+                # Nobody waits on the condition for this request, so the poll expires them.
+                with self._allocations_changed:
+                    self._expire_recovered_leases()
+            if request.lease is None:
+                return None
+            committed = self._commits.get(request.lease)
+            if committed is not None:
+                # The components are handed out only once the allocation survives a crash.
+                if not committed.is_set():
+                    return None
+                # Raises the journal's error, the components are freed by releasing the ticket.
+                committed.result()
+                self._commits.pop(request.lease, None)
+
+        # A tuple is passed by value.
+        return tuple(self._get_components_path(components).items())
+
+    def exposed_release_setup(self, ticket: str) -> None:
+        """Releases the setup of a ticket, or withdraws its request if it is still pending.
+
+        Args:
+            ticket: The ticket of the request.
+        """
+
+        _, request = self._tickets.pop(ticket)
+        if request is None:
+            return
+
+        with self._allocations_changed:
+            if self._withdraw(request):
+                return
+
+        assert request.lease is not None
+        self._commits.pop(request.lease, None)
+        self._deallocate(request.lease)
+
+    def exposed_get_statistics(self) -> Dict[str, Any]:
+        """Gets the statistics of the setup usage.
+
+        Returns:
+            The scheduler name, the number of busy components and pending requests, and
+            the throughput, utilization, fragmentation and wait time statistics.
+        """
+
+        with self._statistics_lock:
+            statistics: Dict[str, Any] = self._statistics.summary(self._clock())
+            statistics.update(
+                scheduler=self._scheduler_name,
+                busy=len(self._allocations),
+                pending=len(self._pending))
+
+        return statistics
+
+    def exposed_get_timeline(self, since: int = 0) -> str:
+        """Gets the recorded spans of the manager, as Chrome trace events.
+
+        Args:
+            since (optional): Only spans which ended since this time are returned, in wall clock
+                              microseconds. Defaults to all of the spans.
+
+        Returns:
+            JSON list of the trace events, which is passed by value. Empty if recording is
+            disabled.
+        """
+
+        return json.dumps([] if self._timeline is None else self._timeline.events(since))
+
+    def exposed_get_health(self) -> Dict[str, Dict[str, Any]]:
+        """Gets the cached health of the inventory components.
+
+        Returns:
+            Health, seconds since the last check and the current check interval of every
+            component, by its name. Empty if health checking is disabled.
+        """
+
+        return {} if self._prober is None else self._prober.summary()
+
+
+class _Client(rpyc.Service):
+    """The root of a client's connection, which passes the requests to the shared lego manager.
+
+    The tickets the client didn't release are released once it disconnects, so a client which
+    crashed or was killed doesn't hold its components, or keep them awaited, until the manager
+    restarts.
+    """
+
+    ALIASES = LegoManager.ALIASES
+
+    def __init__(self, manager: LegoManager) -> None:
+        """Initiates the root of a client's connection.
+
+        Args:
+            manager: The shared lego manager.
+        """
+
+        super().__init__()
+        self._manager = manager
+        self._tickets: Set[str] = set()
+        self._tickets_lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        """Passes the other exposed methods to the lego manager."""
+
+        if not name.startswith('exposed_'):
+            raise AttributeError(name)
+        return getattr(self._manager, name)
+
+    def on_connect(self, conn: rpyc.Connection) -> None:
+        """Initializes thread for the incoming connection.
+
+        Args:
+            conn: An incoming connection.
+        """
+
+        self._manager.on_connect(conn)
+
+    def on_disconnect(self, conn: rpyc.Connection) -> None:
+        """Releases the tickets of the client, and stops the connection's thread.
+
+        Args:
+            conn: A disconnected connection.
+        """
+
+        with self._tickets_lock:
+            tickets, self._tickets = self._tickets, set()
+        for ticket in tickets:
+            self._manager.exposed_release_setup(ticket)
+        self._manager.on_disconnect(conn)
+
+    def exposed_submit_setup(
+            self,
+            query: str,
+            exclusive: bool,
+            session: Optional[str] = None
+    ) -> str:
+        """Requests the desired setup for the client, see LegoManager.exposed_submit_setup."""
+
+        ticket = self._manager.exposed_submit_setup(query, exclusive, session)
+        with self._tickets_lock:
+            self._tickets.add(ticket)
+        return ticket
+
+    def exposed_release_setup(self, ticket: str) -> None:
+        """Releases a ticket of the client, see LegoManager.exposed_release_setup."""
+
+        with self._tickets_lock:
+            self._tickets.discard(ticket)
+        self._manager.exposed_release_setup(ticket)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Starts Lego server.
+
+    Args:
+        argv (optional): Command line arguments. Defaults to sys.argv.
+    """
+
+    parser = argparse.ArgumentParser(description='Lego manager server.')
+    parser.add_argument('--host', default='', help='The host to bind to. Defaults to all.')
+    parser.add_argument('--port', type=int, default=LegoManager.DEFAULT_PORT,
+                        help='The TCP listener port.')
+    parser.add_argument('--journal', metavar='DIRECTORY',
+                        help='Directory of the allocations journal, used to recover after restart.')
+    parser.add_argument('--shard', metavar='INDEX/COUNT',
+                        help='The shard of the inventory this manager owns, e.g. 0/3.')
+    parser.add_argument('--sharding', choices=SHARDINGS, default=BY_CLASS,
+                        help='How components are mapped to shards.')
+    parser.add_argument('--scheduler', choices=sorted(SCHEDULERS), default='fifo',
+                        help='The scheduling policy of pending requests.')
+    parser.add_argument('--max-wait', type=float, default=DEFAULT_MAX_WAIT,
+                        help='Seconds a request may wait before the utilization scheduler '
+                             'reserves its components.')
+    parser.add_argument('--record-trace', metavar='FILE',
+                        help='File to record the requests in, for replay by the simulator.')
+    parser.add_argument('--inventory', metavar='FILE',
+                        help='Ini file of the components, in the format of pytest.ini.')
+    parser.add_argument('--probe-workers', type=int, default=DEFAULT_WORKERS,
+                        help='Maximal number of health probes in flight, 0 disables probing.')
+    parser.add_argument('--probe-interval', type=float, default=DEFAULT_INTERVAL,
+                        help='Seconds between health checks of a component which changed.')
+    parser.add_argument('--probe-max-interval', type=float, default=DEFAULT_MAX_INTERVAL,
+                        help='Seconds between health checks of a stable component.')
+    parser.add_argument('--timeline', metavar='FILE',
+                        help='Chrome trace file to export the timeline of the allocations to, '
+                             'at exit. The plugin also fetches it over the connection.')
+    args = parser.parse_args(argv)
+    shard = None if args.shard is None else Shard.parse(args.shard, args.sharding)
 
+    inventory = prober = None
+    if args.inventory is not None:
+        inventory = Inventory.load(args.inventory, None if shard is None else shard.owns)
+        if args.probe_workers > 0:
+            prober = HealthProber(
+                inventory, workers=args.probe_workers, interval=args.probe_interval,
+                max_interval=args.probe_max_interval)
 
-def main() -> None:
-    """Starts Lego server."""
+    # The timeline is always recorded, so the plugin can fetch it, it is cheap.
+    timeline = Timeline('lego manager')
 
     rpyc.lib.setup_logger()
     from rpyc.utils.server import ThreadedServer  # pylint: disable=import-outside-toplevel
     # Note: all connection will use the same LegoManager
     lego_server = ThreadedServer(
-        LegoManager(),
-        port=LegoManager.DEFAULT_PORT,
+        LegoManager(
+            journal_directory=args.journal,
+            shard=shard,
+            scheduler=args.scheduler,
+            max_wait=args.max_wait,
+            trace_path=args.record_trace,
+            inventory=inventory,
+            prober=prober,
+            timeline=timeline),
+        hostname=args.host,
+        port=args.port,
         protocol_config={'allow_public_attrs': True}
     )
-    lego_server.start()
+    try:
+        lego_server.start()
+    finally:
+        if args.timeline is not None:
+            timeline.export(args.timeline)
 
 
 if __name__ == "__main__":
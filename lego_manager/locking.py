@@ -0,0 +1,61 @@
+"""
+Striped locks of the lego manager components.
+Every component is guarded by one of a fixed number of locks, chosen by the hash of its name.
+A set of components is locked by taking the locks of its stripes in ascending order, so two
+acquisitions of overlapping sets never wait for each other in a cycle, and acquisitions of
+disjoint sets usually don't wait at all.
+"""
+from typing import Iterable, Iterator, List
+import contextlib
+import threading
+import zlib
+
+DEFAULT_STRIPES = 64
+
+
+class StripedLocks:
+    """A fixed number of locks which guard any number of components.
+
+    Attributes:
+        stripes: The number of locks.
+    """
+
+    stripes: int
+
+    def __init__(self, stripes: int = DEFAULT_STRIPES) -> None:
+        """Initiates the locks.
+
+        Args:
+            stripes (optional): The number of locks. Defaults to DEFAULT_STRIPES.
+        """
+
+        self.stripes = stripes
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def stripes_of(self, components: Iterable[str]) -> List[int]:
+        """Gets the stripes of components, in the canonical order they are locked in.
+
+        Args:
+            components: Names of the components.
+
+        Returns:
+            The distinct stripes, in ascending order.
+        """
+
+        # Python's hash() is randomized per process, crc32 keeps the stripes reproducible.
+        return sorted({zlib.crc32(component.encode()) % self.stripes
+                       for component in components})
+
+    @contextlib.contextmanager
+    def holding(self, components: Iterable[str]) -> Iterator[None]:
+        """Locks all of the components, for an all or nothing change of their state.
+
+        Args:
+            components: Names of the components.
+        """
+
+        stripes = self.stripes_of(components)
+        with contextlib.ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._locks[stripe])
+            yield
@@ -0,0 +1,53 @@
+"""
+Parsing of setup queries. Both the lego manager and the plugin's router of sharded managers use
+this module, so they always agree on the components of a query.
+
+A query is made of terms joined by 'and', every term is one of:
+
+    zebra.alice - The instance 'alice' of the class 'zebra'.
+    zebra - Any instance of the class 'zebra'.
+    zebra*4 - Any 4 distinct instances of the class 'zebra'.
+"""
+from typing import List
+import re
+
+# A term which requests several instances of a class, e.g. 'zebra*4'.
+_COUNT_TERM = re.compile(r'(?P<component_class>[^.*\s]+)\s*\*\s*(?P<count>\d+)')
+
+
+def parse_query(query: str) -> List[str]:
+    """Splits a query to its components, a count term is expanded to a term of its class for
+    every requested instance.
+
+    Args:
+        query: A query that describes the desired setup.
+
+    Returns:
+        Names of the desired components, classes for components with unspecified names.
+
+    Raises:
+        ValueError: If a count term requests no instances.
+    """
+
+    components = []
+    for term in re.split(r'\s+and\s+', query.strip()):
+        match = _COUNT_TERM.fullmatch(term)
+        if match is None:
+            components.append(term)
+            continue
+        count = int(match.group('count'))
+        if count < 1:
+            raise ValueError(f'{term} in {query} requests no instances')
+        components.extend([match.group('component_class')] * count)
+
+    return components
+
+
+def has_count_terms(query: str) -> bool:
+    """Checks whether a query requests several instances of a class in a single term.
+
+    Args:
+        query: A query that describes the desired setup.
+    """
+
+    return any(_COUNT_TERM.fullmatch(term) for term in re.split(r'\s+and\s+', query.strip()))
@@ -0,0 +1,377 @@
+"""
+Scheduling policies of the lego manager.
+A scheduler sees all of the pending setup requests, and decides which of them are granted
+together. The schedulers don't depend on time or threads, the manager (or the simulator) gives
+them the current time and the expected release times of the busy components.
+
+Schedulers:
+    fifo - Grants every request whose components are free, in order of arrival.
+    utilization - Prefers requests that block fewer other requests and hold their setup for
+                  less time, so more disjoint setups run in parallel. The oldest request that
+                  waited too long reserves its components, and other requests may use the
+                  reserved components only if they are expected to finish before it starts.
+"""
+from typing import Deque, Dict, FrozenSet, List, Mapping, Optional, Sequence, Set, Tuple, Union
+import abc
+import collections
+
+# Seconds a setup is expected to be held before there is any history.
+DEFAULT_HOLD_TIME = 60.0
+# Seconds a request may wait before it reserves its components. Reservations leave components
+# idle, so they are kept as a bound on the waiting of large requests rather than the common case.
+DEFAULT_MAX_WAIT = 5 * 60.0
+# Number of the latest waits the wait percentiles are computed over.
+WAITS_WINDOW = 10000
+
+
+class Request:
+    """A pending request for a setup.
+
+    Attributes:
+        components: The requested components.
+        key: Identifies similar requests, used to learn their hold time.
+        arrival: The time the request arrived.
+        lease: The id of the lease, set when the request is granted.
+        granted_at: The time the request was granted.
+    """
+
+    components: FrozenSet[str]
+    key: str
+    arrival: float
+    lease: Optional[str]
+    granted_at: Optional[float]
+
+    def __init__(self, components: Sequence[str], arrival: float) -> None:
+        """Initiates a request.
+
+        Args:
+            components: The requested components.
+            arrival: The time the request arrived.
+        """
+
+        self.components = frozenset(components)
+        self.key = ' and '.join(sorted(self.components))
+        self.arrival = arrival
+        self.lease = None
+        self.granted_at = None
+
+    def __repr__(self) -> str:
+        return f'Request({self.key!r}, arrival={self.arrival})'
+
+
+class HoldTimeEstimator:
+    """Learns how long setups are held, by an exponential moving average per request key.
+
+    Requests without history of their own are estimated by requests of the same size.
+    """
+
+    def __init__(self, smoothing: float = 0.3, default: float = DEFAULT_HOLD_TIME) -> None:
+        """Initiates the estimator.
+
+        Args:
+            smoothing (optional): Weight of the newest observation. Defaults to 0.3.
+            default (optional): Estimation for requests without history, until any request
+                                is observed. Defaults to DEFAULT_HOLD_TIME.
+        """
+
+        self._smoothing = smoothing
+        self._estimations: Dict[Union[str, int], float] = dict()
+        self._overall = default
+
+    def observe(self, key: str, hold_time: float) -> None:
+        """Learns from a released setup.
+
+        Args:
+            key: The key of the request.
+            hold_time: Seconds the setup was held.
+        """
+
+        for estimation_key in (key, self._size_key(key)):
+            previous = self._estimations.get(estimation_key, hold_time)
+            self._estimations[estimation_key] = previous + self._smoothing * (hold_time - previous)
+        self._overall += self._smoothing * (hold_time - self._overall)
+
+    def estimate(self, key: str) -> float:
+        """Estimates the hold time of a request.
+
+        Args:
+            key: The key of the request.
+
+        Returns:
+            Expected seconds the setup will be held.
+        """
+
+        try:
+            return self._estimations[key]
+        except KeyError:
+            return self._estimations.get(self._size_key(key), self._overall)
+
+    @staticmethod
+    def _size_key(key: str) -> int:
+        """Gets the number of components of a request by its key."""
+
+        return key.count(' and ') + 1
+
+
+class Scheduler(metaclass=abc.ABCMeta):
+    """Decides which pending requests are granted.
+
+    Attributes:
+        estimator: The hold times estimator, which the manager updates on every release.
+    """
+
+    estimator: HoldTimeEstimator
+
+    def __init__(self, estimator: Optional[HoldTimeEstimator] = None) -> None:
+        self.estimator = HoldTimeEstimator() if estimator is None else estimator
+
+    @abc.abstractmethod
+    def select(
+            self,
+            pending: Sequence[Request],
+            busy: Mapping[str, float],
+            now: float,
+            demand: Optional[Mapping[str, int]] = None
+    ) -> List[Request]:
+        """Selects the requests to grant now.
+
+        The manager passes only the pending requests which may have become grantable, those
+        which await changed components, and the oldest pending request.
+
+        Args:
+            pending: The pending requests to consider, in order of arrival.
+            busy: Expected release time of every busy component.
+            now: The current time.
+            demand (optional): Number of pending requests for every component, including the
+                               requests which aren't considered. Defaults to counting the
+                               considered requests.
+
+        Returns:
+            Requests with disjoint free components, to grant together.
+        """
+
+
+class FifoScheduler(Scheduler):
+    """Grants every request whose components are free, in order of arrival."""
+
+    def select(
+            self,
+            pending: Sequence[Request],
+            busy: Mapping[str, float],
+            now: float,
+            demand: Optional[Mapping[str, int]] = None
+    ) -> List[Request]:
+        taken = set(busy)
+        grants = []
+        for request in pending:
+            if request.components.isdisjoint(taken):
+                grants.append(request)
+                taken.update(request.components)
+
+        return grants
+
+
+class UtilizationScheduler(Scheduler):
+    """Maximizes the number of setups which run in parallel, without starving large ones.
+
+    Attributes:
+        max_wait: Seconds a request may wait before it is prioritized and may reserve its
+                  components.
+    """
+
+    max_wait: float
+
+    def __init__(
+            self,
+            estimator: Optional[HoldTimeEstimator] = None,
+            max_wait: float = DEFAULT_MAX_WAIT
+    ) -> None:
+        """Initiates the scheduler.
+
+        Args:
+            estimator (optional): The hold times estimator. Defaults to a new estimator.
+            max_wait (optional): Seconds a request may wait before it reserves its components.
+                                 Defaults to DEFAULT_MAX_WAIT.
+        """
+
+        super().__init__(estimator)
+        self.max_wait = max_wait
+
+    def select(
+            self,
+            pending: Sequence[Request],
+            busy: Mapping[str, float],
+            now: float,
+            demand: Optional[Mapping[str, int]] = None
+    ) -> List[Request]:
+        taken = set(busy)
+        grants = []
+        # The oldest starving request which can't start yet reserves its components, from the
+        # time it is expected to start. Reserving for a single request keeps the others flowing.
+        reservation: FrozenSet[str] = frozenset()
+        reservation_start = now
+
+        candidates = []
+        for request in pending:
+            starving = now - request.arrival >= self.max_wait
+            if starving and not reservation:
+                if request.components.isdisjoint(taken):
+                    grants.append(request)
+                    taken.update(request.components)
+                    continue
+                reservation = request.components
+                # It starts once the last of its busy components is released.
+                reservation_start = max(
+                    max(busy.get(component, now) for component in request.components), now)
+            elif request.components.isdisjoint(taken):
+                candidates.append((not starving, request))
+
+        # Requests which contend with fewer other requests are granted first, since granting
+        # them blocks less of the others. Shorter requests free their components sooner.
+        contenders: Mapping[str, int]
+        if demand is None:
+            contenders = collections.Counter(
+                component for request in pending for component in request.components)
+        else:
+            contenders = demand
+
+        def priority(candidate: Tuple[bool, Request]) -> Tuple[bool, int, float, float]:
+            not_starving, request = candidate
+            if not not_starving:
+                # Starving requests are served by their age.
+                return False, 0, 0.0, request.arrival
+            contention = sum(contenders[component] - 1 for component in request.components)
+            return True, contention, self.estimator.estimate(request.key), request.arrival
+
+        for _, request in sorted(candidates, key=priority):
+            if not request.components.isdisjoint(taken):
+                continue
+            if not request.components.isdisjoint(reservation) and \
+                    now + self.estimator.estimate(request.key) > reservation_start:
+                # Would delay the starving request.
+                continue
+            grants.append(request)
+            taken.update(request.components)
+
+        return grants
+
+
+SCHEDULERS = {
+    'fifo': FifoScheduler,
+    'utilization': UtilizationScheduler,
+}
+
+
+class SchedulingStatistics:
+    """Measures how well the setup is utilized.
+
+    Statistics:
+        throughput: Released setups per second.
+        utilization: Fraction of the components time in which they were busy.
+        fragmentation: Fraction of the components time in which they were free while
+                       requests were waiting, since the free components didn't fit them.
+        wait percentiles: Seconds the latest WAITS_WINDOW requests waited until they were
+                          granted.
+    """
+
+    def __init__(self, now: float) -> None:
+        """Initiates the statistics.
+
+        Args:
+            now: The time the measurement starts.
+        """
+
+        self._start = self._last_update = now
+        self._components: Set[str] = set()
+        self._busy = 0
+        self._idle_while_waiting = 0
+        self._busy_area = 0.0
+        self._idle_while_waiting_area = 0.0
+        self._components_area = 0.0
+        self._waits: Deque[float] = collections.deque(maxlen=WAITS_WINDOW)
+        self._granted = 0
+        self._total_wait = 0.0
+        self._releases = 0
+        self._withdrawals = 0
+
+    def update(self, now: float, busy: int, waiting: bool) -> None:
+        """Accounts the state since the previous update, and records the new state.
+
+        Args:
+            now: The current time.
+            busy: Number of busy components.
+            waiting: Whether some requests are waiting.
+        """
+
+        elapsed = now - self._last_update
+        self._busy_area += self._busy * elapsed
+        self._idle_while_waiting_area += self._idle_while_waiting * elapsed
+        self._components_area += len(self._components) * elapsed
+
+        self._last_update = now
+        self._busy = busy
+        self._idle_while_waiting = len(self._components) - busy if waiting else 0
+
+    def requested(self, request: Request) -> None:
+        """Records a new request.
+
+        Args:
+            request: The request.
+        """
+
+        self._components.update(request.components)
+
+    def granted(self, request: Request) -> None:
+        """Records a granted request.
+
+        Args:
+            request: The request, after it was granted.
+        """
+
+        assert request.granted_at is not None
+        wait = request.granted_at - request.arrival
+        self._waits.append(wait)
+        self._granted += 1
+        self._total_wait += wait
+
+    def released(self) -> None:
+        """Records a released setup."""
+
+        self._releases += 1
+
+    def withdrawn(self) -> None:
+        """Records a request which was withdrawn before it was granted."""
+
+        self._withdrawals += 1
+
+    def summary(self, now: float) -> Dict[str, float]:
+        """Summarizes the statistics.
+
+        Args:
+            now: The current time.
+
+        Returns:
+            The statistics by their names.
+        """
+
+        self.update(now, self._busy, bool(self._idle_while_waiting))
+        elapsed = now - self._start
+        waits = sorted(self._waits)
+
+        def percentile(fraction: float) -> float:
+            return waits[min(len(waits) - 1, int(fraction * len(waits)))] if waits else 0.0
+
+        return {
+            'granted': self._granted,
+            'released': self._releases,
+            'withdrawn': self._withdrawals,
+            'throughput': self._releases / elapsed if elapsed else 0.0,
+            'utilization': (self._busy_area / self._components_area
+                            if self._components_area else 0.0),
+            'fragmentation': (self._idle_while_waiting_area / self._components_area
+                              if self._components_area else 0.0),
+            'wait_mean': self._total_wait / self._granted if self._granted else 0.0,
+            'wait_p50': percentile(0.50),
+            'wait_p90': percentile(0.90),
+            'wait_p99': percentile(0.99),
+        }
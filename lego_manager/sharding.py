@@ -0,0 +1,77 @@
+"""
+Sharding of the inventory between several lego managers.
+Every manager owns the components which are mapped to its shard, and the lego plugin routes
+every component of a query to the manager of its shard. Both sides use this module, so they
+always agree on the mapping.
+"""
+from typing import NamedTuple
+import zlib
+
+# Components of the same class are owned by the same manager.
+BY_CLASS = 'class'
+# Components are spread between managers by their full name.
+BY_INSTANCE = 'instance'
+SHARDINGS = (BY_CLASS, BY_INSTANCE)
+
+
+class Shard(NamedTuple):
+    """A shard owned by a lego manager.
+
+    Attributes:
+        shard_index: The index of the shard.
+        shard_count: The total number of shards.
+        sharding: How components are mapped to shards, either BY_CLASS or BY_INSTANCE.
+    """
+
+    shard_index: int
+    shard_count: int
+    sharding: str = BY_CLASS
+
+    @classmethod
+    def parse(cls, description: str, sharding: str = BY_CLASS) -> 'Shard':
+        """Parses a shard description.
+
+        Args:
+            description: Shard index and count, e.g. '0/3'.
+            sharding (optional): How components are mapped to shards. Defaults to BY_CLASS.
+
+        Returns:
+            The described shard.
+        """
+
+        index, count = (int(number) for number in description.split('/'))
+        if not 0 <= index < count:
+            raise ValueError(f'Invalid shard {description}, index should be less than count')
+        if sharding not in SHARDINGS:
+            raise ValueError(f'Unknown sharding {sharding}, should be one of {SHARDINGS}')
+
+        return cls(index, count, sharding)
+
+    def owns(self, component: str) -> bool:
+        """Checks whether a component belongs to this shard.
+
+        Args:
+            component: The component name, e.g. 'zebra.alice'.
+        """
+
+        return shard_of(component, self.shard_count, self.sharding) == self.shard_index
+
+
+def shard_of(component: str, count: int, sharding: str = BY_CLASS) -> int:
+    """Maps a component to its shard.
+
+    Components without an instance name (e.g. 'zebra') are mapped by their class in both
+    shardings, since any instance of the class may be chosen for them.
+
+    Args:
+        component: The component name, e.g. 'zebra.alice'.
+        count: The total number of shards.
+        sharding (optional): How components are mapped to shards. Defaults to BY_CLASS.
+
+    Returns:
+        The index of the shard.
+    """
+
+    key = component.split('.')[0] if sharding == BY_CLASS else component
+    # Python's hash() is randomized per process, so all of the processes use crc32.
+    return zlib.crc32(key.encode()) % count
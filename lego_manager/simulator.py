@@ -0,0 +1,208 @@
+"""
+Discrete event simulator of the lego manager allocation policies.
+The simulator replays a trace of setup requests through the real LegoManager allocation logic,
+on a virtual clock and without RPyC, and reports how every scheduling policy performed.
+A day of traffic is replayed in seconds, so policies can be compared before trying them in the lab.
+
+A trace is a JSON lines file, every line describes a request:
+    {"arrival": 12.5, "components": ["zebra.alice", "giraffe.bob"], "hold": 95.0}
+Traces are recorded by running the manager with '--record-trace', or generated synthetically.
+
+Usage example:
+    python -m Octavius.lego_manager.simulator --trace trace.jsonl
+    python -m Octavius.lego_manager.simulator --synthetic --duration 86400 --rate 0.2
+"""
+from typing import (
+    Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple)
+import argparse
+import heapq
+import itertools
+import json
+import random
+import sys
+import time
+
+from .lego_manager import LegoManager
+from .scheduler import Request, SCHEDULERS
+
+
+class TraceEntry(NamedTuple):
+    """A recorded setup request.
+
+    Attributes:
+        arrival: Seconds since the start of the trace.
+        components: The requested components.
+        hold: Seconds the setup was held once it was granted.
+    """
+
+    arrival: float
+    components: Tuple[str, ...]
+    hold: float
+
+
+def load_trace(path: str) -> List[TraceEntry]:
+    """Loads a recorded trace, relatively to its first request.
+
+    Args:
+        path: The path of the JSON lines trace.
+
+    Returns:
+        The requests of the trace in order of arrival.
+    """
+
+    with open(path, encoding='utf-8') as trace_file:
+        entries = [json.loads(line) for line in trace_file if line.strip()]
+
+    entries.sort(key=lambda entry: entry['arrival'])
+    start = entries[0]['arrival'] if entries else 0.0
+    return [TraceEntry(entry['arrival'] - start, tuple(entry['components']), entry['hold'])
+            for entry in entries]
+
+
+def synthetic_trace(
+        duration: float,
+        rate: float,
+        instances: Dict[str, int],
+        mean_hold: float = 60.0,
+        max_components: int = 4,
+        seed: Optional[int] = None
+) -> Iterator[TraceEntry]:
+    """Generates requests with Poisson arrivals and exponential hold times.
+
+    Most of the requests are for a single component, and the larger ones are held longer.
+
+    Args:
+        duration: Seconds of traffic to generate.
+        rate: Mean number of requests per second.
+        instances: Number of instances of every component class, e.g. {'zebra': 10}.
+        mean_hold (optional): Mean seconds a single component is held. Defaults to 60.
+        max_components (optional): The largest request size. Defaults to 4.
+        seed (optional): Seed of the random generator, for reproducible traces.
+
+    Yields:
+        The requests in order of arrival.
+    """
+
+    generator = random.Random(seed)
+    inventory = [f'{component_class}.{index}'
+                 for component_class, count in sorted(instances.items())
+                 for index in range(count)]
+    sizes = range(1, min(max_components, len(inventory)) + 1)
+    # Every size is half as common as the previous one.
+    weights = [2 ** -size for size in sizes]
+
+    arrival = generator.expovariate(rate)
+    while arrival < duration:
+        size = generator.choices(sizes, weights)[0]
+        components = tuple(generator.sample(inventory, size))
+        hold = generator.expovariate(1 / (mean_hold * size))
+        yield TraceEntry(arrival, components, hold)
+        arrival += generator.expovariate(rate)
+
+
+class _VirtualClock:
+    """A clock which moves only when the simulator advances it."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def simulate(trace: Iterable[TraceEntry], scheduler: str) -> Dict[str, Any]:
+    """Replays a trace through a LegoManager.
+
+    Args:
+        trace: The requests, in order of arrival.
+        scheduler: The name of the scheduling policy.
+
+    Returns:
+        The manager statistics at the end of the replay, and the replay wall time.
+    """
+
+    # pylint: disable=protected-access
+    clock = _VirtualClock()
+    manager = LegoManager(scheduler=scheduler, clock=clock)
+    sequence = itertools.count()
+    # Events are (time, sequence, hold, request), a release event has no hold.
+    events: List[Tuple[float, int, Optional[float], Any]] = []
+    # Hold times of the requests whose release isn't scheduled yet.
+    holds: Dict[Request, float] = dict()
+    # Leases whose release is scheduled.
+    scheduled: Set[str] = set()
+    wall_start = time.perf_counter()
+
+    trace_iterator = iter(trace)
+
+    def push_next_arrival() -> None:
+        entry = next(trace_iterator, None)
+        if entry is not None:
+            heapq.heappush(events, (entry.arrival, next(sequence), entry.hold, entry.components))
+
+    push_next_arrival()
+    with manager._allocations_changed:
+        while events:
+            clock.now, _, hold, payload = heapq.heappop(events)
+            if hold is None:
+                scheduled.remove(payload)
+                manager._release(payload)
+            else:
+                # Like an acquisition, uncontended components are held without the scheduler.
+                request = manager._try_hold(list(payload))
+                if request is None:
+                    request = manager._submit(list(payload))
+                holds[request] = hold
+                push_next_arrival()
+
+            # Schedules the releases of the requests granted by this event. The granted
+            # requests are bounded by the components, unlike the waiting ones.
+            for lease, request in list(manager._granted.items()):
+                if lease not in scheduled:
+                    scheduled.add(lease)
+                    heapq.heappush(
+                        events, (clock.now + holds.pop(request), next(sequence), None, lease))
+
+    statistics = manager.exposed_get_statistics()
+    statistics.update(simulated=clock.now, wall_time=time.perf_counter() - wall_start)
+    return statistics
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Compares the scheduling policies over a trace.
+
+    Args:
+        argv (optional): Command line arguments. Defaults to sys.argv.
+    """
+
+    parser = argparse.ArgumentParser(description='Lego manager allocation policies simulator.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--trace', help='A trace recorded by the manager (--record-trace).')
+    source.add_argument('--synthetic', action='store_true', help='Generate a synthetic trace.')
+    parser.add_argument('--schedulers', nargs='+', choices=sorted(SCHEDULERS),
+                        default=sorted(SCHEDULERS))
+    parser.add_argument('--duration', type=float, default=24 * 60 * 60,
+                        help='Seconds of synthetic traffic.')
+    parser.add_argument('--rate', type=float, default=0.05,
+                        help='Synthetic requests per second.')
+    parser.add_argument('--instances', type=int, default=10,
+                        help='Synthetic instances of every component class.')
+    parser.add_argument('--mean-hold', type=float, default=60.0,
+                        help='Synthetic mean seconds a single component is held.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.trace is not None:
+        trace = load_trace(args.trace)
+    else:
+        trace = list(synthetic_trace(
+            args.duration, args.rate, {'zebra': args.instances, 'giraffe': args.instances},
+            args.mean_hold, seed=args.seed))
+
+    report = {scheduler: simulate(trace, scheduler) for scheduler in args.schedulers}
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# type: ignore
+# pylint: skip-file
+import threading
+import time
+
+import pytest
+
+from Octavius.lego_manager.health import HealthProber, probe_tcp
+from Octavius.lego_manager.inventory import Inventory, InventoryEntry
+from Octavius.lego_manager.lego_manager import LegoManager
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_inventory_is_loaded_from_pytest_ini(tmp_path):
+    ini = tmp_path / 'pytest.ini'
+    ini.write_text('[pytest]\n[lego]\nlego_manager_port = 18861\n'
+                   '[zebra.alice]\nhostname = alice\nport = 1234\n'
+                   '[giraffe.bob]\nhostname = giraffe\n')
+
+    inventory = Inventory.load(str(ini))
+    assert [entry.name for entry in inventory] == ['zebra.alice', 'giraffe.bob']
+    assert inventory.get('zebra.alice').port == 1234
+
+    inventory = Inventory.load(str(ini), owns=lambda name: name.startswith('giraffe'))
+    assert 'zebra.alice' not in inventory and 'giraffe.bob' in inventory
+
+
+def test_components_classes_are_declared_by_the_inventory(tmp_path):
+    ini = tmp_path / 'pytest.ini'
+    ini.write_text('[lego_components]\nzebra = collections.OrderedDict\n'
+                   'okapi = collections:Counter\n'
+                   '[zebra.alice]\nhostname = alice\n[okapi.carl]\nhostname = carl\n')
+
+    inventory = Inventory.load(str(ini))
+    assert [entry.name for entry in inventory] == ['zebra.alice', 'okapi.carl']
+    manager = LegoManager(inventory=inventory)
+    assert manager._get_components_path(['zebra.alice', 'okapi', 'giraffe.bob']) == {
+        'zebra.alice': 'collections.OrderedDict', 'okapi': 'collections:Counter',
+        'giraffe.bob': 'Octavius.example.components.giraffe.Giraffe'}
+    with pytest.raises(KeyError, match='not declared'):
+        manager._get_components_path(['gnu.dan'])
+
+
+def test_probes_are_bounded():
+    inventory = Inventory([InventoryEntry(f'zebra.{index}', 'localhost') for index in range(200)])
+    lock = threading.Lock()
+    in_flight = [0]
+    peak = [0]
+
+    def probe(entry):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.005)
+        with lock:
+            in_flight[0] -= 1
+        return True
+
+    prober = HealthProber(inventory, probe, workers=4, max_rate=2000, interval=60)
+    prober.start()
+    try:
+        _wait_until(lambda: all(entry.healthy for entry in inventory))
+    finally:
+        prober.stop()
+    assert peak[0] == 4
+
+
+def test_intervals_adapt_to_stability():
+    inventory = Inventory([InventoryEntry('zebra.stable', 'localhost'),
+                           InventoryEntry('zebra.flapping', 'localhost')])
+    flaps = [0]
+
+    def probe(entry):
+        if entry.name == 'zebra.stable':
+            return True
+        flaps[0] += 1
+        # Fails twice in a row, so it is considered unhealthy, then recovers.
+        return flaps[0] % 4 in (0, 1)
+
+    prober = HealthProber(inventory, probe, max_rate=1000, interval=0.01, max_interval=0.08)
+    prober.start()
+    try:
+        _wait_until(lambda: prober.summary()['zebra.stable']['interval'] == 0.08)
+        assert prober.summary()['zebra.flapping']['interval'] == 0.01
+    finally:
+        prober.stop()
+
+
+def test_single_failure_is_tolerated():
+    inventory = Inventory([InventoryEntry('zebra.alice', 'localhost')])
+    results = iter([True, False, False])
+    prober = HealthProber(inventory, lambda entry: next(results))
+
+    for expected in (True, True, False):
+        prober._check('zebra.alice')
+        assert inventory.get('zebra.alice').healthy is expected
+
+
+def test_probe_tcp():
+    assert not probe_tcp(InventoryEntry('zebra.alice', '127.0.0.1', port=1, ssh_port=1), 0.1)
+
+
+@pytest.fixture
+def inventory():
+    return Inventory([InventoryEntry(name, 'localhost')
+                      for name in ('zebra.alice', 'zebra.bob', 'zebra.dead', 'giraffe.bob')])
+
+
+def test_queries_skip_unhealthy_instances(inventory):
+    inventory.set_health('zebra.dead', False, 0)
+    inventory.set_health('zebra.alice', True, 0)
+    manager = LegoManager(inventory=inventory)
+
+    assert manager._run_query('zebra and giraffe') == 'zebra.alice and giraffe.bob'
+    assert manager._run_query('zebra.alice and zebra') == 'zebra.alice and zebra.bob'
+    with manager.exposed_acquire_setup('zebra.alice', exclusive=True):
+        # A free healthy instance is preferred.
+        assert manager._run_query('zebra') == 'zebra.bob'
+
+    start = time.monotonic()
+    with pytest.raises(ValueError, match='zebra.dead'):
+        manager._run_query('zebra.dead')
+    with pytest.raises(ValueError, match='No healthy instance'):
+        manager._run_query('zebra and zebra and zebra')
+    assert time.monotonic() - start < 0.1
+
+
+def test_unhealthy_request_triggers_a_check(inventory):
+    checked = threading.Event()
+
+    def probe(entry):
+        if entry.name == 'zebra.dead' and entry.healthy is False:
+            checked.set()
+        return entry.name != 'zebra.dead'
+
+    prober = HealthProber(inventory, probe, max_rate=1000, interval=60)
+    manager = LegoManager(inventory=inventory, prober=prober)
+    try:
+        _wait_until(lambda: inventory.get('zebra.dead').healthy is False)
+        with pytest.raises(ValueError):
+            manager._run_query('zebra.dead')
+        assert checked.wait(2)
+        assert manager.exposed_get_health()['zebra.dead']['healthy'] is False
+    finally:
+        prober.stop()
@@ -0,0 +1,118 @@
+# type: ignore
+# pylint: skip-file
+import os
+import threading
+import time
+
+import pytest
+
+from Octavius.lego_manager import lego_manager
+from Octavius.lego_manager.journal import Journal, JOURNAL_FILE
+from Octavius.lego_manager.lego_manager import LegoManager
+
+
+def test_recover_leases(tmp_path):
+    journal = Journal(str(tmp_path))
+    journal.allocate('a', ['zebra.alice'], expires=1.0)
+    journal.allocate('b', ['giraffe.bob', 'zebra.logan'], expires=2.0)
+    journal.renew('b', expires=3.0)
+    journal.release('a').wait()
+    journal.close()
+
+    assert Journal(str(tmp_path)).recovered == {
+        'b': {'components': ['giraffe.bob', 'zebra.logan'], 'expires': 3.0}}
+
+
+def test_recover_from_snapshot_and_torn_journal(tmp_path):
+    journal = Journal(str(tmp_path), snapshot_every=3)
+    for index in range(5):
+        journal.allocate(str(index), [f'zebra.{index}'], expires=1.0)
+    journal.release('0').wait()
+    journal.close()
+    # A crash in the middle of a group commit.
+    with open(os.path.join(str(tmp_path), JOURNAL_FILE), 'a') as journal_file:
+        journal_file.write('{"op":"release","lea')
+
+    assert sorted(Journal(str(tmp_path)).recovered) == ['1', '2', '3', '4']
+
+
+def test_concurrent_allocations_are_grouped(tmp_path, monkeypatch):
+    fsyncs = []
+    original_fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: fsyncs.append(fd) or original_fsync(fd))
+    journal = Journal(str(tmp_path))
+    fsyncs.clear()
+
+    commits = [journal.allocate(str(index), [f'zebra.{index}'], expires=1.0)
+               for index in range(100)]
+    for committed in commits:
+        committed.wait()
+    journal.close()
+
+    assert len(fsyncs) < len(commits)
+    assert len(Journal(str(tmp_path)).recovered) == 100
+
+
+def test_manager_keeps_recovered_allocations(tmp_path, monkeypatch):
+    monkeypatch.setattr(lego_manager, 'LEASE_DURATION', 0.3)
+    manager = LegoManager(journal_directory=str(tmp_path))
+    allocation = manager.exposed_acquire_setup('zebra.alice and giraffe.bob', True)
+    allocation.__enter__()
+    # The manager crashes while the setup is in use.
+    manager._journal.close()
+
+    restarted = LegoManager(journal_directory=str(tmp_path))
+    assert restarted._allocations.keys() == {'zebra.alice', 'giraffe.bob'}
+
+    # The holder is gone, so the setup is handed out again once its lease expires.
+    with restarted.exposed_acquire_setup('giraffe.bob', True):
+        assert list(restarted._allocations) == ['giraffe.bob']
+    assert restarted._allocations == {}
+
+
+def test_acquire_waits_for_release():
+    manager = LegoManager()
+    acquired = threading.Event()
+
+    def acquire():
+        with manager.exposed_acquire_setup('zebra.alice', True):
+            acquired.set()
+
+    with manager.exposed_acquire_setup('zebra.alice and giraffe.bob', True):
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        assert not acquired.wait(0.1)
+
+    thread.join(1)
+    assert acquired.is_set()
+
+
+class _FailingFile:
+    def write(self, data):
+        raise OSError('No space left on device')
+
+    def close(self):
+        pass
+
+
+def test_write_errors_reach_the_waiters(tmp_path):
+    manager = LegoManager(journal_directory=str(tmp_path))
+    manager._journal._file = _FailingFile()
+
+    with pytest.raises(OSError, match='No space'):
+        with manager.exposed_acquire_setup('zebra.alice', True):
+            pass
+    assert manager._allocations == {} and manager._commits == {}
+
+    # The journal is broken, so later records fail too instead of blocking.
+    with pytest.raises(OSError, match='No space'):
+        manager._journal.renew('lease', expires=1.0).result(timeout=1)
+
+    ticket = manager.exposed_submit_setup('giraffe.bob', True)
+    deadline = time.monotonic() + 5
+    with pytest.raises(OSError, match='No space'):
+        while manager.exposed_poll_setup(ticket) is None:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    manager.exposed_release_setup(ticket)
+    assert manager._allocations == {}
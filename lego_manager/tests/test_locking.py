@@ -0,0 +1,124 @@
+# type: ignore
+# pylint: skip-file
+import random
+import threading
+
+from Octavius.lego_manager.inventory import Inventory, InventoryEntry
+from Octavius.lego_manager.lego_manager import LegoManager
+from Octavius.lego_manager.locking import StripedLocks
+
+
+class _CountingCondition:
+    """Counts the times the manager-wide condition is taken."""
+
+    def __init__(self, condition):
+        self._condition = condition
+        self.entered = 0
+
+    def __enter__(self):
+        self.entered += 1
+        return self._condition.__enter__()
+
+    def __exit__(self, *args):
+        return self._condition.__exit__(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._condition, name)
+
+
+def _run_threads(target, count):
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+        assert not thread.is_alive(), 'deadlock'
+
+
+def test_stripes_are_locked_in_canonical_order():
+    locks = StripedLocks(8)
+    components = [f'zebra.{index}' for index in range(20)]
+
+    assert locks.stripes_of(components) == sorted(set(locks.stripes_of(components)))
+    assert locks.stripes_of(components) == locks.stripes_of(reversed(components))
+    assert len(locks.stripes_of(components)) <= 8
+    with locks.holding(components):
+        pass
+    with locks.holding(reversed(components)):
+        pass
+
+
+def test_disjoint_setups_skip_the_manager_lock():
+    manager = LegoManager()
+    manager._allocations_changed = _CountingCondition(manager._allocations_changed)
+
+    def acquire(index):
+        for _ in range(50):
+            with manager.exposed_acquire_setup(f'zebra.{index} and giraffe.{index}', True):
+                pass
+
+    _run_threads(acquire, 8)
+    assert manager._allocations_changed.entered == 0
+    assert manager.exposed_get_statistics()['granted'] == 400
+
+
+def test_disjoint_setups_of_the_inventory_skip_the_manager_lock():
+    inventory = Inventory([InventoryEntry(f'{component_class}.{index}', 'localhost')
+                           for component_class in ('zebra', 'giraffe') for index in range(8)])
+    manager = LegoManager(inventory=inventory)
+    manager._allocations_changed = _CountingCondition(manager._allocations_changed)
+
+    def acquire(index):
+        for _ in range(50):
+            with manager.exposed_acquire_setup(f'zebra.{index} and giraffe.{index}', True,
+                                               session=f'session-{index}'):
+                pass
+
+    _run_threads(acquire, 8)
+    assert manager._allocations_changed.entered == 0
+    assert manager.exposed_get_statistics()['granted'] == 400
+    assert manager._last_sessions['giraffe.3'] == 'session-3'
+
+
+def test_only_unnamed_terms_take_the_manager_lock():
+    inventory = Inventory([InventoryEntry(f'zebra.{index}', 'localhost') for index in range(4)])
+    manager = LegoManager(inventory=inventory)
+    manager._allocations_changed = _CountingCondition(manager._allocations_changed)
+
+    components, request = manager._request('zebra.0 and zebra.1', True, 'alice')
+    assert components == ['zebra.0', 'zebra.1'] and request.lease is not None
+    assert manager._allocations_changed.entered == 0
+    assert manager._last_sessions == {'zebra.0': 'alice', 'zebra.1': 'alice'}
+
+    components, request = manager._request('zebra', True, 'bob')
+    assert components == ['zebra.2'] and request.lease is not None
+    assert manager._allocations_changed.entered > 0
+    assert manager._last_sessions['zebra.2'] == 'bob'
+
+
+def test_overlapping_setups_are_all_or_nothing():
+    manager = LegoManager()
+    components = ['zebra.a', 'zebra.b', 'zebra.c', 'giraffe.a']
+    holders = dict()
+    lock = threading.Lock()
+    violations = []
+
+    def acquire(index):
+        generator = random.Random(index)
+        for _ in range(100):
+            setup = generator.sample(components, generator.randint(1, 3))
+            with manager.exposed_acquire_setup(' and '.join(setup), True) as allocated:
+                assert list(allocated) == setup
+                with lock:
+                    if any(component in holders for component in setup):
+                        violations.append(setup)
+                    holders.update(dict.fromkeys(setup, index))
+                with lock:
+                    for component in setup:
+                        del holders[component]
+
+    _run_threads(acquire, 8)
+    assert not violations
+    statistics = manager.exposed_get_statistics()
+    assert statistics['granted'] == statistics['released'] == 800
+    assert statistics['busy'] == statistics['pending'] == 0
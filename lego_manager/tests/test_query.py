@@ -0,0 +1,94 @@
+# type: ignore
+# pylint: skip-file
+import threading
+import time
+
+import pytest
+
+from Octavius.lego_manager.inventory import Inventory, InventoryEntry
+from Octavius.lego_manager.lego_manager import LegoManager
+from Octavius.lego_manager.query import has_count_terms, parse_query
+
+
+def test_count_terms_are_expanded():
+    assert parse_query('zebra*3 and giraffe.bob and zebra * 1') == [
+        'zebra', 'zebra', 'zebra', 'giraffe.bob', 'zebra']
+    assert has_count_terms('giraffe and zebra*2')
+    assert not has_count_terms('giraffe and zebra.alice')
+    with pytest.raises(ValueError, match='no instances'):
+        parse_query('zebra*0')
+    with pytest.raises(ValueError, match='needs an inventory'):
+        LegoManager()._run_query('zebra*2')
+
+
+@pytest.fixture
+def inventory():
+    # Host 'rack' has a larger group of zebras than host 'desk'.
+    return Inventory([InventoryEntry(name, hostname) for name, hostname in (
+        ('zebra.a', 'rack'), ('zebra.b', 'rack'), ('zebra.c', 'rack'),
+        ('zebra.d', 'desk'), ('zebra.e', 'desk'), ('giraffe.bob', 'desk'))])
+
+
+def test_best_fit_keeps_larger_free_groups(inventory):
+    manager = LegoManager(inventory=inventory)
+
+    assert manager._run_query('zebra*2 and giraffe') == 'zebra.d and zebra.e and giraffe.bob'
+    assert manager._run_query('zebra.d and zebra*2') == 'zebra.d and zebra.e and zebra.a'
+    with pytest.raises(ValueError, match='4 are needed'):
+        manager._run_query('zebra.a and zebra.b and zebra*4')
+
+
+def test_idle_healthy_and_warm_instances_are_preferred(inventory):
+    manager = LegoManager(inventory=inventory)
+
+    with manager.exposed_acquire_setup('zebra.d and zebra.e', exclusive=True):
+        # Free instances are preferred, the busy ones are waited for.
+        assert manager._run_query('zebra*4') == 'zebra.a and zebra.b and zebra.c and zebra.d'
+
+    inventory.set_health('zebra.c', True, 0)
+    assert manager._run_query('zebra') == 'zebra.c'
+    inventory.set_health('zebra.c', None, 0)
+
+    # The session is handed the instance it used, over the best fit.
+    with manager.exposed_acquire_setup('zebra.a', exclusive=True, session='worker'):
+        pass
+    assert manager._run_query('zebra', session='worker') == 'zebra.a'
+    assert manager._run_query('zebra', session='other') == 'zebra.d'
+
+
+def test_concurrent_queries_choose_different_instances(inventory):
+    manager = LegoManager(inventory=inventory)
+    try_hold = manager._try_hold
+
+    def slow_try_hold(components):
+        time.sleep(0.1)
+        return try_hold(components)
+
+    manager._try_hold = slow_try_hold
+    both_acquired = threading.Barrier(3, timeout=5)
+    chosen = []
+
+    def acquire():
+        with manager.exposed_acquire_setup('zebra', exclusive=True) as components:
+            chosen.extend(components)
+            both_acquired.wait()
+
+    threads = [threading.Thread(target=acquire) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    # Neither query waits for the instance the other one chose.
+    both_acquired.wait()
+    for thread in threads:
+        thread.join()
+    assert len(set(chosen)) == 2
+
+
+def test_resolution_is_fast_on_large_inventories():
+    inventory = Inventory([InventoryEntry(f'zebra.{index}', f'host{index % 500}')
+                           for index in range(20000)])
+    manager = LegoManager(inventory=inventory)
+
+    start = time.perf_counter()
+    for _ in range(10):
+        assert len(parse_query(manager._run_query('zebra*8', session='worker'))) == 8
+    assert (time.perf_counter() - start) / 10 < 0.1
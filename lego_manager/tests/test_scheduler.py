@@ -0,0 +1,90 @@
+# type: ignore
+# pylint: skip-file
+import threading
+
+from Octavius.lego_manager.lego_manager import LegoManager
+from Octavius.lego_manager.scheduler import (
+    FifoScheduler, HoldTimeEstimator, Request, SchedulingStatistics, UtilizationScheduler,
+    WAITS_WINDOW)
+
+
+def _keys(requests):
+    return [request.key for request in requests]
+
+
+def test_utilization_runs_more_setups_in_parallel():
+    pending = [Request(['zebra.a', 'zebra.b'], 0), Request(['zebra.a'], 1), Request(['zebra.b'], 2)]
+
+    assert _keys(FifoScheduler().select(pending, {}, now=3)) == ['zebra.a and zebra.b']
+    assert _keys(UtilizationScheduler().select(pending, {}, now=3)) == ['zebra.a', 'zebra.b']
+
+
+def test_starving_request_reserves_its_components():
+    estimator = HoldTimeEstimator()
+    estimator.observe('zebra.b', 5)
+    estimator.observe('zebra.c', 50)
+    scheduler = UtilizationScheduler(estimator, max_wait=10)
+    # The large request waits for zebra.a, which is released at 20.
+    large = Request(['zebra.a', 'zebra.b', 'zebra.c'], 0)
+    busy = {'zebra.a': 20}
+
+    # Only the short request finishes before the large one can start.
+    pending = [large, Request(['zebra.b'], 5), Request(['zebra.c'], 6)]
+    grants = scheduler.select(pending, busy, now=11)
+    assert _keys(grants) == ['zebra.b']
+    # Before the large request starved, both are granted.
+    grants = scheduler.select(pending, busy, now=9)
+    assert _keys(grants) == ['zebra.b', 'zebra.c']
+
+
+def test_hold_time_estimator_learns_per_key():
+    estimator = HoldTimeEstimator(smoothing=0.5, default=60)
+    assert estimator.estimate('zebra.a') == 60
+
+    estimator.observe('zebra.a', 10)
+    estimator.observe('zebra.a', 20)
+    assert estimator.estimate('zebra.a') == 15
+    assert estimator.estimate('zebra.b') < 60
+
+
+def test_manager_statistics():
+    manager = LegoManager(scheduler='utilization')
+    released = threading.Event()
+
+    def acquire():
+        with manager.exposed_acquire_setup('zebra.alice and giraffe.bob', True):
+            pass
+        released.set()
+
+    with manager.exposed_acquire_setup('zebra.alice', True):
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        assert not released.wait(0.05)
+        statistics = manager.exposed_get_statistics()
+        assert (statistics['busy'], statistics['pending']) == (1, 1)
+
+    thread.join(1)
+    statistics = manager.exposed_get_statistics()
+    assert statistics['scheduler'] == 'utilization'
+    assert (statistics['granted'], statistics['released'], statistics['busy']) == (2, 2, 0)
+    assert 0 < statistics['utilization'] <= 1
+    assert 0 < statistics['fragmentation'] < 1
+    assert statistics['wait_p99'] >= 0.05
+
+
+def test_wait_percentiles_are_windowed():
+    statistics = SchedulingStatistics(0)
+    for index in range(WAITS_WINDOW + 100):
+        request = Request(['zebra.a'], 0)
+        # The oldest waits are much longer than the latest ones.
+        request.granted_at = 1000.0 if index < 100 else 1.0
+        statistics.granted(request)
+
+    summary = statistics.summary(1)
+    assert summary['granted'] == WAITS_WINDOW + 100
+    assert summary['wait_p99'] == 1.0
+    assert summary['wait_mean'] > 1.0
+
+
+def test_manager_max_wait():
+    assert LegoManager(scheduler='utilization', max_wait=30)._scheduler.max_wait == 30
@@ -0,0 +1,71 @@
+# type: ignore
+# pylint: skip-file
+import json
+
+from Octavius.lego_manager.lego_manager import LegoManager
+from Octavius.lego_manager.simulator import TraceEntry, load_trace, simulate, synthetic_trace
+
+
+def test_simulated_day_is_replayed_quickly():
+    trace = list(synthetic_trace(24 * 60 * 60, 0.02, {'zebra': 5, 'giraffe': 5}, seed=1))
+
+    for scheduler in ('fifo', 'utilization'):
+        statistics = simulate(trace, scheduler)
+        assert statistics['granted'] == statistics['released'] == len(trace)
+        assert statistics['simulated'] >= trace[-1].arrival
+        assert 0 < statistics['utilization'] < 1
+        assert statistics['wall_time'] < 10
+
+
+def test_overloaded_trace_is_replayed_quickly():
+    # Twice the requests the components can serve, so thousands of requests are pending.
+    trace = list(synthetic_trace(6 * 60 * 60, 0.2, {'zebra': 10, 'giraffe': 10}, seed=1))
+
+    for scheduler in ('fifo', 'utilization'):
+        statistics = simulate(trace, scheduler)
+        assert statistics['granted'] == statistics['released'] == len(trace)
+        assert statistics['wall_time'] < 10
+
+
+def test_uncontended_requests_skip_the_scheduler(monkeypatch):
+    submitted = []
+    original_submit = LegoManager._submit
+    monkeypatch.setattr(LegoManager, '_submit', lambda manager, components: (
+        submitted.append(components) or original_submit(manager, components)))
+    trace = [
+        TraceEntry(0, ('zebra.a',), 10),
+        TraceEntry(1, ('zebra.b',), 5),
+        TraceEntry(2, ('zebra.a',), 5),
+    ]
+
+    assert simulate(trace, 'fifo')['simulated'] == 15
+    assert submitted == [['zebra.a']]
+
+
+def test_simulation_follows_the_trace():
+    trace = [
+        TraceEntry(0, ('zebra.a',), 10),
+        TraceEntry(1, ('zebra.a', 'zebra.b'), 5),
+        TraceEntry(2, ('zebra.b',), 5),
+    ]
+
+    statistics = simulate(trace, 'fifo')
+    # The second request waits for zebra.a, the third one starts immediately.
+    assert statistics['simulated'] == 15
+    assert statistics['wait_mean'] == 3
+
+
+def test_recorded_trace_is_replayed(tmp_path):
+    trace_path = tmp_path / 'trace.jsonl'
+    manager = LegoManager(trace_path=str(trace_path))
+    for query in ('zebra.alice', 'zebra.alice and giraffe.bob'):
+        with manager.exposed_acquire_setup(query, exclusive=True):
+            pass
+
+    entries = [json.loads(line) for line in trace_path.read_text().splitlines()]
+    assert [entry['components'] for entry in entries] == [
+        ['zebra.alice'], ['giraffe.bob', 'zebra.alice']]
+
+    trace = load_trace(str(trace_path))
+    assert trace[0].arrival == 0
+    assert simulate(trace, 'utilization')['released'] == 2
@@ -0,0 +1,71 @@
+# type: ignore
+# pylint: skip-file
+import json
+import threading
+import time
+
+from Octavius.lego_manager.lego_manager import LegoManager
+from Octavius.lego_manager.timeline import Timeline
+
+
+def _spans(events):
+    tracks = {event['tid']: event['args']['name'] for event in events
+              if event['name'] == 'thread_name'}
+    return [(event['name'], tracks[event['tid']]) for event in events if event['ph'] == 'X']
+
+
+def test_trace_has_a_track_per_component(tmp_path):
+    timeline = Timeline('pytest main', max_events=3)
+    with timeline.span('connect', ('tests', 'zebra.alice'), path='direct') as args:
+        args['deployed'] = False
+    timeline.add('hold', 'giraffe.bob', 10, 20)
+    timeline.add('hold', 'zebra.alice', 30, 40)
+
+    # The oldest span was dropped.
+    assert _spans(timeline.events()) == [
+        ('connect', 'zebra.alice'), ('hold', 'giraffe.bob'), ('hold', 'zebra.alice')]
+    assert _spans(timeline.events(since=25)) == [
+        ('connect', 'zebra.alice'), ('hold', 'zebra.alice')]
+
+    timeline.export(str(tmp_path / 'trace.json'), [{'ph': 'X', 'name': 'other', 'pid': 1}])
+    trace = json.loads((tmp_path / 'trace.json').read_text())
+    assert trace['traceEvents'][0]['args'] == {'name': 'pytest main'}
+    assert trace['traceEvents'][-1]['name'] == 'other'
+    connect = next(event for event in trace['traceEvents'] if event['name'] == 'connect')
+    assert connect['args'] == {'path': 'direct', 'deployed': False}
+
+
+def test_recording_is_cheap():
+    timeline = Timeline('pytest main')
+    start = time.perf_counter()
+    for _ in range(10000):
+        with timeline.span('call', ('tests',), test='test_a'):
+            pass
+    assert (time.perf_counter() - start) / 10000 < 50e-6
+
+
+def test_manager_records_waits_and_holds():
+    manager = LegoManager(timeline=Timeline('lego manager'))
+    held = threading.Event()
+
+    def hold():
+        with manager.exposed_acquire_setup('zebra.alice', True):
+            held.set()
+            time.sleep(0.05)
+
+    holder = threading.Thread(target=hold, name='holder')
+    holder.start()
+    held.wait()
+    with manager.exposed_acquire_setup('zebra.alice and giraffe.bob', True):
+        pass
+    holder.join()
+
+    events = json.loads(manager.exposed_get_timeline())
+    spans = _spans(events)
+    assert ('acquire', 'holder') in spans
+    assert spans.count(('hold', 'zebra.alice')) == 2
+    assert spans.count(('wait', 'zebra.alice')) == 1
+    assert ('hold', 'giraffe.bob') in spans
+    wait = next(event for event in events if event['name'] == 'wait')
+    assert wait['dur'] >= 40000
+    assert json.loads(LegoManager().exposed_get_timeline()) == []
@@ -0,0 +1,147 @@
+"""
+Timeline of the phases of a lab session, exported as a Chrome trace.
+The lego plugin and the lego manager record spans: waiting for the manager, connecting to and
+deploying on components, holding them, and the setup, call and teardown of every test. Every
+span is on a track, which is a component or a worker (a test process, or a manager thread),
+so the exported trace shows one row per component and per worker.
+
+Recording a span is a clock read and an append to a bounded buffer, so the timeline can stay on
+in CI: a long session keeps only its latest events.
+The trace is in the Chrome trace event format, which chrome://tracing and ui.perfetto.dev open.
+Times are wall clock microseconds, so the traces of the plugin and the manager line up.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import collections
+import contextlib
+import json
+import os
+import time
+
+# Spans kept by a timeline, older spans are dropped.
+DEFAULT_MAX_EVENTS = 1000000
+
+# A recorded span: name, track, start and end in microseconds, and arguments.
+_Span = Tuple[str, str, int, int, Optional[Dict[str, Any]]]
+
+
+def now() -> int:
+    """Gets the current time of the timelines, in microseconds."""
+
+    return time.time_ns() // 1000
+
+
+class Timeline:
+    """Bounded recorder of the spans of a process.
+
+    Attributes:
+        process: The name of the process in the trace, e.g. 'lego manager'.
+        pid: The id of the process in the trace.
+    """
+
+    process: str
+    pid: int
+
+    def __init__(
+            self,
+            process: str,
+            max_events: int = DEFAULT_MAX_EVENTS,
+            pid: Optional[int] = None
+    ) -> None:
+        """Initiates an empty timeline.
+
+        Args:
+            process: The name of the process in the trace.
+            max_events (optional): Spans kept, older spans are dropped.
+                                   Defaults to DEFAULT_MAX_EVENTS.
+            pid (optional): The id of the process in the trace. Defaults to the current one.
+        """
+
+        self.process = process
+        self.pid = os.getpid() if pid is None else pid
+        # Appending to a deque is thread safe, so recording doesn't take a lock.
+        self._spans: collections.deque = collections.deque(maxlen=max_events)
+
+    def add(
+            self,
+            name: str,
+            track: str,
+            start: int,
+            end: int,
+            args: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Records a span which already ended.
+
+        Args:
+            name: The phase, e.g. 'connect'.
+            track: The component or worker the span belongs to.
+            start: Start time, in microseconds (see now()).
+            end: End time, in microseconds.
+            args (optional): Details shown with the span, e.g. the test id. Defaults to None.
+        """
+
+        self._spans.append((name, track, start, end, args))
+
+    @contextlib.contextmanager
+    def span(self, name: str, tracks: Iterable[str], **args: Any) -> Iterator[Dict[str, Any]]:
+        """Records a span around a block, on several tracks.
+
+        Args:
+            name: The phase, e.g. 'connect'.
+            tracks: The components and workers the span belongs to.
+            args: Details shown with the span.
+
+        Yields:
+            The arguments of the span, which the block can add details to.
+        """
+
+        start = now()
+        try:
+            yield args
+        finally:
+            end = now()
+            for track in tracks:
+                self._spans.append((name, track, start, end, args or None))
+
+    def events(self, since: int = 0) -> List[Dict[str, Any]]:
+        """Converts the spans to trace events.
+
+        Args:
+            since (optional): Only spans which ended since this time are converted, in
+                              microseconds. Defaults to all of the spans.
+
+        Returns:
+            Complete events of the spans, and metadata events which name the process and the
+            tracks. Tracks are ordered by their names.
+        """
+
+        spans = [span for span in list(self._spans) if span[3] >= since]
+        tids = {track: tid for tid, track in enumerate(sorted({span[1] for span in spans}), 1)}
+
+        events = [{'ph': 'M', 'name': 'process_name', 'pid': self.pid,
+                   'args': {'name': self.process}}]
+        for track, tid in tids.items():
+            events.append({'ph': 'M', 'name': 'thread_name', 'pid': self.pid, 'tid': tid,
+                           'args': {'name': track}})
+            events.append({'ph': 'M', 'name': 'thread_sort_index', 'pid': self.pid, 'tid': tid,
+                           'args': {'sort_index': tid}})
+        for name, track, start, end, args in spans:
+            event = {'ph': 'X', 'name': name, 'pid': self.pid, 'tid': tids[track],
+                     'ts': start, 'dur': end - start}
+            if args:
+                event['args'] = args
+            events.append(event)
+
+        return events
+
+    def export(self, path: str, other_events: Iterable[Dict[str, Any]] = ()) -> None:
+        """Writes the timeline as a Chrome trace.
+
+        Args:
+            path: The trace file.
+            other_events (optional): Events of other processes to merge into the trace, e.g.
+                                     of the lego manager. Defaults to none.
+        """
+
+        trace = {'traceEvents': self.events() + list(other_events), 'displayTimeUnit': 'ms'}
+        with open(path, 'w', encoding='utf-8') as trace_file:
+            json.dump(trace, trace_file, default=str)